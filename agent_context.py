@@ -0,0 +1,291 @@
+"""
+Compactação do contexto da conversa enviado ao Cortex Agent.
+
+`st.session_state.agent_messages` acumulava todos os turnos da conversa e era
+enviado inteiro a cada pergunta: conversas longas mandavam contextos cada vez
+maiores ao agent, com mais latência e custo por turno. Aqui, no início de cada
+turno, o contexto é compactado no próprio `agent_messages`:
+
+- os últimos K turnos ficam com o texto original;
+- os turnos mais antigos viram um resumo acumulado, mantido na sessão e
+  atualizado de forma incremental (só os turnos que saem da janela são
+  resumidos, uma linha por turno);
+- tabelas, blocos de código/SQL e conteúdos que não são texto são removidos;
+- o total estimado de tokens respeita um orçamento.
+
+O tamanho do contexto antes e depois de cada compactação fica registrado na
+sessão e no span de rastreamento do turno.
+"""
+
+import copy
+import os
+import re
+import time
+
+import streamlit as st
+
+from tracing import span
+
+
+AGENT_CONTEXT_COMPACTION = os.getenv("ANALY_AGENT_CONTEXT_COMPACTION", "1") == "1"
+
+# Turnos (pergunta + resposta) mantidos com o texto original
+AGENT_CONTEXT_KEEP_TURNS = int(os.getenv("ANALY_AGENT_CONTEXT_KEEP_TURNS", "3"))
+
+# Orçamento estimado de tokens do contexto enviado ao agent
+AGENT_CONTEXT_TOKEN_BUDGET = int(os.getenv("ANALY_AGENT_CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Estimativa de caracteres por token (sem depender de um tokenizador)
+CHARS_PER_TOKEN = 4
+
+# Tamanho máximo da pergunta e da resposta em cada linha do resumo
+SUMMARY_QUESTION_MAX_CHARS = 160
+SUMMARY_ANSWER_MAX_CHARS = 240
+
+# Quantidade de medições de compactação mantidas por sessão
+CONTEXT_METRICS_KEEP = 50
+
+SUMMARY_HEADER = "Resumo das perguntas anteriores desta conversa (tabelas e SQL omitidos):"
+SUMMARY_ACK = "Entendido, vou considerar esse contexto."
+
+_CODE_BLOCK_RE = re.compile(r"```(\w*)[^\n]*\n.*?(?:```|$)", re.DOTALL)
+_TABLE_RE = re.compile(r"(?:^[ \t]*\|.*\|[ \t]*(?:\n|$))+", re.MULTILINE)
+_SQL_RE = re.compile(r"\bSELECT\s.*?\bFROM\b.*?(?:;|\n[ \t]*\n|$)", re.DOTALL)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_MARKER_RE = re.compile(r"\[(?:SQL|código|tabela) omitid[oa]\]")
+
+
+# ----------------------------------------------------------------------
+# Conteúdo das mensagens
+# ----------------------------------------------------------------------
+
+def strip_bulky_text(text):
+    """Troca tabelas markdown, blocos de código e consultas SQL por marcadores curtos"""
+    def code_block(match):
+        return "[SQL omitido]" if match.group(1).lower() == "sql" else "[código omitido]"
+
+    text = _CODE_BLOCK_RE.sub(code_block, text)
+    text = _TABLE_RE.sub("[tabela omitida]\n", text)
+    text = _SQL_RE.sub("[SQL omitido]", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def message_text(message):
+    """Texto de uma mensagem do agent (itens `text` do conteúdo)"""
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    return "\n".join(
+        item.get("text", "") for item in content
+        if isinstance(item, dict) and item.get("type") == "text"
+    )
+
+
+def clean_message(message):
+    """
+    Mensagem apenas com texto, sem tabelas/SQL. Itens que não são texto
+    (resultados de ferramentas, tabelas, gráficos) são descartados.
+    """
+    text = strip_bulky_text(message_text(message))
+    if not text:
+        text = "[resultado omitido]"
+    return {"role": message.get("role", "user"), "content": [{"type": "text", "text": text}]}
+
+
+def _content_chars(message):
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return len(content)
+    return sum(
+        len(item.get("text", "")) if isinstance(item, dict) and item.get("type") == "text" else len(str(item))
+        for item in content
+    )
+
+
+def estimate_tokens(messages):
+    """Tokens estimados do contexto, incluindo conteúdos que não são texto"""
+    return sum(_content_chars(m) for m in messages) // CHARS_PER_TOKEN + 4 * len(messages)
+
+
+def _shorten(text, max_chars):
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+
+def split_turns(messages):
+    """Agrupa as mensagens em turnos; cada turno começa numa mensagem do usuário"""
+    turns = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def summarize_turn(turn):
+    """Linha do resumo para um turno: pergunta e início da resposta"""
+    question = " ".join(message_text(m) for m in turn if m.get("role") == "user")
+    answer = " ".join(
+        _MARKER_RE.sub(" ", strip_bulky_text(message_text(m))) for m in turn if m.get("role") != "user"
+    )
+    line = f"- {_shorten(question, SUMMARY_QUESTION_MAX_CHARS)}"
+    if answer.strip():
+        line += f" → {_shorten(answer, SUMMARY_ANSWER_MAX_CHARS)}"
+    return line
+
+
+# ----------------------------------------------------------------------
+# Compactação
+# ----------------------------------------------------------------------
+
+class ContextSummary:
+    """Resumo acumulado dos turnos que saíram da janela, atualizado incrementalmente"""
+
+    def __init__(self):
+        self.lines = []
+        self.folded_turns = 0
+        self.dropped_lines = 0
+
+    def fold(self, turn):
+        self.lines.append(summarize_turn(turn))
+        self.folded_turns += 1
+
+    def drop_oldest(self):
+        self.lines.pop(0)
+        self.dropped_lines += 1
+
+    def messages(self):
+        """Par de mensagens (usuário/assistente) que representa o resumo no contexto"""
+        if not self.lines:
+            return []
+        text = "\n".join([SUMMARY_HEADER, *self.lines])
+        if self.dropped_lines:
+            text += f"\n(+ {self.dropped_lines} perguntas mais antigas omitidas)"
+        return [
+            {"role": "user", "content": [{"type": "text", "text": text}]},
+            {"role": "assistant", "content": [{"type": "text", "text": SUMMARY_ACK}]},
+        ]
+
+
+def _without_summary(messages, summary):
+    """Remove o par de resumo do início; se não estiver lá, o resumo está obsoleto"""
+    current = summary.messages()
+    if current and messages[:len(current)] == current:
+        return messages[len(current):], summary
+    # Nova conversa ou histórico carregado: o resumo anterior não vale mais
+    return messages, ContextSummary()
+
+
+def compact_messages(messages, summary=None, keep_turns=AGENT_CONTEXT_KEEP_TURNS,
+                     token_budget=AGENT_CONTEXT_TOKEN_BUDGET):
+    """
+    Compacta o contexto e retorna `(mensagens, resumo)`.
+
+    Só os turnos que saem da janela desde a última compactação são resumidos;
+    as linhas já existentes do resumo são reaproveitadas.
+    """
+    messages, summary = _without_summary(list(messages), summary or ContextSummary())
+    turns = split_turns(messages)
+    keep_turns = max(1, keep_turns)
+
+    while len(turns) > keep_turns:
+        summary.fold(turns.pop(0))
+    kept = [[clean_message(m) for m in turn] for turn in turns]
+
+    def build():
+        return summary.messages() + [m for turn in kept for m in turn]
+
+    # Orçamento: resume mais turnos, depois descarta as linhas mais antigas do resumo
+    result = build()
+    while estimate_tokens(result) > token_budget and len(kept) > 1:
+        summary.fold(turns.pop(0))
+        kept.pop(0)
+        result = build()
+    while estimate_tokens(result) > token_budget and len(summary.lines) > 1:
+        summary.drop_oldest()
+        result = build()
+
+    # Último recurso: encurta os textos do turno mais recente
+    excess_chars = (estimate_tokens(result) - token_budget) * CHARS_PER_TOKEN
+    if excess_chars > 0 and kept:
+        for message in kept[-1]:
+            text = message["content"][0]["text"]
+            cut = min(excess_chars, max(len(text) - 200, 0))
+            if cut > 0:
+                message["content"][0]["text"] = text[:len(text) - cut].rstrip() + "…"
+                excess_chars -= cut
+        result = build()
+    return result, summary
+
+
+def text_message(role, text):
+    """Mensagem de texto no formato de `agent_messages`"""
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+
+def agent_history_mark():
+    """Posição atual de `agent_messages`, para recuperar depois o que um turno acrescentou"""
+    return len(st.session_state.get("agent_messages") or [])
+
+
+def agent_turn_since(mark):
+    """Mensagens acrescentadas a `agent_messages` desde `agent_history_mark()`"""
+    return copy.deepcopy((st.session_state.get("agent_messages") or [])[mark:])
+
+
+def append_agent_turn(user_text, messages):
+    """
+    Acrescenta a `agent_messages` as mensagens de um turno, com a pergunta
+    registrada uma única vez (pelo app antes do processamento ou no turno).
+    """
+    history = st.session_state.setdefault("agent_messages", [])
+    messages = copy.deepcopy(list(messages))
+    asked = bool(history) and history[-1].get("role") == "user"
+    if messages and messages[0].get("role") == "user":
+        if asked:
+            messages = messages[1:]
+    elif not asked:
+        messages.insert(0, text_message("user", user_text))
+    history.extend(messages)
+
+
+def compact_agent_context():
+    """Compacta `st.session_state.agent_messages` antes de uma nova pergunta"""
+    if not AGENT_CONTEXT_COMPACTION:
+        return
+    messages = st.session_state.get("agent_messages") or []
+    if not messages:
+        return
+
+    with span("context.compact") as compact_span:
+        start = time.perf_counter()
+        tokens_before = estimate_tokens(messages)
+        compacted, summary = compact_messages(messages, st.session_state.get("agent_context_summary"))
+        st.session_state.agent_messages = compacted
+        st.session_state["agent_context_summary"] = summary
+        tokens_after = estimate_tokens(compacted)
+        if compact_span is not None:
+            compact_span.set_attribute("tokens_before", tokens_before)
+            compact_span.set_attribute("tokens_after", tokens_after)
+            compact_span.set_attribute("messages_before", len(messages))
+            compact_span.set_attribute("messages_after", len(compacted))
+            compact_span.set_attribute("folded_turns", summary.folded_turns)
+        record_context_size(
+            tokens_before, tokens_after, len(messages), len(compacted),
+            summary.folded_turns, (time.perf_counter() - start) * 1000
+        )
+
+
+def record_context_size(tokens_before, tokens_after, messages_before, messages_after, folded_turns, elapsed_ms):
+    """Registra o tamanho do contexto antes e depois da compactação"""
+    metrics = st.session_state.setdefault("agent_context_metrics", [])
+    metrics.append({
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "messages_before": messages_before,
+        "messages_after": messages_after,
+        "folded_turns": folded_turns,
+        "elapsed_ms": elapsed_ms,
+        "timestamp": time.time(),
+    })
+    del metrics[:-CONTEXT_METRICS_KEEP]
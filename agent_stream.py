@@ -0,0 +1,283 @@
+"""
+Exibição incremental (streaming) das respostas do Cortex Agent.
+
+No modo padrão o `main()` fica bloqueado num spinner até o agent e o
+processamento da resposta terminarem. No modo streaming os eventos SSE são
+consumidos à medida que chegam: o texto é escrito token a token, o
+raciocínio (thinking) aparece progressivamente e SQL, tabelas e gráficos são
+exibidos assim que cada um fica pronto, na ordem em que chegam, entre os
+trechos de texto. O tempo até o primeiro token é registrado na sessão e no
+span de rastreamento da chamada.
+
+O que foi consumido do stream é gravado e devolvido a
+`process_agent_response` com o mesmo tipo da resposta original (uma resposta
+HTTP com `iter_lines`/`text`/`json`, ou um iterador de eventos).
+"""
+
+import json
+import os
+import time
+
+import pandas as pd
+import streamlit as st
+
+from backend_service import call_cortex_agent
+from startup import get_static_asset
+from tracing import span
+
+
+# Habilita o modo streaming
+AGENT_STREAMING_ENABLED = os.getenv("ANALY_AGENT_STREAMING", "0") == "1"
+
+# Quantidade de medições de tempo até o primeiro token mantidas por sessão
+TTFT_KEEP = 50
+
+
+def _parse_sse_lines(lines):
+    """Converte linhas de um stream SSE em eventos {"event", "data"}"""
+    event_name, data_lines = None, []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+        if not line:
+            if data_lines:
+                yield _build_event(event_name, "\n".join(data_lines))
+            event_name, data_lines = None, []
+        elif line.startswith("event:"):
+            event_name = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+    if data_lines:
+        yield _build_event(event_name, "\n".join(data_lines))
+
+
+def _build_event(event_name, raw_data):
+    try:
+        data = json.loads(raw_data)
+    except ValueError:
+        data = raw_data
+    return {"event": event_name, "data": data}
+
+
+def _recorded(items, sink):
+    """Repassa os itens gravando cada um em `sink`"""
+    for item in items:
+        sink.append(item)
+        yield item
+
+
+def iter_agent_events(response, sink=None):
+    """
+    Itera sobre os eventos de uma resposta do agent, sem esperar o fim do stream.
+
+    Aceita uma resposta HTTP em streaming (`iter_lines`), o texto SSE bruto ou
+    uma lista/gerador de eventos já decodificados. Com `sink`, as linhas (ou
+    itens) lidos do stream são gravados nele, para `replay_response`.
+    """
+    if response is None:
+        return
+    if hasattr(response, "iter_lines"):
+        lines = response.iter_lines(decode_unicode=True)
+        yield from _parse_sse_lines(_recorded(lines, sink) if sink is not None else lines)
+    elif isinstance(response, (str, bytes)):
+        text = response.decode("utf-8") if isinstance(response, bytes) else response
+        yield from _parse_sse_lines(text.splitlines())
+    else:
+        items = _recorded(response, sink) if sink is not None and not isinstance(response, (list, tuple)) else response
+        for event in items:
+            if isinstance(event, dict) and "data" in event:
+                yield event
+            else:
+                yield {"event": None, "data": event}
+
+
+class RecordedResponse:
+    """
+    Resposta HTTP já consumida pelo streaming, reexposta com a mesma interface
+    (`iter_lines`, `text`, `content`, `json`) a partir das linhas gravadas.
+    """
+
+    def __init__(self, response, lines):
+        self._response = response
+        self._lines = [line.decode("utf-8") if isinstance(line, bytes) else line for line in lines]
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False, delimiter=None):
+        for line in self._lines:
+            yield line if decode_unicode else line.encode("utf-8")
+
+    def iter_content(self, chunk_size=None, decode_unicode=False):
+        yield self.text if decode_unicode else self.content
+
+    @property
+    def text(self):
+        return "\n".join(self._lines)
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+    def __iter__(self):
+        return self.iter_content()
+
+    def __getattr__(self, name):
+        # status_code, headers, etc. continuam vindo da resposta original
+        return getattr(self._response, name)
+
+
+def replay_response(response, consumed):
+    """
+    Resposta equivalente à original para `process_agent_response`, depois que o
+    streaming consumiu o stream: respostas HTTP viram `RecordedResponse`,
+    iteradores de uso único viram um iterador sobre os itens gravados e
+    respostas que podem ser lidas de novo (texto, listas, dicionários) são
+    devolvidas intactas.
+    """
+    if hasattr(response, "iter_lines"):
+        return RecordedResponse(response, consumed)
+    if response is None or isinstance(response, (str, bytes, list, tuple, dict)):
+        return response
+    return iter(consumed)
+
+
+def classify_event(event):
+    """
+    Normaliza um evento para (tipo, conteúdo).
+
+    Tipos: "text", "thinking", "sql", "table", "chart" ou None (ignorado).
+    Cobre os eventos `response.*` da API atual do Cortex Agents e os
+    `message.delta` da versão anterior.
+    """
+    name, data = event.get("event") or "", event.get("data")
+    if not isinstance(data, dict):
+        return None, None
+
+    if name == "response.text.delta":
+        return "text", data.get("text", "")
+    if name == "response.thinking.delta":
+        return "thinking", data.get("text", "")
+    if name == "response.chart":
+        return "chart", data.get("chart_spec")
+    if name == "response.table":
+        return "table", data.get("result_set")
+    if name == "response.tool_result":
+        for item in data.get("content", []):
+            sql = (item.get("json") or {}).get("sql") if isinstance(item, dict) else None
+            if sql:
+                return "sql", sql
+        return None, None
+
+    if name == "message.delta" or "delta" in data:
+        for item in data.get("delta", {}).get("content", []):
+            if item.get("type") == "text":
+                return "text", item.get("text", "")
+            if item.get("type") == "tool_results":
+                for result in item.get("tool_results", {}).get("content", []):
+                    sql = (result.get("json") or {}).get("sql")
+                    if sql:
+                        return "sql", sql
+    return None, None
+
+
+def _result_set_to_df(result_set):
+    if not isinstance(result_set, dict):
+        return pd.DataFrame(result_set)
+    columns = [c.get("name") for c in result_set.get("resultSetMetaData", {}).get("rowType", [])]
+    return pd.DataFrame(result_set.get("data", []), columns=columns or None)
+
+
+class AgentStreamRenderer:
+    """
+    Consome os eventos do agent exibindo cada parte assim que fica pronta.
+
+    Texto, SQL, tabelas e gráficos são escritos num único container, na ordem
+    em que chegam: cada elemento fecha o trecho de texto atual e o texto que
+    vier depois dele abre um novo trecho abaixo.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.consumed = []
+        self.first_token_ms = None
+        self._start = None
+        self._thinking = []
+        self._thinking_placeholder = None
+        self._text = []
+        self._text_placeholder = None
+
+    def _consume(self, events):
+        for event in events:
+            self.events.append(event)
+            kind, content = classify_event(event)
+            if kind == "text" and content:
+                if self.first_token_ms is None:
+                    self.first_token_ms = (time.perf_counter() - self._start) * 1000
+                self._write_text(content)
+            elif kind == "thinking" and content:
+                self._thinking.append(content)
+                self._thinking_placeholder.caption("".join(self._thinking))
+            elif kind in ("sql", "table", "chart") and content:
+                self._text_placeholder = None
+                self._render_element(kind, content)
+
+    def _write_text(self, content):
+        if self._text_placeholder is None:
+            self._text_placeholder = st.empty()
+            self._text = []
+        self._text.append(content)
+        self._text_placeholder.markdown("".join(self._text))
+
+    def _render_element(self, kind, content):
+        if kind == "sql":
+            with st.expander("🧾 SQL", expanded=False):
+                st.code(content, language="sql")
+        elif kind == "table":
+            st.dataframe(_result_set_to_df(content), use_container_width=True, height=300)
+        elif kind == "chart":
+            try:
+                spec = json.loads(content) if isinstance(content, str) else content
+                st.vega_lite_chart(spec, use_container_width=True)
+            except Exception as e:
+                st.error(f"Erro ao renderizar gráfico: {str(e)}")
+
+    def render(self, response, start=None):
+        """Exibe a resposta incrementalmente e devolve os eventos consumidos"""
+        self._start = start or time.perf_counter()
+        with st.chat_message("assistant", avatar=get_static_asset("analy_temp.png")):
+            with st.expander("🧠 Raciocínio", expanded=False):
+                self._thinking_placeholder = st.empty()
+            with st.container():
+                self._consume(iter_agent_events(response, sink=self.consumed))
+        return self.events
+
+
+def stream_cortex_agent(user_input):
+    """
+    Chama o agent no modo streaming e devolve a resposta para `process_agent_response`.
+
+    A resposta devolvida tem o mesmo tipo da que veio do agent (ver
+    `replay_response`), com o conteúdo já consumido pelo streaming.
+    """
+    with span("agent.stream") as stream_span:
+        start = time.perf_counter()
+        response = call_cortex_agent(user_input)
+
+        renderer = AgentStreamRenderer()
+        renderer.render(response, start=start)
+        total_ms = (time.perf_counter() - start) * 1000
+        record_time_to_first_token(renderer.first_token_ms, total_ms)
+        if stream_span is not None:
+            stream_span.set_attribute("first_token_ms", renderer.first_token_ms)
+            stream_span.set_attribute("events", len(renderer.events))
+
+    return replay_response(response, renderer.consumed)
+
+
+def record_time_to_first_token(first_token_ms, total_ms):
+    """Registra o tempo até o primeiro token e o tempo total do agent na sessão"""
+    timings = st.session_state.setdefault("ttft_timings", [])
+    timings.append({"first_token_ms": first_token_ms, "total_ms": total_ms, "timestamp": time.time()})
+    del timings[:-TTFT_KEEP]
@@ -0,0 +1,288 @@
+"""
+Cache de respostas do Cortex Agent.
+
+Os usuários repetem as mesmas perguntas ("faturamento do mês", maiores
+clientes...) várias vezes ao dia, e cada uma custava a latência do agent mais o
+processamento no warehouse. Este cache, compartilhado entre as sessões, guarda
+a resposta já processada (texto, SQL, dados e gráficos) indexada pela pergunta
+normalizada e pelo contexto da conversa, com expiração alinhada à próxima
+carga dos dados. Opcionalmente, perguntas parecidas são casadas por
+similaridade de embeddings.
+
+Junto com a resposta fica o que a chamada ao agent acrescentou a
+`agent_messages` naquele turno; num acerto, essas mesmas mensagens são
+acrescentadas ao contexto da conversa, como se o agent tivesse sido chamado.
+
+As respostas ficam no escopo do usuário que perguntou: o resultado do agent
+depende das permissões de quem consulta. Só as perguntas listadas em
+`ANALY_ANSWER_CACHE_SHARED` são compartilhadas entre usuários. O cache tem
+limite de memória, além do limite de entradas.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from backend_service import call_cortex_agent, process_agent_response
+from agent_context import agent_history_mark, agent_turn_since, append_agent_turn, text_message
+from agent_stream import stream_cortex_agent
+from connection_pool import call_with_session
+from shared_cache import TTLCache
+from tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+# Habilita/desabilita o cache
+ANSWER_CACHE_ENABLED = os.getenv("ANALY_ANSWER_CACHE_ENABLED", "1") == "1"
+
+# TTL máximo de uma resposta (em segundos)
+ANSWER_CACHE_MAX_TTL = int(os.getenv("ANALY_ANSWER_CACHE_MAX_TTL", "21600"))
+
+# Horários de carga dos dados (HH:MM, separados por vírgula); respostas expiram na próxima carga
+ANSWER_CACHE_REFRESH_TIMES = os.getenv("ANALY_DATA_REFRESH_TIMES", "06:00")
+
+# Limiar de similaridade de cosseno para reaproveitar respostas (0 desabilita)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANALY_ANSWER_CACHE_SIMILARITY", "0"))
+
+# Modelo de embedding usado quando a similaridade está habilitada
+ANSWER_CACHE_EMBED_MODEL = os.getenv("ANALY_ANSWER_CACHE_EMBED_MODEL", "snowflake-arctic-embed-m-v1.5")
+
+# Perguntas (separadas por ";") cujas respostas podem ser compartilhadas entre usuários;
+# todas as demais ficam no escopo do usuário
+ANSWER_CACHE_SHARED = os.getenv("ANALY_ANSWER_CACHE_SHARED", "")
+
+# Limite de memória do cache e de cada resposta guardada (em MB)
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANALY_ANSWER_CACHE_MAX_MB", "200"))
+ANSWER_CACHE_MAX_ENTRY_MB = float(os.getenv("ANALY_ANSWER_CACHE_MAX_ENTRY_MB", "5"))
+
+# Tipos de resposta que podem ser reaproveitados
+CACHEABLE_RESPONSE_TYPES = (
+    "text_only", "empty_data", "single_row", "multiple_rows", "sql_success", "data_only"
+)
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_question(text):
+    """Normaliza a pergunta: minúsculas, sem acentos, sem pontuação e espaços únicos"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCT_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def context_fingerprint(agent_messages):
+    """Impressão digital do contexto da conversa que antecede a pergunta"""
+    if not agent_messages:
+        return ""
+    digest = hashlib.sha1()
+    for message in agent_messages:
+        digest.update(message.get("role", "").encode("utf-8"))
+        for item in message.get("content", []):
+            if isinstance(item, dict) and item.get("type") == "text":
+                digest.update(normalize_question(item.get("text", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+SHARED_QUESTIONS = frozenset(
+    normalize_question(question) for question in ANSWER_CACHE_SHARED.split(";") if question.strip()
+)
+
+
+def resolve_scope(normalized_question, username):
+    """Escopo da resposta: o usuário, ou "global" para as perguntas da lista de compartilhadas"""
+    if normalized_question in SHARED_QUESTIONS:
+        return "global"
+    return username
+
+
+def seconds_until_next_refresh(now=None):
+    """Segundos até o próximo horário de carga, limitado pelo TTL máximo"""
+    now = now or datetime.now()
+    candidates = []
+    for item in ANSWER_CACHE_REFRESH_TIMES.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        hour, minute = (int(part) for part in item.split(":"))
+        refresh = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if refresh <= now:
+            refresh += timedelta(days=1)
+        candidates.append((refresh - now).total_seconds())
+    if not candidates:
+        return ANSWER_CACHE_MAX_TTL
+    return max(1, min(min(candidates), ANSWER_CACHE_MAX_TTL))
+
+
+def cortex_embed(session, text):
+    """Calcula o embedding da pergunta com o Cortex"""
+    row = session.sql(
+        f"SELECT SNOWFLAKE.CORTEX.EMBED_TEXT_768('{ANSWER_CACHE_EMBED_MODEL}', ?) AS EMB",
+        params=[text]
+    ).collect()[0]
+    return list(row["EMB"])
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """Cache de respostas processadas, compartilhado entre sessões"""
+
+    def __init__(self, max_entries=500, similarity_threshold=ANSWER_CACHE_SIMILARITY, embed_fn=cortex_embed,
+                 max_bytes=ANSWER_CACHE_MAX_MB * 1024 * 1024,
+                 max_entry_bytes=ANSWER_CACHE_MAX_ENTRY_MB * 1024 * 1024):
+        self._cache = TTLCache(
+            max_entries=max_entries, default_ttl=ANSWER_CACHE_MAX_TTL,
+            max_bytes=max_bytes, max_entry_bytes=max_entry_bytes
+        )
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self._embeddings = TTLCache(max_entries=max_entries * 2, default_ttl=ANSWER_CACHE_MAX_TTL)
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "skipped": 0}
+
+    def _key(self, scope, context, normalized):
+        return (scope, context, normalized)
+
+    def _embed(self, session, normalized):
+        if self.similarity_threshold <= 0 or session is None:
+            return None
+        embedding = self._embeddings.get(normalized)
+        if embedding is None:
+            try:
+                embedding = self.embed_fn(session, normalized)
+            except Exception:
+                logger.exception("Erro ao calcular embedding da pergunta")
+                return None
+            self._embeddings.set(normalized, embedding)
+        return embedding
+
+    def lookup(self, session, username, question, agent_messages):
+        """Retorna `(resposta processada, mensagens do turno no contexto do agent)` em cache ou None"""
+        normalized = normalize_question(question)
+        scope = resolve_scope(normalized, username)
+        context = context_fingerprint(agent_messages)
+
+        entry = self._cache.get(self._key(scope, context, normalized))
+        if entry is not None:
+            self._inc("exact_hits")
+            return dict(entry["response"]), entry["agent_turn"]
+
+        embedding = self._embed(session, normalized)
+        if embedding is not None:
+            best, best_score = None, self.similarity_threshold
+            for (entry_scope, entry_context, _), candidate in self._cache.items():
+                if entry_scope != scope or entry_context != context or candidate["embedding"] is None:
+                    continue
+                score = _cosine(embedding, candidate["embedding"])
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is not None:
+                self._inc("similar_hits")
+                return dict(best["response"]), best["agent_turn"]
+
+        self._inc("misses")
+        return None
+
+    def store(self, session, username, question, agent_messages, processed_response, agent_turn):
+        """Guarda uma resposta bem-sucedida e as mensagens que ela acrescentou ao contexto do agent"""
+        if processed_response.get("response_type") not in CACHEABLE_RESPONSE_TYPES:
+            self._inc("skipped")
+            return
+
+        normalized = normalize_question(question)
+        scope = resolve_scope(normalized, username)
+        context = context_fingerprint(agent_messages)
+        stored = self._cache.set(
+            self._key(scope, context, normalized),
+            {
+                "response": processed_response,
+                "embedding": self._embed(session, normalized),
+                "agent_turn": list(agent_turn),
+            },
+            ttl=seconds_until_next_refresh()
+        )
+        # Respostas acima do limite por entrada não são guardadas
+        self._inc("stores" if stored else "skipped")
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        total = hits + stats["misses"]
+        stats["entries"] = len(self._cache)
+        stats["bytes"] = self._cache.total_bytes()
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def _inc(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+_answer_cache = AnswerCache()
+
+
+def get_answer_cache():
+    """Retorna o cache de respostas do processo"""
+    return _answer_cache
+
+
+def answer_with_agent(session, username, user_input, stream=False):
+    """
+    Responde a pergunta via Cortex Agent, passando antes pelo cache.
+
+    Com `stream=True` a resposta do agent é exibida incrementalmente enquanto
+    chega (ver `agent_stream`).
+
+    Em caso de acerto, as mensagens que a chamada original acrescentou ao
+    contexto do agent (`agent_messages`) são acrescentadas de novo, para que
+    as perguntas seguintes da conversa mantenham o contexto.
+    """
+    with span("answer_with_agent", stream=stream):
+        return _answer_with_agent(session, username, user_input, stream)
+
+
+def _answer_with_agent(session, username, user_input, stream):
+    cache = get_answer_cache()
+    agent_messages = list(st.session_state.get("agent_messages", []))
+
+    if ANSWER_CACHE_ENABLED:
+        with span("answer_cache.lookup") as lookup_span:
+            cached = cache.lookup(session, username, user_input, agent_messages)
+            if lookup_span is not None:
+                lookup_span.set_attribute("hit", cached is not None)
+        if cached is not None:
+            response, agent_turn = cached
+            append_agent_turn(user_input, agent_turn)
+            return response
+
+    mark = agent_history_mark()
+    with span("agent.call", stream=stream):
+        response = stream_cortex_agent(user_input) if stream else call_cortex_agent(user_input)
+    # Inclui a execução do SQL gerado pelo agent (spans "sql" aninhados)
+    with span("agent.process_response"):
+        processed_response = call_with_session(session, process_agent_response, user_input, response)
+
+    if ANSWER_CACHE_ENABLED and processed_response:
+        agent_turn = agent_turn_since(mark)
+        if not any(message.get("role") == "assistant" for message in agent_turn):
+            # Backend que não registra o turno em `agent_messages`: guarda pergunta e resposta em texto
+            agent_turn = [text_message("user", user_input), text_message("assistant", processed_response.get("text") or "")]
+        cache.store(session, username, user_input, agent_messages, processed_response, agent_turn)
+    return processed_response
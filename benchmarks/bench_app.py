@@ -0,0 +1,281 @@
+"""
+Benchmark offline do app com backend Snowflake/Cortex simulado.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/bench_app.py --users 8 --turns 5 --rows 2000 \
+        --agent-latency-ms 800 --sql-latency-ms 50 --json resultados.json
+
+Executa `streamlit_app.py` com o `AppTest` do Streamlit para N usuários
+simultâneos, cada um com sua sessão, usando `benchmarks/fake_backend` no
+lugar de `backend_service`/`frontend_ui`: respostas do agent reproduzidas de
+`benchmarks/recordings`, resultados sintéticos do tamanho pedido, latência
+injetada e sessões locais (SQLite) no pool de conexões.
+
+O `AppTest` altera estado global do Streamlit a cada execução e não pode
+rodar em threads paralelas; os usuários são distribuídos entre
+`--processes` processos (um por usuário, por padrão), que executam ao mesmo
+tempo. Usuários do mesmo processo rodam em sequência e compartilham os caches
+do processo, como num pod. Mede:
+
+- tempo de cada turno (pergunta -> resposta renderizada);
+- tempo de um rerun ocioso depois de cada turno (custo do loop de
+  renderização com o histórico acumulado);
+- memória por sessão (resultados + cache de renderização) e crescimento do
+  RSS do processo por usuário;
+- vazão em turnos por segundo.
+
+Com `--baseline` compara com um resultado anterior (gerado com `--json`) e
+termina com código 1 se alguma métrica piorar mais que `--max-regression`.
+"""
+
+import argparse
+import base64
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "streamlit_app.py")
+
+# Imagens referenciadas pelo app por caminho relativo (não versionadas)
+APP_ASSETS = ("analy_temp.png",)
+
+# PNG 1x1 usado no lugar dos assets ausentes
+_PLACEHOLDER_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+QUESTIONS = [
+    "Qual o faturamento por regional no último mês?",
+    "Evolução diária de contratos",
+    "Liste os clientes inadimplentes",
+    "Resumo da carteira com tabela e gráfico",
+    "O que significa inadimplência?",
+]
+
+
+def configure_environment(args):
+    """Prepara o processo: variáveis lidas na importação dos módulos, assets e `sys.path`"""
+    os.environ["ANALY_BACKEND"] = "local"
+    os.environ["ANALY_BENCH_ROWS"] = str(args.rows)
+    os.environ["ANALY_BENCH_AGENT_LATENCY_MS"] = str(args.agent_latency_ms)
+    os.environ["ANALY_BENCH_SQL_LATENCY_MS"] = str(args.sql_latency_ms)
+    if args.recordings:
+        os.environ["ANALY_BENCH_RECORDINGS"] = os.path.abspath(args.recordings)
+    # O índice de sessões do navegador de histórico é mantido com MERGE, que o SQLite não tem
+    os.environ.setdefault("ANALY_HISTORY_BROWSER", "0")
+    os.environ.setdefault("ANALY_ANSWER_CACHE_ENABLED", "0" if args.no_answer_cache else "1")
+    os.environ.setdefault("ANALY_TRACE_FILE", "")
+    os.environ.setdefault("ANALY_LOG_SPILL_FILE", os.path.join(BENCH_DIR, ".bench_log_spill.jsonl"))
+    # Um único banco SQLite para todas as sessões locais (a tabela de logs é compartilhada)
+    os.environ.setdefault("ANALY_LOCAL_DB", os.path.join(BENCH_DIR, ".bench_local.db"))
+
+    # O app carrega os avatares relativos ao diretório atual
+    if any(not os.path.exists(os.path.join(REPO_DIR, name)) for name in APP_ASSETS):
+        assets_dir = tempfile.mkdtemp(prefix="analy_bench_")
+        for name in APP_ASSETS:
+            source = os.path.join(REPO_DIR, name)
+            with open(os.path.join(assets_dir, name), "wb") as f:
+                if os.path.exists(source):
+                    with open(source, "rb") as original:
+                        f.write(original.read())
+                else:
+                    f.write(_PLACEHOLDER_PNG)
+        os.chdir(assets_dir)
+    else:
+        os.chdir(REPO_DIR)
+
+    # `fake_backend` tem prioridade sobre qualquer backend_service instalado
+    for path in (REPO_DIR, os.path.join(BENCH_DIR, "fake_backend")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def _rss_mb():
+    # ru_maxrss em KB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _session_bytes(at):
+    total = 0
+    for key, method in (("result_store", "memory_bytes"), ("render_cache", "total_bytes")):
+        try:
+            total += getattr(at.session_state[key], method)()
+        except (KeyError, AttributeError):
+            pass
+    return total
+
+
+def simulate_user(user_index, turns, timeout):
+    """Uma sessão: carga inicial e `turns` perguntas, cada uma seguida de um rerun ocioso"""
+    from streamlit.testing.v1 import AppTest
+
+    result = {"user": user_index, "load_ms": None, "turn_ms": [], "rerun_ms": [], "errors": [], "session_bytes": 0}
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    start = time.perf_counter()
+    at.run()
+    result["load_ms"] = (time.perf_counter() - start) * 1000
+
+    for turn in range(turns):
+        question = QUESTIONS[(user_index + turn) % len(QUESTIONS)]
+        start = time.perf_counter()
+        at.chat_input[0].set_value(question).run()
+        result["turn_ms"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        at.run()
+        result["rerun_ms"].append((time.perf_counter() - start) * 1000)
+
+        if at.exception:
+            result["errors"].extend(str(e.value) for e in at.exception)
+
+    result["session_bytes"] = _session_bytes(at)
+    return result
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "max": ordered[-1],
+    }
+
+
+def run_worker(args, user_indices, start_at):
+    """Processo de benchmark: executa em sequência os usuários que recebeu"""
+    configure_environment(args)
+    # Sincroniza o início dos processos depois das importações
+    time.sleep(max(0.0, start_at - time.time()))
+
+    rss_before = _rss_mb()
+    results = [simulate_user(u, args.turns, args.timeout) for u in user_indices]
+    rss_growth = max(0.0, _rss_mb() - rss_before)
+
+    # Os processos do pool saem sem `atexit`: grava os logs pendentes antes
+    from log_queue import get_log_queue
+    get_log_queue().flush()
+    for result in results:
+        result["rss_growth_mb"] = rss_growth / len(results)
+    return results
+
+
+def run_benchmark(args):
+    processes = max(1, min(args.processes or args.users, args.users))
+    groups = [list(range(args.users))[i::processes] for i in range(processes)]
+    start_at = time.time() + args.warmup_s
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes) as pool:
+        pending = [pool.apply_async(run_worker, (args, group, start_at)) for group in groups]
+        results = [r for item in pending for r in item.get()]
+    elapsed = time.time() - start_at
+
+    turn_ms = [t for r in results for t in r["turn_ms"]]
+    rerun_ms = [t for r in results for t in r["rerun_ms"]]
+    errors = [e for r in results for e in r["errors"]]
+    summary = {
+        "config": {
+            "users": args.users, "processes": processes, "turns": args.turns, "rows": args.rows,
+            "agent_latency_ms": args.agent_latency_ms, "sql_latency_ms": args.sql_latency_ms,
+        },
+        "load_ms": _percentiles([r["load_ms"] for r in results]),
+        "turn_ms": _percentiles(turn_ms),
+        "rerun_ms": _percentiles(rerun_ms),
+        "session_mb": statistics.mean(r["session_bytes"] for r in results) / (1024 * 1024),
+        "rss_growth_mb_per_user": statistics.mean(r["rss_growth_mb"] for r in results),
+        "throughput_turns_per_s": len(turn_ms) / elapsed if elapsed else 0.0,
+        "elapsed_s": elapsed,
+        "errors": len(errors),
+    }
+    return summary, errors
+
+
+# Métricas comparadas com o baseline: (caminho, maior é melhor)
+REGRESSION_METRICS = [
+    (("turn_ms", "p95"), False),
+    (("rerun_ms", "p95"), False),
+    (("session_mb",), False),
+    (("throughput_turns_per_s",), True),
+]
+
+
+def _get(summary, path):
+    for key in path:
+        summary = summary[key]
+    return summary
+
+
+def compare_with_baseline(summary, baseline, max_regression):
+    """Lista as métricas que pioraram mais que `max_regression` (fração)"""
+    regressions = []
+    for path, higher_is_better in REGRESSION_METRICS:
+        old, new = _get(baseline, path), _get(summary, path)
+        if not old:
+            continue
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        if change > max_regression:
+            regressions.append(f"{'.'.join(path)}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+
+def print_summary(summary, errors):
+    config = summary["config"]
+    print(f"Usuários: {config['users']} em {config['processes']} processo(s), "
+          f"turnos por usuário: {config['turns']}, linhas por resultado: {config['rows']}")
+    for name in ("load_ms", "turn_ms", "rerun_ms"):
+        values = summary[name]
+        print(f"{name:<10} p50 {values['p50']:9.1f} ms   p95 {values['p95']:9.1f} ms   max {values['max']:9.1f} ms")
+    print(f"Memória por sessão (resultados + cache de renderização): {summary['session_mb']:.2f} MB")
+    print(f"Crescimento do RSS por usuário: {summary['rss_growth_mb_per_user']:.2f} MB")
+    print(f"Vazão: {summary['throughput_turns_per_s']:.2f} turnos/s em {summary['elapsed_s']:.1f}s")
+    if errors:
+        print(f"{len(errors)} erro(s) nas execuções; primeiro: {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--processes", type=int, help="processos simultâneos (padrão: um por usuário)")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--agent-latency-ms", type=float, default=800)
+    parser.add_argument("--sql-latency-ms", type=float, default=50)
+    parser.add_argument("--recordings", help="JSON com respostas gravadas do agent")
+    parser.add_argument("--no-answer-cache", action="store_true", help="desativa o cache de respostas")
+    parser.add_argument("--timeout", type=float, default=120, help="tempo limite de cada execução do AppTest")
+    parser.add_argument("--warmup-s", type=float, default=10, help="tempo para os processos importarem o app")
+    parser.add_argument("--json", help="grava o resumo neste arquivo")
+    parser.add_argument("--baseline", help="resumo anterior (--json) para comparação")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="piora máxima aceita (fração)")
+    args = parser.parse_args()
+
+    summary, errors = run_benchmark(args)
+    print_summary(summary, errors)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    failed = bool(errors)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(summary, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSÃO {line}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
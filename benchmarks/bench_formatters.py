@@ -0,0 +1,135 @@
+"""
+Benchmark da formatação de tabelas: `format_dataframe_display` x formatadores vetorizados.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/bench_formatters.py --rows 10000 --cols 30 --repeat 5
+
+Gera um DataFrame sintético com colunas monetárias, de quantidade,
+percentuais, CPF/CNPJ, datas e texto, e mede o tempo de formatação pela
+função antiga e pelo formatador compilado de `formatters` (inferência do
+esquema medida à parte, já que acontece uma única vez por resultado). Sem o
+`backend_service` disponível, a função antiga é substituída por uma
+formatação célula a célula equivalente.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatters import compile_formatter, infer_schema  # noqa: E402
+
+
+def _br(value, decimals=2, prefix="", suffix=""):
+    if pd.isna(value):
+        return ""
+    text = f"{abs(value):,.{decimals}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    return f"{'-' if value < 0 else ''}{prefix}{text}{suffix}"
+
+
+def _cpf(value):
+    digits = "".join(ch for ch in str(value) if ch.isdigit()).zfill(11)
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+
+
+def _cnpj(value):
+    digits = "".join(ch for ch in str(value) if ch.isdigit()).zfill(14)
+    return f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+
+
+def format_cell_by_cell(df):
+    """Referência célula a célula, no mesmo estilo da formatação antiga"""
+    out = df.copy()
+    for col in out.columns:
+        name = col.upper()
+        if "CPF" in name:
+            out[col] = out[col].map(_cpf)
+        elif "CNPJ" in name:
+            out[col] = out[col].map(_cnpj)
+        elif pd.api.types.is_datetime64_any_dtype(out[col]):
+            out[col] = out[col].map(lambda v: v.strftime("%d/%m/%Y") if pd.notna(v) else "")
+        elif "VALOR" in name:
+            out[col] = out[col].map(lambda v: _br(v, prefix="R$ "))
+        elif "PERC" in name:
+            out[col] = out[col].map(lambda v: _br(v, suffix="%"))
+        elif pd.api.types.is_integer_dtype(out[col]):
+            out[col] = out[col].map(lambda v: _br(v, decimals=0))
+        elif pd.api.types.is_float_dtype(out[col]):
+            out[col] = out[col].map(_br)
+    return out
+
+
+def load_old_formatter():
+    try:
+        from backend_service import format_dataframe_display
+        return "format_dataframe_display", format_dataframe_display
+    except Exception as e:
+        print(f"backend_service indisponível ({e}); usando a referência célula a célula")
+        return "célula a célula", format_cell_by_cell
+
+
+def make_frame(rows, cols, seed=42):
+    """DataFrame sintético com a mistura de colunas típica dos resultados do agente"""
+    rng = np.random.default_rng(seed)
+    kinds = ["VALOR", "QTD", "PERC", "CPF", "CNPJ", "DT", "NOME"]
+    data = {}
+    for i in range(cols):
+        kind = kinds[i % len(kinds)]
+        name = f"{kind}_{i}"
+        if kind == "VALOR":
+            data[name] = rng.normal(5000, 20000, rows).round(2)
+        elif kind == "QTD":
+            data[name] = rng.integers(0, 5_000_000, rows)
+        elif kind == "PERC":
+            data[name] = rng.random(rows)
+        elif kind == "CPF":
+            data[name] = rng.integers(10**9, 10**11 - 1, rows).astype(str)
+        elif kind == "CNPJ":
+            data[name] = rng.integers(10**12, 10**14 - 1, rows).astype(str)
+        elif kind == "DT":
+            data[name] = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, rows), unit="D")
+        else:
+            data[name] = rng.choice(["Norte", "Sul", "Leste", "Oeste", "Centro"], rows)
+    return pd.DataFrame(data)
+
+
+def _best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--cols", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.cols)
+    old_name, old_format = load_old_formatter()
+
+    schema_best, _ = _best_of(lambda: infer_schema(df), args.repeat)
+    formatter = compile_formatter(infer_schema(df))
+
+    old_best, old_avg = _best_of(lambda: old_format(df), args.repeat)
+    new_best, new_avg = _best_of(lambda: formatter(df), args.repeat)
+
+    print(f"DataFrame: {args.rows} linhas x {args.cols} colunas, {args.repeat} repetições")
+    print(f"{'inferência do esquema':<28} melhor {schema_best * 1000:9.1f} ms")
+    print(f"{old_name:<28} melhor {old_best * 1000:9.1f} ms   média {old_avg * 1000:9.1f} ms")
+    print(f"{'vetorizado':<28} melhor {new_best * 1000:9.1f} ms   média {new_avg * 1000:9.1f} ms")
+    print(f"Aceleração: {old_best / new_best:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Tempo de partida do app: perfil de importação, orçamento e primeiro acesso.
+
+Uso (na raiz do projeto):
+
+    python benchmarks/bench_startup.py --budget-ms 2500 --profile
+
+Cada medida roda num processo Python novo, com o mesmo backend simulado de
+`bench_app.py`:
+
+- importação: `import streamlit` + importações de `streamlit_app.py` (sem
+  executar o `main()`), repetida `--repeat` vezes;
+- primeiro acesso frio: primeira execução da página com o `AppTest` num
+  processo recém-iniciado (importações + pool + cards de métricas);
+- primeiro acesso aquecido: a mesma execução depois de `startup.prewarm()`,
+  como acontece com `python startup.py`.
+
+Com `--profile`, mostra os pacotes mais lentos de `python -X importtime`.
+Termina com código 1 se a mediana da importação passar de `--budget-ms`
+(padrão `ANALY_IMPORT_BUDGET_MS`). O repositório não tem CI: a verificação do
+orçamento é manual, rodando este script antes de publicar mudanças que
+alterem as importações do app.
+"""
+
+import argparse
+import json
+import os
+import runpy
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from bench_app import APP_PATH, configure_environment
+
+IMPORT_BUDGET_MS = float(os.getenv("ANALY_IMPORT_BUDGET_MS", "3000"))
+
+# Dependências que o app adia até o caminho que precisa delas
+DEFERRED_MODULES = ("pyarrow.parquet",)
+
+
+def _environment_args(args):
+    return argparse.Namespace(
+        rows=args.rows, agent_latency_ms=0, sql_latency_ms=args.sql_latency_ms,
+        recordings=None, no_answer_cache=False
+    )
+
+
+def measure(mode, args):
+    """Executado no processo filho: uma medida, impressa em JSON"""
+    configure_environment(_environment_args(args))
+    result = {"mode": mode}
+
+    if mode == "import":
+        start = time.perf_counter()
+        import streamlit  # noqa: F401
+        result["streamlit_ms"] = (time.perf_counter() - start) * 1000
+        runpy.run_path(APP_PATH, run_name="bench_startup")
+        result["total_ms"] = (time.perf_counter() - start) * 1000
+        result["app_ms"] = result["total_ms"] - result["streamlit_ms"]
+        result["deferred_loaded"] = [name for name in DEFERRED_MODULES if name in sys.modules]
+    else:
+        from streamlit.testing.v1 import AppTest
+
+        if mode == "first_load_warm":
+            import startup
+            start = time.perf_counter()
+            startup.prewarm(ui=True)
+            result["prewarm_ms"] = (time.perf_counter() - start) * 1000
+
+        at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+        start = time.perf_counter()
+        at.run()
+        result["first_load_ms"] = (time.perf_counter() - start) * 1000
+        result["errors"] = [str(e.value) for e in at.exception]
+
+    print(json.dumps(result))
+
+
+def _run_child(mode, args, python_flags=()):
+    command = [
+        sys.executable, *python_flags, os.path.abspath(__file__), "--measure", mode,
+        "--rows", str(args.rows), "--sql-latency-ms", str(args.sql_latency_ms), "--timeout", str(args.timeout),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True, check=False)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f"medida '{mode}' falhou:\n{completed.stderr[-2000:]}")
+    return json.loads(lines[-1]), completed.stderr
+
+
+def import_profile(stderr, top):
+    """Tempo próprio (self) agregado por pacote de topo, a partir de `-X importtime`"""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us = int(parts[0])
+        except ValueError:  # cabeçalho
+            continue
+        totals[parts[2].strip().split(".")[0]] += self_us / 1000
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3, help="repetições da medida de importação")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="orçamento da importação")
+    parser.add_argument("--profile", action="store_true", help="mostra os pacotes mais lentos na importação")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--sql-latency-ms", type=float, default=50)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--skip-first-load", action="store_true", help="mede apenas a importação")
+    parser.add_argument("--json", help="grava o resumo neste arquivo")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args)
+        return
+
+    imports = [_run_child("import", args)[0] for _ in range(max(1, args.repeat))]
+    summary = {
+        "import_ms": statistics.median(r["total_ms"] for r in imports),
+        "streamlit_ms": statistics.median(r["streamlit_ms"] for r in imports),
+        "app_ms": statistics.median(r["app_ms"] for r in imports),
+        "deferred_loaded": imports[0]["deferred_loaded"],
+        "budget_ms": args.budget_ms,
+    }
+    print(f"Importação (mediana de {len(imports)}): {summary['import_ms']:.0f} ms "
+          f"(streamlit {summary['streamlit_ms']:.0f} ms + app {summary['app_ms']:.0f} ms), "
+          f"orçamento {args.budget_ms:.0f} ms")
+    if summary["deferred_loaded"]:
+        print(f"Módulos adiados carregados na importação: {', '.join(summary['deferred_loaded'])}")
+
+    if args.profile:
+        _, stderr = _run_child("import", args, python_flags=("-X", "importtime"))
+        print("Pacotes mais lentos (tempo próprio):")
+        for package, ms in import_profile(stderr, args.top):
+            print(f"  {package:<28} {ms:9.1f} ms")
+
+    if not args.skip_first_load:
+        cold, _ = _run_child("first_load_cold", args)
+        warm, _ = _run_child("first_load_warm", args)
+        summary.update({
+            "first_load_cold_ms": cold["first_load_ms"],
+            "first_load_warm_ms": warm["first_load_ms"],
+            "prewarm_ms": warm["prewarm_ms"],
+            "errors": cold["errors"] + warm["errors"],
+        })
+        print(f"Primeiro acesso frio: {cold['first_load_ms']:.0f} ms")
+        print(f"Primeiro acesso aquecido: {warm['first_load_ms']:.0f} ms "
+              f"(pré-aquecimento antes de servir: {warm['prewarm_ms']:.0f} ms)")
+        for error in summary["errors"]:
+            print(f"ERRO {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    failed = summary["import_ms"] > args.budget_ms or bool(summary.get("errors"))
+    if summary["import_ms"] > args.budget_ms:
+        print(f"ACIMA DO ORÇAMENTO: {summary['import_ms']:.0f} ms > {args.budget_ms:.0f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Conferência de paridade: `format_dataframe_display` x formatadores vetorizados.
+
+Uso (na raiz do projeto, com o `backend_service` real no caminho):
+
+    python benchmarks/check_formatters.py --rows 500
+
+Formata DataFrames de exemplo (os sintéticos de `bench_formatters` e casos de
+borda: datas em texto dia/mês, valores que não são datas, percentuais em
+fração e em pontos, documentos sem zeros à esquerda, nulos) pelas duas
+funções e lista, por coluna, as células em que os textos diferem. Sai com
+código 1 se houver diferença. O app faz a mesma conferência nas primeiras
+linhas de cada resultado e usa `format_dataframe_display` nas colunas
+divergentes; o script mostra as divergências antes, com casos de borda.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_formatters import make_frame  # noqa: E402
+from formatters import compile_formatter  # noqa: E402
+
+
+# Diferenças exibidas por coluna
+MAX_EXAMPLES = 3
+
+
+def edge_case_frame():
+    """Casos de borda que já divergiram entre as duas formatações"""
+    return pd.DataFrame({
+        "DT_TEXTO": ["05/01/2024", "06/01/2024", None, "31/12/2023"],
+        "DT_ISO": ["2024-01-05", "2024-01-06", "2024-02-29", None],
+        "DT_MISTO": ["05/01/2024", "sem data", "2024-13-01", None],
+        "PERC_FRACAO": [0.1, 0.25, 1.0, np.nan],
+        "PERC_PONTOS": [10.0, 25.5, 100.0, np.nan],
+        "VALOR_TOTAL": [1234.5, -0.004, np.nan, 10 ** 9],
+        "QTD": [1, 1000, 1000000, 0],
+        "CPF": ["01234567890", "1234567890", "123", None],
+        "CNPJ": [1234567000199, 12345678000199, np.nan, 0],
+        "NOME": ["Padaria X", None, "", "Ótica Y"],
+    })
+
+
+def compare(reference, candidate):
+    """`{coluna: (diferenças, [(linha, referência, vetorizado), ...])}`"""
+    report = {}
+    for col in reference.columns:
+        expected = reference[col].astype(str).to_numpy()
+        actual = candidate[col].astype(str).to_numpy()
+        diff = np.flatnonzero(expected != actual)
+        if len(diff):
+            examples = [(int(i), expected[i], actual[i]) for i in diff[:MAX_EXAMPLES]]
+            report[col] = (len(diff), examples)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--cols", type=int, default=14)
+    args = parser.parse_args()
+
+    try:
+        from backend_service import format_dataframe_display
+    except Exception as e:
+        print(f"backend_service indisponível ({e}); a paridade só pode ser conferida com a função real")
+        return 2
+
+    frames = {
+        "sintético": make_frame(args.rows, args.cols),
+        "casos de borda": edge_case_frame(),
+    }
+    failed = False
+    for name, df in frames.items():
+        report = compare(format_dataframe_display(df.copy()), compile_formatter(df)(df))
+        print(f"{name}: {len(df)} linhas x {len(df.columns)} colunas, {len(report)} coluna(s) divergente(s)")
+        for col, (count, examples) in report.items():
+            failed = True
+            print(f"  {col}: {count} célula(s)")
+            for row, expected, actual in examples:
+                print(f"    linha {row}: {expected!r} x {actual!r}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+`backend_service` falso para os benchmarks offline.
+
+Implementa a mesma interface usada pela aplicação sem Snowflake nem Cortex:
+as respostas do agent vêm de gravações (`ANALY_BENCH_RECORDINGS`), os
+resultados de dados são sintéticos com `ANALY_BENCH_ROWS` linhas e cada
+chamada espera uma latência configurável, simulando warehouse e agent.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+BENCH_ROWS = int(os.getenv("ANALY_BENCH_ROWS", "500"))
+BENCH_SQL_LATENCY_MS = float(os.getenv("ANALY_BENCH_SQL_LATENCY_MS", "50"))
+BENCH_AGENT_LATENCY_MS = float(os.getenv("ANALY_BENCH_AGENT_LATENCY_MS", "800"))
+BENCH_RECORDINGS = os.getenv(
+    "ANALY_BENCH_RECORDINGS",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recordings", "agent_responses.json")
+)
+
+MESSAGES = {
+    "chat_placeholder": "Pergunte algo sobre os dados...",
+    "connection_error": "Erro de conexão com o Snowflake.",
+    "error": "Ocorreu um erro ao processar sua pergunta.",
+    "generating_insights": "Gerando insights...",
+    "search_alternative": "Buscando de outra forma...",
+    "search_visao": "Consultando a visão do cliente...",
+    "thinking": "Pensando...",
+}
+
+WELCOME_BOT_MESSAGE = "Olá! Sou a Analy. Como posso ajudar?"
+
+# Chamadas recebidas, por função (para conferência nos benchmarks)
+CALLS = {}
+_calls_lock = threading.Lock()
+
+
+def _wait(latency_ms, name):
+    with _calls_lock:
+        CALLS[name] = CALLS.get(name, 0) + 1
+    if latency_ms > 0:
+        # Variação de ±20% para não sincronizar os usuários simulados
+        time.sleep(latency_ms * random.uniform(0.8, 1.2) / 1000)
+
+
+def _load_recordings(path=BENCH_RECORDINGS):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[bench] gravações indisponíveis ({e}); usando resposta padrão")
+        return [{"question": "", "response": {"response_type": "text_only", "text": "Resposta padrão."}}]
+
+
+RECORDINGS = _load_recordings()
+
+
+def _recording_for(question):
+    normalized = question.strip().lower()
+    for item in RECORDINGS:
+        if item.get("question", "").strip().lower() == normalized:
+            return item["response"]
+    # Pergunta não gravada: escolhe uma gravação de forma determinística
+    return RECORDINGS[sum(map(ord, normalized)) % len(RECORDINGS)]["response"]
+
+
+def synthetic_rows(rows=BENCH_ROWS, seed=0):
+    """Resultado sintético com a mistura de colunas típica das respostas"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "DATA_REFERENCIA": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows) % 365, unit="D"),
+        "REGIONAL": rng.choice(["Norte", "Sul", "Leste", "Oeste", "Centro"], rows),
+        "CPF_CLIENTE": rng.integers(10**9, 10**11 - 1, rows).astype(str),
+        "QTD_CONTRATOS": rng.integers(0, 5000, rows),
+        "VALOR_FATURAMENTO": rng.normal(25000, 8000, rows).round(2),
+        "PERC_INADIMPLENCIA": rng.random(rows).round(4),
+    })
+    df["DATA_REFERENCIA"] = df["DATA_REFERENCIA"].dt.strftime("%Y-%m-%d")
+    return df.to_dict("records")
+
+
+# ----------------------------------------------------------------------
+# Sessão e usuário
+# ----------------------------------------------------------------------
+
+def init_session():
+    from connection_pool import LocalSession
+    return LocalSession(), True
+
+
+def get_name_user(session, username):
+    _wait(BENCH_SQL_LATENCY_MS, "get_name_user")
+    return username.split("@")[0].title()
+
+
+def process_pending_feedback(session, username):
+    _wait(BENCH_SQL_LATENCY_MS, "process_pending_feedback")
+
+
+def save_conversation_log(session, username, role, message, **kwargs):
+    _wait(BENCH_SQL_LATENCY_MS, "save_conversation_log")
+
+
+def save_feedback_to_snowflake(*args, **kwargs):
+    _wait(BENCH_SQL_LATENCY_MS, "save_feedback_to_snowflake")
+    return True
+
+
+# ----------------------------------------------------------------------
+# Roteamento e cliente
+# ----------------------------------------------------------------------
+
+def classify_user_intent(session, user_input):
+    _wait(BENCH_SQL_LATENCY_MS, "classify_user_intent")
+    return "general"
+
+
+def extract_cpf_or_name_from_text(session, user_input):
+    _wait(BENCH_SQL_LATENCY_MS, "extract_cpf_or_name_from_text")
+    return None
+
+
+def process_customer_vision(session, user_input, id_customer):
+    _wait(BENCH_SQL_LATENCY_MS, "process_customer_vision")
+    return {
+        "text": f"Visão do cliente {id_customer}.",
+        "data": [{"CPF_CLIENTE": str(id_customer), "NOME_CLIENTE": "Cliente Sintético", "VALOR_FATURAMENTO": 1234.5}],
+    }
+
+
+def get_consultor_suggestions(session, username):
+    _wait(BENCH_SQL_LATENCY_MS, "get_consultor_suggestions")
+    return []
+
+
+# ----------------------------------------------------------------------
+# Agent
+# ----------------------------------------------------------------------
+
+def call_cortex_agent(user_input):
+    _wait(BENCH_AGENT_LATENCY_MS, "call_cortex_agent")
+    return {"question": user_input, "recorded": _recording_for(user_input)}
+
+
+def process_agent_response(session, user_input, response):
+    """Monta a resposta processada a partir da gravação, com dados sintéticos"""
+    recorded = dict(response.get("recorded") or _recording_for(user_input))
+    if recorded.get("sql") or recorded.get("ordered"):
+        # Simula a execução do SQL gerado pelo agent
+        session.sql("SELECT 1").collect()
+        _wait(BENCH_SQL_LATENCY_MS, "agent_sql")
+
+    rows = recorded.pop("rows", BENCH_ROWS)
+    if recorded.get("response_type") in ("multiple_rows", "data_only", "single_row"):
+        recorded["data"] = synthetic_rows(rows, seed=len(user_input))
+    if recorded.get("ordered"):
+        for key in recorded.get("order_sequence", []):
+            if key.startswith("table_"):
+                recorded[key] = synthetic_rows(rows, seed=len(user_input) + len(key))
+    for key in ("chart",) + tuple(k for k in recorded if k.startswith("chart_")):
+        spec = recorded.get(key)
+        if isinstance(spec, dict) and spec.get("data") == "synthetic":
+            recorded[key] = json.dumps(dict(spec, data={"values": synthetic_rows(rows, seed=1)}))
+    recorded.setdefault("thinking_log", "")
+    return recorded
+
+
+def extract_message_text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def format_dataframe_display(df):
+    return df.astype(str)
+
+
+def generate_insights(session, df, user_question):
+    _wait(BENCH_AGENT_LATENCY_MS, "generate_insights")
+    return f"Insights sintéticos para {len(df)} linhas."
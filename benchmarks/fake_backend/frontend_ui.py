@@ -0,0 +1,65 @@
+"""
+`frontend_ui` falso para os benchmarks offline.
+
+Componentes mínimos com a mesma assinatura dos originais, para que o custo
+medido seja o do loop de renderização do chat e não o da interface estática.
+"""
+
+import streamlit as st
+
+
+def apply_custom_css():
+    st.markdown("<style></style>", unsafe_allow_html=True)
+
+
+def show_welcome_header(username_first):
+    st.markdown(f"### Olá, {username_first}!")
+
+
+def exibir_cards_metricas(session):
+    rows = session.sql("SELECT 1 AS CLIENTES, 2 AS CONTRATOS").collect()
+    cols = st.columns(2)
+    cols[0].metric("Clientes", rows[0]["CLIENTES"])
+    cols[1].metric("Contratos", rows[0]["CONTRATOS"])
+
+
+def show_quick_links():
+    st.caption("Links rápidos")
+
+
+def show_sidebar_links():
+    st.caption("Links")
+
+
+def show_logo_insight_center():
+    st.caption("Insight Center")
+
+
+def show_loaded_session_info():
+    info = st.session_state.get("loaded_session_info")
+    if info:
+        st.caption(f"Sessão carregada: {info.get('title', '')}")
+
+
+def display_history_modal(session, username):
+    st.caption("Histórico indisponível no benchmark.")
+
+
+def exibir_botao_dicas():
+    st.button("💡", key="dicas")
+
+
+def get_available_chart_types(df):
+    return ["bar", "line"]
+
+
+def create_advanced_visualization(df, chart_type, theme="plotly_white"):
+    return None
+
+
+def show_feedback_input(message_index, graph_type, sql_query, user_question):
+    if st.button("👍", key=f"feedback_up_{message_index}"):
+        # Mesmo contrato do frontend real: o feedback fica pendente até o próximo rerun
+        st.session_state.setdefault("pending_feedback", []).append(
+            {"message_index": message_index, "rating": "up", "question": user_question}
+        )
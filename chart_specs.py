@@ -0,0 +1,193 @@
+"""
+Specs de gráficos compiladas uma única vez por resposta.
+
+O loop de renderização fazia `json.loads` de cada `chart_*` e de
+`msg["chart"]` (único ou lista) a cada rerun, para todas as mensagens do
+histórico, e entregava ao `st.vega_lite_chart` a spec com todos os dados
+embutidos. Aqui a spec é decodificada e validada quando a resposta é
+processada (`compact_message`): os dados inline saem da spec e viram datasets
+nomeados guardados no `result_store` — gráficos da mesma resposta com os
+mesmos dados compartilham um único dataset. Specs inválidas, ou com
+`ANALY_CHART_RENDERER=figure`, são desenhadas com `create_advanced_visualization`
+a partir do dataset, com a figura em cache por mensagem e `chart_theme`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import streamlit as st
+
+from frontend_ui import create_advanced_visualization, get_available_chart_types
+
+
+logger = logging.getLogger(__name__)
+
+# Renderizador principal: "vega" (st.vega_lite_chart) ou "figure" (create_advanced_visualization)
+CHART_RENDERER = os.getenv("ANALY_CHART_RENDERER", "vega")
+
+# Chaves que caracterizam uma spec Vega-Lite de gráfico
+_VIEW_KEYS = ("mark", "layer", "concat", "hconcat", "vconcat", "facet", "repeat")
+
+# Marca Vega-Lite -> tipo de gráfico do `create_advanced_visualization`
+_MARK_CHART_TYPES = {
+    "bar": "bar",
+    "line": "line",
+    "area": "area",
+    "point": "scatter",
+    "circle": "scatter",
+    "square": "scatter",
+    "arc": "pie",
+    "rect": "heatmap",
+    "boxplot": "box",
+}
+
+
+class CompiledChart:
+    """Spec decodificada sem os dados inline, com as referências dos datasets"""
+
+    __slots__ = ("spec", "datasets", "main_dataset", "error")
+
+    def __init__(self, spec=None, datasets=None, main_dataset=None, error=None):
+        self.spec = spec
+        self.datasets = datasets or {}     # {nome na spec: referência do result_store ou DataFrame}
+        self.main_dataset = main_dataset   # dataset dos dados de nível superior da spec
+        self.error = error
+
+    @property
+    def mark(self):
+        mark = (self.spec or {}).get("mark")
+        if isinstance(mark, dict):
+            mark = mark.get("type")
+        if mark is None:
+            layers = (self.spec or {}).get("layer") or [{}]
+            mark = layers[0].get("mark")
+            if isinstance(mark, dict):
+                mark = mark.get("type")
+        return mark
+
+
+def validate_spec(spec):
+    """Mensagem de erro da spec ou `None` se ela pode ser desenhada"""
+    if not isinstance(spec, dict):
+        return f"spec deve ser um objeto JSON, não {type(spec).__name__}"
+    if not any(key in spec for key in _VIEW_KEYS):
+        return "spec sem 'mark' nem composição de gráficos"
+    if "mark" in spec and not isinstance(spec.get("encoding", {}), dict):
+        return "'encoding' deve ser um objeto"
+    return None
+
+
+def dataset_name(values):
+    """Nome do dataset a partir do conteúdo (dados iguais -> mesmo nome)"""
+    payload = json.dumps(values, sort_keys=True, default=str, ensure_ascii=False)
+    return "ds_" + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def spec_fingerprint(raw_spec):
+    """
+    Hash do conteúdo de uma spec (texto JSON, objeto ou `CompiledChart`), para
+    chavear o que é gerado a partir dela independentemente do objeto.
+    """
+    if isinstance(raw_spec, CompiledChart):
+        payload = json.dumps(
+            [raw_spec.spec, raw_spec.datasets, raw_spec.main_dataset, raw_spec.error],
+            sort_keys=True, default=str, ensure_ascii=False
+        )
+    elif isinstance(raw_spec, bytes):
+        payload = raw_spec.decode("utf-8", "replace")
+    elif isinstance(raw_spec, str):
+        payload = raw_spec
+    else:
+        payload = json.dumps(raw_spec, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def compile_chart(raw_spec, put_dataset):
+    """
+    Decodifica, valida e separa os dados de uma spec Vega-Lite.
+
+    `put_dataset(nome, valores)` guarda os valores e retorna o que deve ser
+    mantido no lugar deles (no app, uma referência do `result_store`).
+    """
+    if isinstance(raw_spec, CompiledChart):
+        return raw_spec
+    try:
+        spec = json.loads(raw_spec) if isinstance(raw_spec, (str, bytes)) else raw_spec
+    except ValueError as e:
+        return CompiledChart(error=f"JSON inválido na spec do gráfico: {e}")
+    if not isinstance(spec, dict):
+        return CompiledChart(error=validate_spec(spec))
+
+    # Mesmo uma spec inválida tem os dados separados, para o renderizador alternativo
+    error = validate_spec(spec)
+    spec = dict(spec)
+    datasets = {}
+    main_dataset = None
+
+    def extract(view):
+        data = view.get("data")
+        if not isinstance(data, dict) or not isinstance(data.get("values"), list):
+            return view, None
+        name = dataset_name(data["values"])
+        if name not in datasets:
+            datasets[name] = put_dataset(name, data["values"])
+        view = dict(view)
+        view["data"] = {key: value for key, value in data.items() if key != "values"}
+        view["data"]["name"] = name
+        return view, name
+
+    spec, main_dataset = extract(spec)
+    if isinstance(spec.get("layer"), list):
+        spec["layer"] = [extract(layer)[0] if isinstance(layer, dict) else layer for layer in spec["layer"]]
+
+    # Datasets nomeados já presentes na spec mantêm o nome usado nas referências
+    for name, values in (spec.pop("datasets", None) or {}).items():
+        datasets[name] = put_dataset(dataset_name(values), values) if isinstance(values, list) else values
+
+    if main_dataset is None and len(datasets) == 1:
+        main_dataset = next(iter(datasets))
+    return CompiledChart(spec, datasets, main_dataset, error)
+
+
+def chart_type_for(chart, df):
+    """Tipo de gráfico do renderizador alternativo mais próximo da marca da spec"""
+    available = list(get_available_chart_types(df) or [])
+    preferred = _MARK_CHART_TYPES.get(chart.mark)
+    if preferred in available:
+        return preferred
+    return available[0] if available else preferred
+
+
+def build_figure(chart, df, theme):
+    """Figura do `create_advanced_visualization` com os dados do gráfico"""
+    if df is None or df.empty:
+        return None
+    chart_type = chart_type_for(chart, df)
+    if chart_type is None:
+        return None
+    return create_advanced_visualization(df, chart_type, theme)
+
+
+def show_chart(message_index, elem_key, raw_spec, render_cache):
+    """Desenha o gráfico da mensagem: Vega-Lite compilado ou o renderizador alternativo"""
+    chart = render_cache.compiled_chart(message_index, elem_key, raw_spec)
+
+    if CHART_RENDERER != "figure" and chart.error is None:
+        try:
+            st.vega_lite_chart(render_cache.chart(message_index, elem_key, raw_spec), use_container_width=True)
+            return
+        except Exception:
+            logger.exception("Erro ao renderizar gráfico Vega-Lite, usando o renderizador alternativo")
+
+    theme = st.session_state.get("chart_theme", "plotly_white")
+    try:
+        figure = render_cache.figure(message_index, elem_key, raw_spec, theme)
+    except Exception:
+        figure = None
+        logger.exception("Erro no renderizador alternativo de gráficos")
+    if figure is None:
+        st.error(f"Erro ao renderizar gráfico: {chart.error or 'renderizador alternativo indisponível'}")
+        return
+    st.plotly_chart(figure, use_container_width=True)
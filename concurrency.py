@@ -0,0 +1,79 @@
+"""
+Execução concorrente de tarefas da aplicação.
+
+Pools de threads do processo, separados por tipo de trabalho para que um não
+esgote as threads do outro:
+
+- "default": etapas do próprio rerun (classificação e extração em paralelo);
+- "background": pré-carga de clientes, insights, atualização de caches.
+
+As tarefas submetidas a partir de um rerun herdam o contexto de script da
+sessão Streamlit, para que funções do backend que usam `st.session_state`
+continuem funcionando fora da thread principal.
+"""
+
+import atexit
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # execução fora do Streamlit (scripts, benchmarks)
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+
+
+# Quantidade máxima de threads de cada pool
+WORKER_POOL_SIZE = int(os.getenv("ANALY_WORKER_POOL_SIZE", "16"))
+BACKGROUND_POOL_SIZE = int(os.getenv("ANALY_BACKGROUND_POOL_SIZE", "4"))
+
+POOL_SIZES = {
+    "default": WORKER_POOL_SIZE,
+    "background": BACKGROUND_POOL_SIZE,
+}
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(pool="default"):
+    """Retorna o pool de threads `pool` do processo, criando-o na primeira chamada"""
+    executor = _executors.get(pool)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(pool)
+            if executor is None:
+                executor = _executors[pool] = ThreadPoolExecutor(
+                    max_workers=POOL_SIZES[pool], thread_name_prefix=f"analy-{pool}"
+                )
+                atexit.register(executor.shutdown, wait=False)
+    return executor
+
+
+def _with_context(ctx, fn, args, kwargs):
+    if add_script_run_ctx is not None and ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+    return fn(*args, **kwargs)
+
+
+def submit_to(pool, fn, *args, **kwargs):
+    """
+    Submete `fn` ao pool `pool` levando junto o contexto da sessão Streamlit
+    atual e as variáveis de contexto (por exemplo, o span de rastreamento em
+    aberto).
+    """
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx else None
+    context = contextvars.copy_context()
+    return get_executor(pool).submit(context.run, _with_context, ctx, fn, args, kwargs)
+
+
+def submit(fn, *args, **kwargs):
+    """Submete `fn` ao pool das etapas do rerun"""
+    return submit_to("default", fn, *args, **kwargs)
+
+
+def submit_background(fn, *args, **kwargs):
+    """Submete `fn` ao pool de trabalho em segundo plano"""
+    return submit_to("background", fn, *args, **kwargs)
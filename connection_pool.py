@@ -0,0 +1,558 @@
+"""
+Pool de conexões (sessões Snowpark) compartilhado pelos workers do Streamlit.
+
+Cada rerun chamava `init_session()` e repassava a sessão a todos os helpers
+do backend; com muitos usuários simultâneos isso gerava troca constante de
+conexões e picos de latência de login. Aqui as sessões ficam em pools com
+tamanho mínimo/máximo configurável, verificação de saúde, descarte das
+ociosas e métricas de tempo de espera. Cada tipo de consulta (analítica ou
+gravação de logs) usa seu próprio pool, com warehouse e query tag próprios.
+
+O rerun não segura uma sessão: recebe uma `PooledSession`, que empresta uma
+sessão do pool apenas durante cada consulta (`sql(...).collect()`,
+`table(...).to_pandas()`, etc.), chamada a um método da sessão
+(`write_pandas`...) ou chamada ao backend (`call_with_session`). Esperas pelo
+agent e reruns que não consultam o warehouse não ocupam o pool, e tarefas em
+segundo plano pegam o próprio empréstimo a cada consulta. Uma sessão que
+falhou durante o empréstimo só volta ao pool se ainda responder.
+
+Com `ANALY_BACKEND=local` as sessões são substituídas por `LocalSession`, um
+backend SQLite com a mesma interface usada pela aplicação, para testes
+offline.
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from backend_service import init_session
+from tracing import record_rows, sql_span
+
+logger = logging.getLogger(__name__)
+
+# "auto": usa o pool quando há configuração de conexão; "1"/"0" força
+CONNECTION_POOL_MODE = os.getenv("ANALY_CONNECTION_POOL", "auto")
+
+# "snowflake" (padrão) ou "local" (SQLite, para testes offline)
+CONNECTION_BACKEND = os.getenv("ANALY_BACKEND", "snowflake")
+
+POOL_MIN_SIZE = int(os.getenv("ANALY_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("ANALY_POOL_MAX_SIZE", "8"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("ANALY_POOL_ACQUIRE_TIMEOUT", "30"))
+POOL_IDLE_TIMEOUT = float(os.getenv("ANALY_POOL_IDLE_TIMEOUT", "600"))
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("ANALY_POOL_HEALTH_CHECK_INTERVAL", "60"))
+
+# Warehouse de cada tipo de consulta (vazio = warehouse padrão da conexão)
+POOL_WAREHOUSES = {
+    "analytical": os.getenv("ANALY_WAREHOUSE_ANALYTICAL", ""),
+    "logging": os.getenv("ANALY_WAREHOUSE_LOGGING", ""),
+    "export": os.getenv("ANALY_WAREHOUSE_EXPORT", ""),
+}
+
+LOCAL_DB_PATH = os.getenv("ANALY_LOCAL_DB", ":memory:")
+
+
+class PoolTimeout(Exception):
+    """Nenhuma sessão ficou disponível dentro do tempo limite"""
+
+
+# ----------------------------------------------------------------------
+# Backend local (SQLite)
+# ----------------------------------------------------------------------
+
+class LocalRow(dict):
+    """Linha com acesso por chave e por atributo, como `snowflake.snowpark.Row`"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class LocalDataFrame:
+    """Resultado preguiçoso de `LocalSession.sql`"""
+
+    def __init__(self, session, query, params):
+        self._session = session
+        self._query = query
+        self._params = params or []
+
+    def collect(self):
+        with self._session.lock:
+            cursor = self._session.connection.execute(self._query, self._params)
+            columns = [c[0].upper() for c in cursor.description or []]
+            return [LocalRow(zip(columns, row)) for row in cursor.fetchall()]
+
+    def to_pandas(self):
+        rows = self.collect()
+        return pd.DataFrame(rows)
+
+    def to_pandas_batches(self, batch_size=50000):
+        with self._session.lock:
+            cursor = self._session.connection.execute(self._query, self._params)
+            columns = [c[0].upper() for c in cursor.description or []]
+            first = True
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows and not first:
+                    break
+                first = False
+                yield pd.DataFrame(rows, columns=columns)
+                if not rows:
+                    break
+
+    def first(self):
+        rows = self.collect()
+        return rows[0] if rows else None
+
+
+class LocalSession:
+    """Substituto local da sessão Snowpark, apoiado em SQLite"""
+
+    def __init__(self, database=LOCAL_DB_PATH, warehouse=None, query_tag=None):
+        # Autocommit, como o Snowflake: gravações ficam visíveis às outras sessões
+        self.connection = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        self.warehouse = warehouse
+        self.query_tag = query_tag
+        self.closed = False
+
+    def sql(self, query, params=None):
+        return LocalDataFrame(self, query, params)
+
+    def use_warehouse(self, warehouse):
+        self.warehouse = warehouse
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+
+
+# ----------------------------------------------------------------------
+# Fábricas de sessão
+# ----------------------------------------------------------------------
+
+def _snowflake_connection_config():
+    try:
+        return dict(st.secrets["connections"]["snowflake"])
+    except (KeyError, FileNotFoundError, AttributeError):
+        return None
+
+
+def make_session_factory(tag):
+    """Fábrica de sessões para um tipo de consulta (warehouse e query tag próprios)"""
+    warehouse = POOL_WAREHOUSES.get(tag) or None
+    query_tag = f"analy:{tag}"
+
+    if CONNECTION_BACKEND == "local":
+        return lambda: LocalSession(warehouse=warehouse, query_tag=query_tag)
+
+    def create_snowpark_session():
+        from snowflake.snowpark import Session
+
+        config = _snowflake_connection_config() or {}
+        if warehouse:
+            config["warehouse"] = warehouse
+        config["query_tag"] = query_tag
+        return Session.builder.configs(config).create()
+
+    return create_snowpark_session
+
+
+def health_check(session):
+    """Verifica se a sessão ainda responde"""
+    try:
+        session.sql("SELECT 1").collect()
+        return True
+    except Exception:
+        return False
+
+
+def _close(session):
+    try:
+        session.close()
+    except Exception:
+        pass
+
+
+# ----------------------------------------------------------------------
+# Pool
+# ----------------------------------------------------------------------
+
+class ConnectionPool:
+    """Pool de sessões com limites, verificação de saúde e descarte de ociosas"""
+
+    def __init__(self, name, factory, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 acquire_timeout=POOL_ACQUIRE_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL):
+        self.name = name
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = []          # [(sessão, ociosa desde, última verificação)]
+        self._size = 0           # sessões criadas (ociosas + emprestadas)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._metrics = {
+            "acquired": 0,
+            "created": 0,
+            "evicted_idle": 0,
+            "evicted_unhealthy": 0,
+            "timeouts": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    def ensure_min_size(self):
+        """Cria as sessões que faltam para o tamanho mínimo, fora do lock"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                # Reserva a vaga; a criação acontece fora do lock
+                self._size += 1
+            try:
+                session = self.factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            now = time.time()
+            with self._cond:
+                self._metrics["created"] += 1
+                self._idle.append((session, now, now))
+                self._cond.notify()
+
+    def acquire(self, timeout=None):
+        """Empresta uma sessão, aguardando até `timeout` segundos por uma livre"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        deadline = time.time() + timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout(f"Pool '{self.name}' encerrado")
+                if self._idle:
+                    session, idle_since, checked_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserva a vaga; a criação acontece fora do lock
+                    self._size += 1
+                    session = None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeout(f"Nenhuma sessão livre no pool '{self.name}' após {timeout:.0f}s")
+                self._cond.wait(remaining)
+
+        if session is None:
+            try:
+                session = self.factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._metrics["created"] += 1
+        elif time.time() - checked_at >= self.health_check_interval and not health_check(session):
+            _close(session)
+            with self._cond:
+                self._size -= 1
+                self._metrics["evicted_unhealthy"] += 1
+            return self.acquire(max(0.0, deadline - time.time()))
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._cond:
+            self._metrics["acquired"] += 1
+            self._metrics["total_wait_ms"] += wait_ms
+            self._metrics["max_wait_ms"] = max(self._metrics["max_wait_ms"], wait_ms)
+        return session
+
+    def release(self, session, healthy=True):
+        """Devolve a sessão ao pool (ou a descarta, se não estiver saudável)"""
+        with self._cond:
+            if healthy and not self._closed:
+                now = time.time()
+                self._idle.append((session, now, now))
+            else:
+                self._size -= 1
+                if not healthy:
+                    self._metrics["evicted_unhealthy"] += 1
+                _close(session)
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Empresta uma sessão durante o bloco; se o bloco falhar, ela só volta ao pool se ainda responder"""
+        session = self.acquire(timeout)
+        try:
+            yield session
+        except BaseException:
+            self.release(session, healthy=health_check(session))
+            raise
+        self.release(session)
+
+    def evict_idle(self):
+        """Fecha as sessões ociosas há mais de `idle_timeout`, mantendo o mínimo"""
+        now = time.time()
+        with self._cond:
+            keep, evicted = [], []
+            for item in sorted(self._idle, key=lambda i: i[1], reverse=True):
+                if now - item[1] > self.idle_timeout and self._size - len(evicted) > self.min_size:
+                    evicted.append(item[0])
+                else:
+                    keep.append(item)
+            self._idle = keep
+            self._size -= len(evicted)
+            self._metrics["evicted_idle"] += len(evicted)
+        for session in evicted:
+            _close(session)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for session, _, _ in idle:
+            _close(session)
+
+    def get_metrics(self):
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics["size"] = self._size
+            metrics["idle"] = len(self._idle)
+            metrics["in_use"] = self._size - len(self._idle)
+        metrics["avg_wait_ms"] = metrics["total_wait_ms"] / metrics["acquired"] if metrics["acquired"] else 0.0
+        return metrics
+
+
+class PoolManager:
+    """Pools por tipo de consulta, com uma thread de descarte de sessões ociosas"""
+
+    def __init__(self, factory_for=make_session_factory, janitor_interval=60):
+        self._factory_for = factory_for
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._janitor = threading.Thread(target=self._run_janitor, args=(janitor_interval,),
+                                         name="analy-pool-janitor", daemon=True)
+        self._janitor.start()
+
+    def get_pool(self, tag):
+        with self._lock:
+            pool = self._pools.get(tag)
+            if pool is None:
+                pool = self._pools[tag] = ConnectionPool(tag, self._factory_for(tag))
+        # O login das sessões mínimas não bloqueia os outros pools
+        pool.ensure_min_size()
+        return pool
+
+    @contextmanager
+    def lease(self, tag="analytical", timeout=None):
+        with self.get_pool(tag).lease(timeout) as session:
+            yield session
+
+    def get_metrics(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {tag: pool.get_metrics() for tag, pool in pools.items()}
+
+    def _run_janitor(self, interval):
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                pools = list(self._pools.values())
+            for pool in pools:
+                pool.evict_idle()
+
+
+def pooling_enabled():
+    """Indica se as sessões devem vir do pool em vez de `init_session()`"""
+    if CONNECTION_POOL_MODE in ("0", "1"):
+        return CONNECTION_POOL_MODE == "1"
+    return CONNECTION_BACKEND == "local" or _snowflake_connection_config() is not None
+
+
+_pool_manager = None
+_pool_manager_lock = threading.Lock()
+
+
+def get_pool_manager():
+    """Retorna o gerenciador de pools do processo, criando-o na primeira chamada"""
+    global _pool_manager
+    if _pool_manager is None:
+        with _pool_manager_lock:
+            if _pool_manager is None:
+                _pool_manager = PoolManager()
+    return _pool_manager
+
+
+# Métodos da sessão Snowpark que devolvem um DataFrame preguiçoso
+_LAZY_METHODS = frozenset({"sql", "table", "create_dataframe", "range"})
+
+
+class PooledQuery:
+    """
+    Resultado de `PooledSession.sql()` (ou `table()`, ...): a consulta só é
+    executada nos métodos de leitura, com uma sessão emprestada do pool
+    durante a execução.
+    """
+
+    def __init__(self, owner, args, kwargs, source="sql"):
+        self._owner = owner
+        self._args = args
+        self._kwargs = kwargs
+        self._source = source
+
+    def _frame(self, session):
+        return getattr(session, self._source)(*self._args, **self._kwargs)
+
+    def _run(self, method, *args, **kwargs):
+        with self._owner.lease() as session, sql_span(self._query_text(), method) as span:
+            return record_rows(span, getattr(self._frame(session), method)(*args, **kwargs))
+
+    def _query_text(self):
+        if self._source == "sql" and self._args:
+            return self._args[0]
+        return f"{self._source}({', '.join(map(str, self._args))})"
+
+    def collect(self, *args, **kwargs):
+        return self._run("collect", *args, **kwargs)
+
+    def to_pandas(self, *args, **kwargs):
+        return self._run("to_pandas", *args, **kwargs)
+
+    def first(self, *args, **kwargs):
+        return self._run("first", *args, **kwargs)
+
+    def count(self, *args, **kwargs):
+        return self._run("count", *args, **kwargs)
+
+    def to_pandas_batches(self, *args, **kwargs):
+        # A sessão fica emprestada enquanto os lotes são consumidos
+        with self._owner.lease() as session, sql_span(self._query_text(), "to_pandas_batches"):
+            yield from self._frame(session).to_pandas_batches(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Demais métodos do DataFrame do Snowpark, executados com uma sessão emprestada
+        return lambda *args, **kwargs: self._run(name, *args, **kwargs)
+
+
+class PooledSession:
+    """
+    Sessão entregue ao rerun e às tarefas em segundo plano no lugar de uma
+    sessão Snowpark: não segura conexão nenhuma e empresta uma do pool só
+    durante cada consulta. Pode ser usada por várias threads ao mesmo tempo.
+    """
+
+    def __init__(self, tag="analytical"):
+        self.tag = tag
+
+    @contextmanager
+    def lease(self):
+        """Empresta uma sessão Snowpark (a própria, sem proxy) durante o bloco"""
+        with get_pool_manager().lease(self.tag) as session:
+            yield session
+
+    def sql(self, *args, **kwargs):
+        return PooledQuery(self, args, kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        """Chama `fn(sessão, *args, **kwargs)` com uma sessão emprestada durante a chamada"""
+        with self.lease() as session:
+            return fn(session, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # Demais membros da sessão Snowpark: DataFrames ficam preguiçosos como em
+        # `sql()` e métodos e atributos usam uma sessão emprestada durante o acesso
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name in _LAZY_METHODS:
+            return lambda *args, **kwargs: PooledQuery(self, args, kwargs, source=name)
+        with self.lease() as session:
+            value = getattr(session, name)
+        if not callable(value):
+            return value
+        return lambda *args, **kwargs: self.run(lambda session: getattr(session, name)(*args, **kwargs))
+
+
+def call_with_session(session, fn, *args, **kwargs):
+    """
+    Chama uma função do backend que recebe a sessão como primeiro argumento.
+
+    Com `PooledSession`, a sessão é emprestada do pool apenas durante a
+    chamada; com uma sessão comum (pool desabilitado), ela é usada direto.
+    """
+    if isinstance(session, PooledSession):
+        return session.run(fn, *args, **kwargs)
+    return fn(session, *args, **kwargs)
+
+
+def is_pooled(session):
+    """Indica se cada chamada com a sessão usa uma conexão própria do pool"""
+    return isinstance(session, PooledSession)
+
+
+def open_session(tag="analytical"):
+    """
+    Sessão do rerun, devolvida como `(session, connected)`.
+
+    Com o pool habilitado, devolve uma `PooledSession` (nenhuma conexão fica
+    presa ao rerun); sem pool, a sessão de `init_session()`, como antes.
+    """
+    if not pooling_enabled():
+        return init_session()
+    try:
+        get_pool_manager().get_pool(tag)
+    except Exception:
+        logger.exception("Erro ao abrir o pool '%s'", tag)
+        return None, False
+    return PooledSession(tag), True
+
+
+@contextmanager
+def lease_session(tag="analytical", background=False):
+    """
+    Empresta uma sessão durante a execução do bloco, devolvendo `(session, connected)`.
+
+    Sem pool habilitado, mantém o comportamento anterior com `init_session()`
+    — exceto para tarefas em segundo plano (`background=True`), que recebem
+    `(None, False)`: a sessão de `init_session()` é a mesma usada pelo rerun
+    e não pode ser usada por outra thread ao mesmo tempo.
+    """
+    if not pooling_enabled():
+        yield (None, False) if background else init_session()
+        return
+
+    try:
+        lease = get_pool_manager().lease(tag)
+        session = lease.__enter__()
+    except Exception:
+        logger.exception("Erro ao obter sessão do pool '%s'", tag)
+        yield None, False
+        return
+
+    try:
+        yield session, True
+    except BaseException:
+        # A falha chega ao pool, que decide se a sessão ainda pode voltar
+        if not lease.__exit__(*sys.exc_info()):
+            raise
+    else:
+        lease.__exit__(None, None, None)
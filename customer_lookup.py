@@ -0,0 +1,239 @@
+"""
+Camada de consulta da visão de clientes.
+
+O ramo `customer_details` chamava `process_customer_vision` a cada pergunta,
+varrendo a view de clientes mesmo quando o mesmo cliente já tinha sido
+consultado antes. Aqui os resultados ficam num cache com TTL, indexado pelo
+escopo de permissão (por padrão o usuário, já que a visão pode ser filtrada
+pela carteira de cada consultor), pelo CPF/CNPJ normalizado (ou pelo nome sem
+acentos) e pela pergunta normalizada, já que a resposta depende do que foi
+perguntado. Pedidos simples de visão do cliente ("detalhes do cliente X",
+"cliente X") são reduzidos à mesma chave, que é a usada pela pré-carga da
+carteira do consultor.
+
+A pré-carga roda uma vez por sessão, em segundo plano, e só quando o backend
+oferece `process_customer_vision_batch(session, ids)` — uma única consulta
+para todos os clientes, retornando `{id_customer: resposta}`. Sem ela a
+pré-carga não acontece: chamar `process_customer_vision` cliente a cliente
+custaria uma varredura da view por cliente da carteira.
+"""
+
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+import pandas as pd
+import streamlit as st
+
+from backend_service import get_consultor_suggestions, process_customer_vision
+from concurrency import submit_background
+from connection_pool import call_with_session, is_pooled
+from local_router import find_documents
+from shared_cache import TTLCache
+
+try:
+    from backend_service import process_customer_vision_batch
+except ImportError:
+    process_customer_vision_batch = None
+
+
+logger = logging.getLogger(__name__)
+
+# TTL das consultas de clientes (em segundos)
+CUSTOMER_CACHE_TTL = int(os.getenv("ANALY_CUSTOMER_CACHE_TTL", "3600"))
+
+# Quantidade máxima de clientes em cache
+CUSTOMER_CACHE_MAX_ENTRIES = int(os.getenv("ANALY_CUSTOMER_CACHE_MAX_ENTRIES", "5000"))
+
+# Escopo do cache: "user" (cada usuário vê só o que consultou ou pré-carregou)
+# ou "shared" (entre todos os usuários, quando a visão não é filtrada por permissão)
+CUSTOMER_CACHE_SCOPE = os.getenv("ANALY_CUSTOMER_CACHE_SCOPE", "user")
+
+# Pré-carga da carteira do consultor
+CUSTOMER_PREFETCH_ENABLED = os.getenv("ANALY_CUSTOMER_PREFETCH", "1") == "1"
+CUSTOMER_PREFETCH_MAX = int(os.getenv("ANALY_CUSTOMER_PREFETCH_MAX", "50"))
+
+# Quantidade máxima de consultores com carteira pré-carregada lembrados
+CUSTOMER_PREFETCH_MAX_USERS = 1000
+
+# Marca no `st.session_state` de que a pré-carga já foi avaliada na sessão
+_PREFETCH_DONE_KEY = "_customer_prefetch_done"
+
+_DOC_SEPARATORS_RE = re.compile(r"[.\-/\s]")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_DIGITS_RE = re.compile(r"\b\d+\b")
+
+# Palavras de um pedido simples de visão do cliente, sem outra pergunta
+_LOOKUP_WORDS = frozenset((
+    "a", "o", "de", "do", "da", "dos", "das", "me", "cliente", "detalhe", "detalhes", "visao", "geral",
+    "dados", "informacoes", "sobre", "mostre", "mostra", "mostrar", "ver", "quero", "traga", "busque",
+    "buscar", "consulte", "consultar", "consulta", "cpf", "cnpj", "nome", "por", "favor",
+))
+
+# Chave da pergunta para os pedidos simples (e para a pré-carga)
+VISION_QUESTION = ""
+
+
+def fold_name(name):
+    """Nome em minúsculas, sem acentos e com espaços únicos"""
+    text = unicodedata.normalize("NFKD", str(name).lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def customer_key(id_customer):
+    """
+    Chave normalizada de um identificador de cliente.
+
+    CPF/CNPJ viram apenas dígitos; qualquer outro valor é tratado como nome.
+    """
+    if id_customer is None:
+        return None
+    if isinstance(id_customer, dict):
+        for field in ("cpf", "cnpj", "documento", "nome", "name"):
+            if id_customer.get(field):
+                return customer_key(id_customer[field])
+        return None
+
+    text = str(id_customer).strip()
+    digits = _DOC_SEPARATORS_RE.sub("", text)
+    if digits.isdigit() and len(digits) in (11, 14):
+        return f"doc:{digits}"
+    folded = fold_name(text)
+    return f"nome:{folded}" if folded else None
+
+
+def question_key(user_input, key):
+    """
+    Pergunta normalizada, sem o identificador do cliente.
+
+    Pedidos simples de visão do cliente viram `VISION_QUESTION`; qualquer
+    outra pergunta entra na chave como texto normalizado.
+    """
+    text = fold_name(_PUNCT_RE.sub(" ", str(user_input or "")))
+    if key.startswith("doc:"):
+        text = _DIGITS_RE.sub(" ", text)
+    elif key.startswith("nome:"):
+        text = text.replace(key[len("nome:"):], " ")
+    words = text.split()
+    if all(word in _LOOKUP_WORDS for word in words):
+        return VISION_QUESTION
+    return " ".join(words)
+
+
+def cache_scope(username):
+    """Parte da chave que separa as respostas por permissão"""
+    return "" if CUSTOMER_CACHE_SCOPE == "shared" else str(username or "")
+
+
+class CustomerLookup:
+    """Cache de consultas à visão de clientes, por escopo, cliente e pergunta"""
+
+    def __init__(self, ttl=CUSTOMER_CACHE_TTL, max_entries=CUSTOMER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self._cache = TTLCache(max_entries=max_entries, default_ttl=ttl)
+        # Consultores com carteira já pré-carregada; a verificação e a marcação
+        # acontecem sob o lock, já que as sessões rodam em threads diferentes
+        self._prefetched_users = TTLCache(max_entries=CUSTOMER_PREFETCH_MAX_USERS, default_ttl=ttl)
+        self._prefetch_lock = threading.Lock()
+
+    def get(self, session, user_input, id_customer, username):
+        """Retorna a resposta para a pergunta sobre o cliente, do cache quando possível"""
+        key = customer_key(id_customer)
+        if key is None:
+            return call_with_session(session, process_customer_vision, user_input, id_customer)
+
+        cache_key = (cache_scope(username), key, question_key(user_input, key))
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        processed_response = call_with_session(session, process_customer_vision, user_input, id_customer)
+        if processed_response:
+            self._cache.set(cache_key, processed_response)
+        return processed_response
+
+    def prefetch(self, session, ids, username):
+        """Carrega em segundo plano, numa única consulta, a visão dos clientes que ainda não está em cache"""
+        scope = cache_scope(username)
+        pending = []
+        for id_customer in ids:
+            key = customer_key(id_customer)
+            if key and not self._cache.contains((scope, key, VISION_QUESTION)):
+                pending.append(id_customer)
+        pending = pending[:CUSTOMER_PREFETCH_MAX]
+        if pending:
+            submit_background(self._prefetch_batch, session, pending, scope)
+        return len(pending)
+
+    def _prefetch_batch(self, session, ids, scope):
+        try:
+            responses = call_with_session(session, process_customer_vision_batch, ids)
+        except Exception:
+            logger.exception("Erro ao pré-carregar %d clientes da carteira", len(ids))
+            return
+        for id_customer, processed_response in (responses or {}).items():
+            key = customer_key(id_customer)
+            if key and processed_response:
+                self._cache.set((scope, key, VISION_QUESTION), processed_response)
+
+    def prefetch_consultor_portfolio(self, session, username):
+        """Pré-carrega, uma vez por sessão e por usuário, os clientes da carteira do consultor"""
+        if st.session_state.get(_PREFETCH_DONE_KEY):
+            return 0
+        st.session_state[_PREFETCH_DONE_KEY] = True
+        # Sem consulta em lote não há pré-carga; sem pool, a única sessão não
+        # pode ser usada pela pré-carga em paralelo ao rerun
+        if not CUSTOMER_PREFETCH_ENABLED or process_customer_vision_batch is None or not is_pooled(session):
+            return 0
+        with self._prefetch_lock:
+            if self._prefetched_users.contains(username):
+                return 0
+            self._prefetched_users.set(username, True)
+        try:
+            suggestions = call_with_session(session, get_consultor_suggestions, username)
+        except Exception:
+            logger.exception("Erro ao obter carteira do consultor")
+            return 0
+        return self.prefetch(session, _documents_in(suggestions), username)
+
+    def get_stats(self):
+        stats = self._cache.get_stats()
+        stats["prefetched_users"] = len(self._prefetched_users)
+        return stats
+
+
+def _documents_in(suggestions):
+    """CPFs/CNPJs válidos encontrados no retorno de `get_consultor_suggestions`"""
+    if suggestions is None:
+        return []
+    if isinstance(suggestions, pd.DataFrame):
+        values = suggestions.astype(str).to_numpy().ravel().tolist()
+    elif isinstance(suggestions, dict):
+        values = [str(v) for v in suggestions.values()]
+    elif isinstance(suggestions, (list, tuple)):
+        values = []
+        for item in suggestions:
+            if isinstance(item, dict):
+                values.extend(str(v) for v in item.values())
+            else:
+                values.append(str(item))
+    else:
+        values = [str(suggestions)]
+
+    documents = []
+    for value in values:
+        for doc in find_documents(value):
+            if doc not in documents:
+                documents.append(doc)
+    return documents
+
+
+_customer_lookup = CustomerLookup()
+
+
+def get_customer_lookup():
+    """Retorna a camada de consulta de clientes do processo"""
+    return _customer_lookup
@@ -0,0 +1,321 @@
+"""
+Exportação de resultados em CSV, CSV compactado (gzip) e Parquet.
+
+Cada botão "📥 Baixar CSV" codificava o resultado inteiro em memória já na
+renderização, mesmo sem clique. Aqui o botão de download recebe uma função
+que o Streamlit só executa no clique, numa thread separada do rerun: o
+arquivo é gravado em lotes num arquivo temporário, lido para o download e
+apagado em seguida. Por padrão a exportação traz o resultado armazenado na
+sessão (o mesmo exibido na mensagem); opcionalmente, marcado na interface, a
+consulta da mensagem é executada de novo no warehouse, com uma sessão do
+pool, para trazer o resultado completo. Temporários deixados por um processo
+interrompido são apagados depois de `ANALY_EXPORT_FILE_TTL` segundos, numa
+varredura do diretório a cada exportação. Cada exportação registra linhas,
+tamanho e vazão.
+"""
+
+import gzip
+import importlib.util
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+
+from connection_pool import lease_session
+
+
+logger = logging.getLogger(__name__)
+
+# `pyarrow.parquet` só é importado na primeira exportação em Parquet
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+
+EXPORT_DIR = os.getenv("ANALY_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "analy_exports"))
+
+# Idade a partir da qual um temporário de exportação abandonado é apagado (em segundos)
+EXPORT_FILE_TTL = int(os.getenv("ANALY_EXPORT_FILE_TTL", "3600"))
+
+# Linhas por lote ao exportar resultados já carregados na sessão
+EXPORT_CHUNK_ROWS = int(os.getenv("ANALY_EXPORT_CHUNK_ROWS", "50000"))
+
+# Quantidade de exportações mantidas nas estatísticas
+EXPORT_STATS_SIZE = 200
+
+# formato -> (rótulo, extensão, mime)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "csv", "text/csv"),
+    "csv.gz": ("CSV compactado (gzip)", "csv.gz", "application/gzip"),
+}
+if PARQUET_AVAILABLE:
+    EXPORT_FORMATS["parquet"] = ("Parquet", "parquet", "application/vnd.apache.parquet")
+
+_stats = deque(maxlen=EXPORT_STATS_SIZE)
+_stats_lock = threading.Lock()
+
+
+class ExportResult:
+    """Arquivo exportado e as métricas da exportação"""
+
+    def __init__(self, path, fmt, rows, nbytes, seconds, source):
+        self.path = path
+        self.fmt = fmt
+        self.rows = rows
+        self.nbytes = nbytes
+        self.seconds = seconds
+        self.source = source
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.nbytes / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "format": self.fmt,
+            "rows": self.rows,
+            "bytes": self.nbytes,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "mb_per_second": round(self.mb_per_second, 2),
+            "source": self.source,
+        }
+
+
+# ----------------------------------------------------------------------
+# Escritores por formato
+# ----------------------------------------------------------------------
+
+class _CsvWriter:
+    def __init__(self, path, compress=False):
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="") if compress else \
+            open(path, "w", encoding="utf-8", newline="")
+        self._header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self._file, index=False, header=self._header)
+        self._header = False
+
+    def close(self, columns=None):
+        # Resultado vazio: grava ao menos o cabeçalho
+        if self._header and columns is not None:
+            pd.DataFrame(columns=columns).to_csv(self._file, index=False)
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        self._path = path
+        self._writer = None
+        self._schema = None
+
+    def write(self, chunk):
+        table = self._pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = self._pq.ParquetWriter(self._path, self._schema)
+        elif table.schema != self._schema:
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+
+    def close(self, columns=None):
+        if self._writer is None:
+            self._pq.write_table(self._pa.Table.from_pandas(pd.DataFrame(columns=columns or [])), self._path)
+            return
+        self._writer.close()
+
+
+def _open_writer(path, fmt):
+    if fmt == "csv":
+        return _CsvWriter(path)
+    if fmt == "csv.gz":
+        return _CsvWriter(path, compress=True)
+    if fmt == "parquet":
+        return _ParquetWriter(path)
+    raise ValueError(f"Formato de exportação não suportado: {fmt}")
+
+
+# ----------------------------------------------------------------------
+# Fontes de dados
+# ----------------------------------------------------------------------
+
+def _warehouse_batches(session, sql):
+    """Lotes do resultado da consulta direto do warehouse"""
+    df = session.sql(sql)
+    if hasattr(df, "to_pandas_batches"):
+        yield from df.to_pandas_batches()
+    else:
+        yield df.to_pandas()
+
+
+def _frame_batches(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Lotes de um resultado já carregado; colunas `category` voltam a texto"""
+    categorical = df.select_dtypes("category").columns
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        if len(categorical):
+            chunk = chunk.astype({col: object for col in categorical})
+        yield chunk
+
+
+def _write(batches, path, fmt):
+    writer = _open_writer(path, fmt)
+    rows, columns = 0, None
+    try:
+        for chunk in batches:
+            if columns is None:
+                columns = list(chunk.columns)
+            if len(chunk):
+                writer.write(chunk)
+                rows += len(chunk)
+    finally:
+        writer.close(columns)
+    return rows
+
+
+def _cleanup_expired(directory=EXPORT_DIR, ttl=EXPORT_FILE_TTL):
+    now = time.time()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def export_result(fmt, sql=None, df=None, session=None):
+    """
+    Gera o arquivo de exportação e retorna um `ExportResult`.
+
+    Com `sql`, a consulta é executada novamente (com `session` ou com uma
+    sessão emprestada do pool "export") e gravada em lotes; se falhar, ou sem
+    SQL, exporta `df` (DataFrame ou função sem argumentos que o carrega).
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _cleanup_expired()
+    path = os.path.join(EXPORT_DIR, f"{uuid.uuid4().hex}.{EXPORT_FORMATS[fmt][1]}")
+
+    start = time.perf_counter()
+    rows, source = None, None
+    if sql:
+        try:
+            if session is not None:
+                rows = _write(_warehouse_batches(session, sql), path, fmt)
+            else:
+                with lease_session("export", background=True) as (export_session, connected):
+                    if connected:
+                        rows = _write(_warehouse_batches(export_session, sql), path, fmt)
+            source = "warehouse" if rows is not None else None
+        except Exception:
+            logger.exception("Erro ao exportar do warehouse, usando o resultado da sessão")
+            rows = None
+
+    if rows is None:
+        if callable(df):
+            df = df()
+        if df is None:
+            raise ValueError("Nada para exportar: sem SQL executável e sem resultado na sessão")
+        rows = _write(_frame_batches(df), path, fmt)
+        source = "session"
+
+    result = ExportResult(path, fmt, rows, os.path.getsize(path), time.perf_counter() - start, source)
+    with _stats_lock:
+        _stats.append(result.as_dict())
+    logger.info(
+        "Exportação %s (%s): %d linhas, %.1f KB em %.2fs (%.2f MB/s)",
+        fmt, source, rows, result.nbytes / 1024, result.seconds, result.mb_per_second
+    )
+    return result
+
+
+def export_bytes(fmt, sql=None, df=None):
+    """Conteúdo da exportação; o arquivo temporário é apagado depois da leitura"""
+    try:
+        result = export_result(fmt, sql=sql, df=df)
+    except Exception:
+        logger.exception("Erro ao exportar")
+        raise
+    try:
+        return _read_file(result.path)
+    finally:
+        try:
+            os.remove(result.path)
+        except OSError:
+            pass
+
+
+def get_export_stats():
+    """Resumo das últimas exportações por formato"""
+    with _stats_lock:
+        stats = list(_stats)
+    summary = {}
+    for item in stats:
+        fmt = summary.setdefault(item["format"], {"exports": 0, "rows": 0, "bytes": 0, "seconds": 0.0})
+        fmt["exports"] += 1
+        fmt["rows"] += item["rows"]
+        fmt["bytes"] += item["bytes"]
+        fmt["seconds"] += item["seconds"]
+    for fmt in summary.values():
+        fmt["mb_per_second"] = fmt["bytes"] / (1024 * 1024) / fmt["seconds"] if fmt["seconds"] else 0.0
+    return summary
+
+
+# ----------------------------------------------------------------------
+# Interface
+# ----------------------------------------------------------------------
+
+def show_export_controls(render_entry, key, sql=None, file_name="dados"):
+    """
+    Formato + botão de download; o arquivo só é gerado quando o botão é clicado.
+
+    `key` identifica os widgets da mensagem.
+    """
+    rerun_sql = False
+    if sql:
+        rerun_sql = st.checkbox(
+            "Consulta completa (executa o SQL de novo no warehouse)", key=f"export_full_{key}",
+            help="Sem esta opção, o arquivo traz o resultado exibido na mensagem."
+        )
+    col_format, col_action = st.columns([2, 1])
+    with col_format:
+        fmt = st.selectbox(
+            "Formato:", list(EXPORT_FORMATS), format_func=lambda f: EXPORT_FORMATS[f][0],
+            key=f"export_format_{key}", label_visibility="collapsed"
+        )
+
+    # A função roda fora do rerun: tudo o que ela usa é resolvido aqui
+    export_sql = sql if rerun_sql else None
+    load_df = render_entry.frame_loader()
+    label, extension, mime = EXPORT_FORMATS[fmt]
+    with col_action:
+        st.download_button(
+            label=f"📥 Baixar {label}",
+            data=lambda: export_bytes(fmt, sql=export_sql, df=load_df),
+            file_name=f"{file_name}.{extension}",
+            mime=mime,
+            key=f"download_{key}",
+            use_container_width=True
+        )
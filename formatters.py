@@ -0,0 +1,388 @@
+"""
+Formatação vetorizada de DataFrames para exibição (padrão brasileiro).
+
+`format_dataframe_display` era aplicado a cada mensagem e a cada mudança de
+página, formatando célula a célula (R$, separador de milhar com ".", máscaras
+de CPF/CNPJ, datas) — lento em tabelas largas. Aqui os papéis das colunas são
+inferidos uma única vez por resultado e cada coluna recebe um formatador
+compilado com operações vetorizadas de NumPy/pandas, sem laço Python por
+linha. O esquema inferido fica guardado junto com o resultado armazenado.
+
+A paridade com `format_dataframe_display` é conferida em cada resultado: as
+primeiras linhas formatadas passam pelas duas funções e só as colunas em que
+os textos coincidem usam o formatador vetorizado; as demais continuam com
+`format_dataframe_display` (`benchmarks/check_formatters.py` faz a mesma
+conferência fora do app). Datas em texto são lidas com formatos fixos (ISO ou
+dia/mês/ano, nunca mês/dia), valores que não puderem ser lidos são exibidos
+como vieram e percentuais são exibidos no valor que a consulta trouxe.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+VECTOR_FORMATTER_ENABLED = os.getenv("ANALY_VECTOR_FORMATTER", "1") == "1"
+
+# Palavras no nome da coluna que indicam cada papel
+CURRENCY_TERMS = ("VALOR", "VL_", "VLR", "RECEITA", "FATURAMENTO", "PRECO", "TICKET", "SALDO", "R$", "CUSTO")
+PERCENT_TERMS = ("PERC", "PCT", "%", "TAXA", "MARGEM")
+CPF_TERMS = ("CPF",)
+CNPJ_TERMS = ("CNPJ",)
+DOCUMENT_TERMS = ("DOCUMENTO", "NR_DOC", "CPF_CNPJ", "CPFCNPJ")
+DATE_TERMS = ("DATA", "DT_", "_DT")
+ID_TERMS = ("ID_", "_ID", "CODIGO", "COD_", "ANO", "MES")
+
+ROLE_CURRENCY = "currency"
+ROLE_PERCENT = "percent"
+ROLE_CPF = "cpf"
+ROLE_CNPJ = "cnpj"
+ROLE_DOCUMENT = "document"
+ROLE_DATE = "date"
+ROLE_INTEGER = "integer"
+ROLE_DECIMAL = "decimal"
+ROLE_RAW = "raw"
+
+# Formatos aceitos para datas em texto, na ordem de tentativa (nunca mês/dia)
+DATE_FORMATS = (
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f",
+    "%d/%m/%Y", "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S",
+)
+
+
+def _name_has(name, terms):
+    upper = str(name).upper()
+    return any(term in upper for term in terms)
+
+
+def parse_dates(series):
+    """
+    Datas de uma coluna: colunas datetime são usadas direto; textos são lidos
+    com o primeiro formato de `DATE_FORMATS` que aceita todos os valores (NaT
+    onde nenhum formato serve).
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    present = series.notna()
+    best = None
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(series, format=fmt, errors="coerce")
+        if parsed[present].notna().all():
+            return parsed
+        if best is None or parsed.notna().sum() > best.notna().sum():
+            best = parsed
+    return best if best is not None else pd.to_datetime(series, errors="coerce")
+
+
+def infer_column_role(name, series):
+    """Infere o papel de exibição de uma coluna pelo nome e pelo tipo"""
+    if _name_has(name, DOCUMENT_TERMS):
+        return ROLE_DOCUMENT
+    if _name_has(name, CNPJ_TERMS):
+        return ROLE_CNPJ
+    if _name_has(name, CPF_TERMS):
+        return ROLE_CPF
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return ROLE_DATE
+    if pd.api.types.is_bool_dtype(series):
+        return ROLE_RAW
+    if pd.api.types.is_numeric_dtype(series):
+        if _name_has(name, CURRENCY_TERMS):
+            return ROLE_CURRENCY
+        if _name_has(name, PERCENT_TERMS):
+            return ROLE_PERCENT
+        if _name_has(name, ID_TERMS):
+            return ROLE_RAW
+        if pd.api.types.is_integer_dtype(series):
+            return ROLE_INTEGER
+        return ROLE_DECIMAL
+    if _name_has(name, DATE_TERMS) and not pd.api.types.is_numeric_dtype(series):
+        sample = series.dropna().head(20)
+        if len(sample) and parse_dates(sample).notna().all():
+            return ROLE_DATE
+    return ROLE_RAW
+
+
+def infer_schema(df):
+    """Papéis de todas as colunas do resultado: `{coluna: papel}`"""
+    return {col: infer_column_role(col, df[col]) for col in df.columns}
+
+
+# ----------------------------------------------------------------------
+# Primitivas vetorizadas
+#
+# Os textos são montados como matrizes (linhas x caracteres) de códigos
+# Unicode, calculadas com aritmética inteira sobre as colunas inteiras, e
+# convertidas de uma vez para um array de strings. O código 0 marca posição
+# vazia (removida no fim).
+# ----------------------------------------------------------------------
+
+_ZERO = ord("0")
+
+# Maior valor inteiro formatado com segurança em int64
+_MAX_INT = 10 ** 17
+
+
+def _chars_to_text(chars):
+    """Matriz de códigos alinhada à direita -> array de textos"""
+    chars = np.ascontiguousarray(chars, dtype=np.uint32)
+    rows, width = chars.shape
+    if width == 0:
+        return np.full(rows, "", dtype="<U1")
+    # Desloca cada linha para a esquerda pela quantidade de vazios iniciais
+    # (os vazios ficam sempre à esquerda dos caracteres preenchidos)
+    leading = width - np.count_nonzero(chars, axis=1)
+    index = np.arange(width) + leading[:, None]
+    shifted = np.take_along_axis(chars, np.minimum(index, width - 1), axis=1)
+    shifted[index >= width] = 0
+    return np.ascontiguousarray(shifted).view(f"<U{width}").ravel()
+
+
+def _constant(rows, char):
+    return np.full((rows, 1), ord(char), dtype=np.uint32)
+
+
+def _padded_digits(values, width):
+    """Inteiros não negativos -> matriz de `width` dígitos, com zeros à esquerda"""
+    values = np.asarray(values, dtype=np.int64)
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return ((values[:, None] // powers) % 10 + _ZERO).astype(np.uint32)
+
+
+def _digit_width(values):
+    values = np.asarray(values, dtype=np.int64)
+    return len(str(int(values.max()))) if values.size else 1
+
+
+def _grouped_digits(values):
+    """Inteiros não negativos -> matriz alinhada à direita com "." a cada 3 dígitos"""
+    values = np.asarray(values, dtype=np.int64)
+    width = _digit_width(values)
+    digits = _padded_digits(values, width)
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    # Zeros à esquerda viram vazios (a casa das unidades sempre aparece)
+    digits[:, :-1][values[:, None] < powers[:-1]] = 0
+
+    dots = (width - 1) // 3
+    total = width + dots
+    out = np.zeros((len(values), total), dtype=np.uint32)
+    from_right = np.arange(width)
+    out[:, total - 1 - (from_right + from_right // 3)] = digits[:, width - 1 - from_right]
+    for k in range(1, dots + 1):
+        out[:, total - 4 * k] = np.where(digits[:, width - 1 - 3 * k] != 0, ord("."), 0)
+    return out
+
+
+def _pattern_chars(values, pattern):
+    """Inteiros -> matriz seguindo `pattern`, onde cada "#" consome um dígito (ex.: "###.###")"""
+    digits = _padded_digits(values, pattern.count("#"))
+    columns, next_digit = [], 0
+    for char in pattern:
+        if char == "#":
+            columns.append(digits[:, next_digit:next_digit + 1])
+            next_digit += 1
+        else:
+            columns.append(_constant(len(digits), char))
+    return np.hstack(columns)
+
+
+def _as_float(values):
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=float, na_value=np.nan)
+    return pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+def _keep_unparsed(text, original, parsed_missing):
+    """Mantém o texto original onde havia valor que não pôde ser lido (vazio só para nulos)"""
+    original = pd.Series(original)
+    unparsed = parsed_missing & original.notna().to_numpy()
+    if not unparsed.any():
+        return np.where(parsed_missing, "", text)
+    return np.where(unparsed, original.astype(str).to_numpy(dtype=str), np.where(parsed_missing, "", text))
+
+
+def format_number_br(values, decimals=2, prefix="", suffix=""):
+    """Números -> texto no padrão brasileiro (1.234,56), vazio para nulos"""
+    numeric = _as_float(values)
+    missing = np.isnan(numeric)
+    filled = np.where(missing, 0.0, numeric)
+
+    scale = 10 ** decimals
+    if np.abs(filled).max(initial=0) * scale >= _MAX_INT:
+        raise ValueError("valor grande demais para a formatação vetorizada")
+    scaled = np.rint(np.abs(filled) * scale).astype(np.int64)
+
+    body = _grouped_digits(scaled // scale)
+    if decimals:
+        body = np.hstack([body, _constant(len(body), ","), _padded_digits(scaled % scale, decimals)])
+    text = _chars_to_text(body)
+
+    negative = (filled < 0) & (scaled > 0)
+    if prefix or negative.any():
+        text = np.char.add(np.where(negative, "-" + prefix, prefix), text)
+    if suffix:
+        text = np.char.add(text, suffix)
+    return _keep_unparsed(text, values, missing)
+
+
+_CPF_PATTERN = "###.###.###-##"
+_CNPJ_PATTERN = "##.###.###/####-##"
+
+# Quantidade de dígitos aceita para cada documento (zeros à esquerda podem ter
+# se perdido quando a coluna veio numérica)
+CPF_DIGITS = (9, 11)
+CNPJ_DIGITS = (12, 14)
+
+
+def _document_digits(series):
+    """`(valor inteiro, quantidade de dígitos, texto original)` de cada documento"""
+    if pd.api.types.is_numeric_dtype(series):
+        numeric = pd.to_numeric(series, errors="coerce").round()
+        valid = numeric.notna() & (numeric.abs() < _MAX_INT)
+        values = numeric.where(valid, 0).abs().to_numpy(dtype=np.int64)
+        lengths = np.where(valid, np.char.str_len(values.astype(str)), 0)
+        original = np.where(valid, values.astype(str), "")
+        return values, lengths, original
+
+    text = series.astype("string")
+    digits = text.str.replace(r"\D", "", regex=True)
+    lengths = digits.str.len().fillna(0).to_numpy(dtype=np.int64)
+    plausible = (lengths > 0) & (lengths <= CNPJ_DIGITS[1])
+    values = pd.to_numeric(digits.where(plausible, "0"), errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+    return values, lengths, text.fillna("").to_numpy(dtype=str)
+
+
+def _format_documents(series, use_cpf, use_cnpj):
+    values, lengths, original = _document_digits(series)
+    is_cpf = use_cpf & (lengths >= CPF_DIGITS[0]) & (lengths <= CPF_DIGITS[1])
+    is_cnpj = use_cnpj & (lengths >= CNPJ_DIGITS[0]) & (lengths <= CNPJ_DIGITS[1])
+
+    # Valores que não parecem documento são exibidos como vieram
+    out = original
+    if is_cpf.any():
+        out = np.where(is_cpf, _chars_to_text(_pattern_chars(values, _CPF_PATTERN)), out)
+    if is_cnpj.any():
+        out = np.where(is_cnpj, _chars_to_text(_pattern_chars(values, _CNPJ_PATTERN)), out)
+    return out
+
+
+def format_cpf(series):
+    return _format_documents(series, use_cpf=True, use_cnpj=False)
+
+
+def format_cnpj(series):
+    return _format_documents(series, use_cpf=False, use_cnpj=True)
+
+
+def format_document(series):
+    """CPF ou CNPJ, decidido pela quantidade de dígitos de cada valor"""
+    return _format_documents(series, use_cpf=True, use_cnpj=True)
+
+
+def format_date(series):
+    """Datas -> dd/mm/aaaa (com hh:mm quando alguma linha tem horário)"""
+    dates = parse_dates(series)
+    missing = dates.isna().to_numpy()
+    parts = {
+        attr: getattr(dates.dt, attr).fillna(0).to_numpy(dtype=np.int64)
+        for attr in ("day", "month", "year", "hour", "minute")
+    }
+
+    rows = len(dates)
+    columns = [
+        _padded_digits(parts["day"], 2), _constant(rows, "/"),
+        _padded_digits(parts["month"], 2), _constant(rows, "/"),
+        _padded_digits(parts["year"], 4),
+    ]
+    if (parts["hour"] != 0).any() or (parts["minute"] != 0).any():
+        columns += [
+            _constant(rows, " "), _padded_digits(parts["hour"], 2),
+            _constant(rows, ":"), _padded_digits(parts["minute"], 2),
+        ]
+    return _keep_unparsed(_chars_to_text(np.hstack(columns)), series, missing)
+
+
+def format_percent(series):
+    # O valor é exibido como veio da consulta, sem adivinhar se é fração
+    return format_number_br(series, decimals=2, suffix="%")
+
+
+_FORMATTERS = {
+    ROLE_CURRENCY: lambda s: format_number_br(s, decimals=2, prefix="R$ "),
+    ROLE_PERCENT: format_percent,
+    ROLE_CPF: format_cpf,
+    ROLE_CNPJ: format_cnpj,
+    ROLE_DOCUMENT: format_document,
+    ROLE_DATE: format_date,
+    ROLE_INTEGER: lambda s: format_number_br(s, decimals=0),
+    ROLE_DECIMAL: lambda s: format_number_br(s, decimals=2),
+}
+
+
+class CompiledFormatter:
+    """Formatadores por coluna compilados a partir de um esquema inferido"""
+
+    def __init__(self, schema):
+        self.schema = dict(schema)
+        self._column_formatters = {
+            col: _FORMATTERS[role] for col, role in self.schema.items() if role in _FORMATTERS
+        }
+
+    def __call__(self, df):
+        out = df.copy()
+        for col, formatter in self._column_formatters.items():
+            if col in out.columns:
+                out[col] = formatter(out[col])
+        return out
+
+
+def compile_formatter(df_or_schema):
+    """Compila o formatador a partir de um DataFrame (inferindo o esquema) ou de um esquema"""
+    schema = df_or_schema if isinstance(df_or_schema, dict) else infer_schema(df_or_schema)
+    return CompiledFormatter(schema)
+
+
+def diverging_columns(expected, actual):
+    """Colunas em que os textos de `actual` diferem dos de `expected` (referência)"""
+    return [
+        col for col in expected.columns
+        if col not in actual.columns
+        or not np.array_equal(expected[col].astype(str).to_numpy(), actual[col].astype(str).to_numpy())
+    ]
+
+
+class VerifiedFormatter:
+    """
+    Formatador vetorizado conferido contra a formatação de referência: na
+    primeira chamada as duas formatam as linhas recebidas e, dali em diante,
+    só as colunas que coincidiram usam o formatador vetorizado; as demais
+    são formatadas pela referência.
+    """
+
+    def __init__(self, schema, reference):
+        self.schema = dict(schema)
+        self.reference = reference
+        self.reference_columns = None
+        self._vectorized = None
+
+    def __call__(self, df):
+        if self.reference_columns is None:
+            return self._verify(df)
+        out = self._vectorized(df)
+        columns = [col for col in self.reference_columns if col in df.columns]
+        if columns:
+            formatted = self.reference(df[columns].copy())
+            for col in columns:
+                out[col] = formatted[col]
+        return out
+
+    def _verify(self, df):
+        expected = self.reference(df.copy())
+        diverging = diverging_columns(expected, CompiledFormatter(self.schema)(df))
+        self.reference_columns = diverging
+        self._vectorized = CompiledFormatter(
+            {col: role for col, role in self.schema.items() if col not in diverging}
+        )
+        return expected
@@ -0,0 +1,326 @@
+"""
+Navegador paginado do histórico de conversas.
+
+A sidebar chamava `display_history_modal(session, username)` a cada rerun,
+lendo todo o histórico do usuário na tabela de logs; para quem tem milhares de
+turnos, era a parte mais lenta da página. Aqui a lista de sessões vem de uma
+tabela de índice com uma linha por sessão de conversa (`ANALY_SESSION_INDEX_TABLE`),
+mantida pela fila de logs a cada lote gravado, e é lida por keyset (sessões
+mais recentes primeiro, mais páginas sob demanda), sem agregar a tabela de
+logs. As páginas ficam em cache e só são invalidadas quando a fila de logs
+grava um turno novo do usuário; as mensagens de uma sessão só são lidas quando
+ela é aberta, e as respostas do assistente voltam completas (dados e gráficos)
+a partir da coluna de payload do log.
+
+A tabela de índice é criada na primeira leitura ou gravação, se não existir
+(`python startup.py --ddl` mostra o DDL e o comando que a preenche a partir
+dos logs já gravados). Se o navegador estiver desabilitado, sem as tabelas
+configuradas ou se a consulta falhar (a falha fica em cache por um tempo, para
+que os reruns seguintes não a repitam), a sidebar oferece o modal antigo sob
+demanda, por um botão, em vez de lê-lo a cada rerun.
+"""
+
+import json
+import logging
+import os
+import threading
+
+import streamlit as st
+
+from connection_pool import call_with_session
+from frontend_ui import display_history_modal
+from log_queue import CREATE_TABLES, LOG_COLUMNS, LOG_TABLE, add_batch_listener, add_write_listener
+from render_cache import get_render_cache
+from result_store import compact_message, get_result_store
+from shared_cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+
+HISTORY_BROWSER_ENABLED = os.getenv("ANALY_HISTORY_BROWSER", "1") == "1"
+
+# Tabela de índice com uma linha por sessão de conversa (USERNAME, SESSION_ID,
+# STARTED_AT, LAST_AT, TURNS, TITLE), mantida a partir dos lotes da fila de logs
+SESSION_INDEX_TABLE = os.getenv("ANALY_SESSION_INDEX_TABLE", "ANALY_CONVERSATION_SESSIONS")
+
+HISTORY_PAGE_SIZE = int(os.getenv("ANALY_HISTORY_PAGE_SIZE", "15"))
+HISTORY_CACHE_TTL = int(os.getenv("ANALY_HISTORY_CACHE_TTL", "3600"))
+
+# Por quanto tempo, após uma falha, o usuário fica no modal antigo (em segundos)
+HISTORY_FAILURE_TTL = int(os.getenv("ANALY_HISTORY_FAILURE_TTL", "600"))
+
+# Tamanho do título da sessão (primeira pergunta) exibido na lista
+TITLE_MAX_CHARS = 60
+
+_pages = TTLCache(max_entries=5000, default_ttl=HISTORY_CACHE_TTL)
+_failures = TTLCache(max_entries=10000, default_ttl=HISTORY_FAILURE_TTL)
+_versions = {}
+_versions_lock = threading.Lock()
+_index_ready = False
+
+
+def history_browser_available():
+    """Indica se o navegador está habilitado e tudo o que ele lê está configurado"""
+    return bool(HISTORY_BROWSER_ENABLED and LOG_TABLE and LOG_COLUMNS["payload"] and SESSION_INDEX_TABLE)
+
+
+def _version(username):
+    with _versions_lock:
+        return _versions.get(username, 0)
+
+
+def invalidate_user_history(username, role=None):
+    """Invalida as páginas em cache do usuário (chamado a cada log gravado)"""
+    with _versions_lock:
+        _versions[username] = _versions.get(username, 0) + 1
+
+
+def _session_summaries(records):
+    """Resumo por (usuário, sessão) de um lote de registros do log"""
+    summaries = {}
+    for record in records:
+        session_id = record.get("state", {}).get("session_id")
+        if not session_id:
+            continue
+        created_at = record["created_at"]
+        summary = summaries.get((record["username"], session_id))
+        if summary is None:
+            summary = summaries[(record["username"], session_id)] = {
+                "started_at": created_at, "last_at": created_at, "turns": 0, "title": None,
+            }
+        summary["started_at"] = min(summary["started_at"], created_at)
+        summary["last_at"] = max(summary["last_at"], created_at)
+        summary["turns"] += 1
+        if summary["title"] is None and record["role"] == "user" and record["message"]:
+            summary["title"] = str(record["message"])[:TITLE_MAX_CHARS]
+    return summaries
+
+
+def session_index_ddl():
+    """DDL da tabela de índice de sessões"""
+    return f"""CREATE TABLE IF NOT EXISTS {SESSION_INDEX_TABLE} (
+    USERNAME VARCHAR,
+    SESSION_ID VARCHAR,
+    STARTED_AT TIMESTAMP_NTZ,
+    LAST_AT TIMESTAMP_NTZ,
+    TURNS NUMBER,
+    TITLE VARCHAR
+)"""
+
+
+def ensure_session_index(session):
+    """Cria a tabela de índice uma vez por processo (com `ANALY_CREATE_TABLES`)"""
+    global _index_ready
+    if _index_ready or not CREATE_TABLES:
+        return
+    session.sql(session_index_ddl()).collect()
+    _index_ready = True
+
+
+def update_session_index(records, session):
+    """Atualiza a tabela de índice com os registros de um lote gravado (um único MERGE)"""
+    if not history_browser_available():
+        return
+    summaries = _session_summaries(records)
+    if not summaries:
+        return
+    ensure_session_index(session)
+    params = []
+    for (username, session_id), summary in summaries.items():
+        params += [username, session_id, summary["started_at"], summary["last_at"], summary["turns"], summary["title"]]
+    values = ", ".join("(?, ?, ?, ?, ?, ?)" for _ in summaries)
+    session.sql(
+        f"""
+        MERGE INTO {SESSION_INDEX_TABLE} t
+        USING (
+            SELECT column1 AS USERNAME, column2 AS SESSION_ID, column3 AS STARTED_AT,
+                   column4 AS LAST_AT, column5 AS TURNS, column6 AS TITLE
+            FROM VALUES {values}
+        ) s
+        ON t.USERNAME = s.USERNAME AND t.SESSION_ID = s.SESSION_ID
+        WHEN MATCHED THEN UPDATE SET
+            LAST_AT = GREATEST(t.LAST_AT, s.LAST_AT),
+            TURNS = t.TURNS + s.TURNS,
+            TITLE = COALESCE(t.TITLE, s.TITLE)
+        WHEN NOT MATCHED THEN INSERT (USERNAME, SESSION_ID, STARTED_AT, LAST_AT, TURNS, TITLE)
+            VALUES (s.USERNAME, s.SESSION_ID, s.STARTED_AT, s.LAST_AT, s.TURNS, s.TITLE)
+        """,
+        params=params
+    ).collect()
+
+
+def session_index_backfill_sql():
+    """Comando que recria a tabela de índice a partir da tabela de logs"""
+    c = LOG_COLUMNS
+    return f"""INSERT OVERWRITE INTO {SESSION_INDEX_TABLE} (USERNAME, SESSION_ID, STARTED_AT, LAST_AT, TURNS, TITLE)
+SELECT
+    {c['username']},
+    {c['session_id']},
+    MIN({c['created_at']}),
+    MAX({c['created_at']}),
+    COUNT(*),
+    MIN_BY(
+        IFF({c['role']} = 'user', LEFT({c['message']}, {TITLE_MAX_CHARS}), NULL),
+        IFF({c['role']} = 'user', {c['created_at']}, NULL)
+    )
+FROM {LOG_TABLE}
+WHERE {c['session_id']} IS NOT NULL
+GROUP BY {c['username']}, {c['session_id']}"""
+
+
+def backfill_session_index(session):
+    """
+    Recria a tabela de índice a partir da tabela de logs (uma única vez, na
+    implantação; depois ela é mantida pela fila de logs).
+    """
+    ensure_session_index(session)
+    session.sql(session_index_backfill_sql()).collect()
+
+
+add_write_listener(invalidate_user_history)
+add_batch_listener(update_session_index)
+
+
+def _page_query(with_cursor):
+    cursor_filter = "AND (LAST_AT < ? OR (LAST_AT = ? AND SESSION_ID < ?))" if with_cursor else ""
+    return f"""
+        SELECT SESSION_ID, STARTED_AT, LAST_AT, TURNS, TITLE
+        FROM {SESSION_INDEX_TABLE}
+        WHERE USERNAME = ?
+        {cursor_filter}
+        ORDER BY LAST_AT DESC, SESSION_ID DESC
+        LIMIT {HISTORY_PAGE_SIZE + 1}
+    """
+
+
+def fetch_session_page(session, username, cursor=None):
+    """
+    Retorna `(sessões, próximo_cursor)` de uma página do histórico.
+
+    O cursor é o par `(LAST_AT, SESSION_ID)` da última sessão da página
+    anterior; `próximo_cursor` é `None` quando não há mais páginas.
+    """
+    key = (username, _version(username), cursor)
+    cached = _pages.get(key)
+    if cached is not None:
+        return cached
+
+    ensure_session_index(session)
+    params = [username]
+    if cursor is not None:
+        params += [cursor[0], cursor[0], cursor[1]]
+    rows = session.sql(_page_query(cursor is not None), params=params).collect()
+
+    sessions = [
+        {
+            "session_id": row["SESSION_ID"],
+            "started_at": row["STARTED_AT"],
+            "last_at": row["LAST_AT"],
+            "turns": row["TURNS"],
+            "title": row["TITLE"] or "Conversa sem título",
+        }
+        for row in rows[:HISTORY_PAGE_SIZE]
+    ]
+    next_cursor = None
+    if len(rows) > HISTORY_PAGE_SIZE and sessions:
+        next_cursor = (sessions[-1]["last_at"], sessions[-1]["session_id"])
+
+    result = (sessions, next_cursor)
+    _pages.set(key, result)
+    return result
+
+
+def _restore_message(row):
+    """Mensagem do assistente completa a partir do payload, com dados e gráficos no store"""
+    payload = row["PAYLOAD"]
+    if payload:
+        try:
+            msg = json.loads(payload) if isinstance(payload, str) else dict(payload)
+        except (TypeError, ValueError):
+            msg = None
+        if isinstance(msg, dict):
+            return compact_message(msg)
+    return {"role": "assistant", "content": row["MESSAGE"] or ""}
+
+
+def fetch_session_messages(session, username, session_id):
+    """Lê as mensagens de uma sessão (apenas quando ela é aberta)"""
+    c = LOG_COLUMNS
+    rows = session.sql(
+        f"""
+        SELECT {c['role']} AS ROLE, {c['message']} AS MESSAGE, {c['payload']} AS PAYLOAD
+        FROM {LOG_TABLE}
+        WHERE {c['username']} = ? AND {c['session_id']} = ?
+        ORDER BY {c['created_at']}
+        """,
+        params=[username, session_id]
+    ).collect()
+
+    messages = []
+    for row in rows:
+        if row["ROLE"] == "user":
+            messages.append({"role": "user", "content": [{"type": "text", "text": row["MESSAGE"]}]})
+        else:
+            messages.append(_restore_message(row))
+    return messages
+
+
+def _open_session(session, username, summary):
+    get_render_cache().clear()
+    get_result_store().clear()
+    st.session_state.pop("expanded_history", None)
+    st.session_state.messages = fetch_session_messages(session, username, summary["session_id"])
+    st.session_state.agent_messages = []
+    st.session_state["session_id"] = summary["session_id"]
+    st.session_state["session_loaded"] = True
+    st.session_state["loaded_session_info"] = {
+        "session_id": summary["session_id"],
+        "started_at": summary["started_at"],
+        "turns": summary["turns"],
+        "title": summary["title"],
+    }
+    st.session_state["show_history"] = False
+
+
+def _show_history_modal_button(session, username):
+    """Modal antigo, lido apenas quando o usuário pede (não a cada rerun)"""
+    if st.button("Abrir histórico", key="history_modal", use_container_width=True):
+        call_with_session(session, display_history_modal, username)
+
+
+def show_history_browser(session, username):
+    """Lista paginada de conversas na sidebar; oferece o modal antigo se indisponível ou se a consulta falhar"""
+    if not history_browser_available() or _failures.contains(username):
+        _show_history_modal_button(session, username)
+        return
+
+    pages_to_show = st.session_state.setdefault("history_pages", 1)
+
+    sessions, cursor = [], None
+    try:
+        for _ in range(pages_to_show):
+            page, cursor = fetch_session_page(session, username, cursor)
+            sessions.extend(page)
+            if cursor is None:
+                break
+    except Exception:
+        logger.exception("Erro ao carregar histórico paginado; usando o modal por %ds", HISTORY_FAILURE_TTL)
+        _failures.set(username, True)
+        _show_history_modal_button(session, username)
+        return
+
+    if not sessions:
+        st.caption("Nenhuma conversa anterior.")
+        return
+
+    for summary in sessions:
+        when = summary["last_at"].strftime("%d/%m %H:%M") if hasattr(summary["last_at"], "strftime") else ""
+        label = f"{summary['title']} · {when}" if when else summary["title"]
+        if st.button(label, key=f"history_{summary['session_id']}", use_container_width=True):
+            _open_session(session, username, summary)
+            st.rerun()
+
+    if cursor is not None and st.button("Carregar mais", key="history_more", use_container_width=True):
+        st.session_state.history_pages = pages_to_show + 1
+        st.rerun()
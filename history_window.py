@@ -0,0 +1,106 @@
+"""
+Janela de renderização do histórico do chat.
+
+Renderizar todas as mensagens a cada rerun faz o tempo de resposta crescer com
+o tamanho da conversa. Aqui apenas os últimos N turnos são renderizados por
+completo; os turnos anteriores viram um resumo leve em um único elemento e
+podem ser expandidos sob demanda.
+"""
+
+import os
+import time
+
+import streamlit as st
+
+from backend_service import extract_message_text
+
+
+# Quantidade de turnos (pergunta + resposta) renderizados por completo
+HISTORY_WINDOW_TURNS = int(os.getenv("ANALY_HISTORY_WINDOW_TURNS", "5"))
+
+# Tamanho máximo do trecho exibido no resumo de cada mensagem
+SUMMARY_MAX_CHARS = 120
+
+# Quantidade de medições de tempo de renderização mantidas por sessão
+RENDER_TIMINGS_KEEP = 50
+
+
+def split_history(messages, window_turns=HISTORY_WINDOW_TURNS):
+    """
+    Retorna o índice da primeira mensagem dentro da janela.
+
+    Um turno começa em uma mensagem do usuário; mensagens antes do início do
+    N-ésimo turno mais recente ficam fora da janela.
+    """
+    if window_turns <= 0:
+        return 0
+
+    turns_seen = 0
+    for idx in range(len(messages) - 1, -1, -1):
+        if messages[idx]["role"] == "user":
+            turns_seen += 1
+            if turns_seen == window_turns:
+                return idx
+    return 0
+
+
+def summarize_message(msg):
+    """Resumo de uma linha de uma mensagem, sem montar DataFrames nem gráficos"""
+    if msg["role"] == "user":
+        text = extract_message_text(msg["content"])
+    elif msg.get("ordered", False):
+        processed_resp = msg.get("processed_response", {})
+        text = next(
+            (processed_resp.get(k, "") for k in msg.get("order_sequence", []) if k.startswith("text_")),
+            ""
+        )
+    else:
+        text = msg.get("content") or msg.get("interpretation") or msg.get("error") or ""
+
+    text = " ".join(str(text).split())
+    if len(text) > SUMMARY_MAX_CHARS:
+        text = text[:SUMMARY_MAX_CHARS].rstrip() + "…"
+
+    if msg["role"] != "user" and (msg.get("data") is not None or msg.get("order_sequence")):
+        text += " 📊"
+    return text
+
+
+# Chave da sessão com as linhas de resumo já montadas
+_SUMMARY_CACHE_KEY = "_history_summary_lines"
+
+
+def _summary_line(idx, msg):
+    icon = "🧑‍💻" if msg["role"] == "user" else "🤖"
+    return f"{idx + 1}. {icon} {summarize_message(msg)}"
+
+
+def build_history_summary(messages, end):
+    """
+    Monta o markdown de resumo das mensagens anteriores à janela.
+
+    As linhas ficam na sessão, associadas à lista de mensagens: a cada rerun só
+    as mensagens que entraram no resumo desde o último são resumidas.
+    """
+    cache = st.session_state.get(_SUMMARY_CACHE_KEY)
+    if cache is None or cache["messages_id"] != id(messages) or len(cache["lines"]) > len(messages):
+        # Nova conversa ou histórico carregado: recomeça o resumo
+        cache = {"messages_id": id(messages), "lines": []}
+        st.session_state[_SUMMARY_CACHE_KEY] = cache
+
+    lines = cache["lines"]
+    for idx in range(len(lines), end):
+        lines.append(_summary_line(idx, messages[idx]))
+    return "\n".join(lines[:end])
+
+
+def record_render_time(elapsed_ms, total_messages, rendered_messages):
+    """Guarda o tempo de renderização do rerun para acompanhar a meta de tempo constante"""
+    timings = st.session_state.setdefault("render_timings", [])
+    timings.append({
+        "elapsed_ms": elapsed_ms,
+        "total_messages": total_messages,
+        "rendered_messages": rendered_messages,
+        "timestamp": time.time(),
+    })
+    del timings[:-RENDER_TIMINGS_KEEP]
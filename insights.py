@@ -0,0 +1,240 @@
+"""
+Geração de insights em segundo plano, com reuso por conteúdo do resultado.
+
+`generate_insights(session, df, user_question)` ficava atrás de um botão por
+mensagem, rodava de forma síncrona dentro de um spinner (bloqueando o rerun)
+e recebia o DataFrame inteiro. Aqui o botão "Gerar Insights" dispara uma
+tarefa em segundo plano (com `ANALY_INSIGHTS_AUTO=1`, a tarefa começa assim
+que chega uma resposta com gráfico, sem esperar o clique): o resultado é
+resumido localmente com estatísticas vetorizadas por coluna e só esse perfil
+compacto vai para o modelo. O texto fica em cache no processo pela impressão
+digital do conteúdo do resultado e pela pergunta normalizada — o mesmo
+resultado para a mesma pergunta, de qualquer usuário, reaproveita os mesmos
+insights (com uma única geração em andamento por chave). A interface consulta
+a tarefa num fragmento com `run_every`, sem bloquear o rerun da página; se a
+geração falhar, a mensagem mostra um aviso.
+
+A tarefa usa uma sessão emprestada do pool; sem pool, a única sessão é a do
+rerun e o botão não é exibido.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+from answer_cache import normalize_question
+from backend_service import MESSAGES, generate_insights
+from concurrency import submit_background
+from connection_pool import lease_session, pooling_enabled
+from result_store import resolve_result
+from shared_cache import RefreshingCache
+
+
+logger = logging.getLogger(__name__)
+
+
+INSIGHTS_ENABLED = os.getenv("ANALY_BACKGROUND_INSIGHTS", "1") == "1"
+
+# Gera os insights de toda resposta com gráfico, sem esperar o clique
+INSIGHTS_AUTO = os.getenv("ANALY_INSIGHTS_AUTO", "0") == "1"
+
+# Validade dos insights em cache (em segundos)
+INSIGHTS_CACHE_TTL = int(os.getenv("ANALY_INSIGHTS_CACHE_TTL", "3600"))
+
+# Intervalo de consulta da interface à tarefa em andamento (em segundos)
+INSIGHTS_POLL_SECONDS = float(os.getenv("ANALY_INSIGHTS_POLL_SECONDS", "1.5"))
+
+# Colunas e valores mais frequentes incluídos no perfil enviado ao modelo
+PROFILE_MAX_COLUMNS = 40
+PROFILE_TOP_VALUES = 5
+
+_insights_cache = RefreshingCache(
+    default_ttl=INSIGHTS_CACHE_TTL,
+    refresh_ahead=0,
+    stale_ttl=0,
+    submit_fn=submit_background
+)
+
+_stats = {"jobs": 0, "generated": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+# Perfil e impressão digital do resultado
+# ----------------------------------------------------------------------
+
+def data_fingerprint(df):
+    """Hash do conteúdo do resultado (colunas, tipos e valores), independente do índice"""
+    digest = hashlib.sha1()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _top_values(series):
+    counts = series.value_counts(dropna=True).head(PROFILE_TOP_VALUES)
+    return ", ".join(f"{value} ({count})" for value, count in counts.items())
+
+
+def profile_frame(df):
+    """
+    Perfil compacto do resultado, uma linha por coluna: tipo, nulos, valores
+    distintos, estatísticas das colunas numéricas/datas e os valores mais
+    frequentes das demais.
+    """
+    df = df.iloc[:, :PROFILE_MAX_COLUMNS]
+    categorical = df.select_dtypes("category").columns
+    if len(categorical):
+        df = df.astype({col: object for col in categorical})
+
+    numeric = df.select_dtypes("number")
+    dates = df.select_dtypes(["datetime", "datetimetz"])
+    stats = numeric.describe(percentiles=[0.25, 0.5, 0.75]).T if len(numeric.columns) else pd.DataFrame()
+
+    rows = []
+    nulls = df.isna().sum()
+    distinct = df.nunique(dropna=True)
+    for col in df.columns:
+        row = {
+            "COLUNA": str(col),
+            "TIPO": str(df[col].dtype),
+            "LINHAS": len(df),
+            "NULOS": int(nulls[col]),
+            "DISTINTOS": int(distinct[col]),
+        }
+        if col in stats.index:
+            described = stats.loc[col]
+            row.update({
+                "MINIMO": described["min"], "P25": described["25%"], "MEDIANA": described["50%"],
+                "P75": described["75%"], "MAXIMO": described["max"], "MEDIA": described["mean"],
+                "DESVIO": described["std"], "SOMA": numeric[col].sum(),
+            })
+        elif col in dates.columns:
+            row.update({"MINIMO": str(dates[col].min()), "MAXIMO": str(dates[col].max())})
+        else:
+            row["MAIS_FREQUENTES"] = _top_values(df[col])
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# ----------------------------------------------------------------------
+# Tarefas
+# ----------------------------------------------------------------------
+
+def _generate(df, user_question):
+    """Perfil + chamada ao modelo com uma sessão emprestada do pool"""
+    profile = profile_frame(df)
+    with lease_session("analytical", background=True) as (session, connected):
+        if not connected:
+            raise RuntimeError("sem sessão disponível para gerar insights")
+        insights = generate_insights(session, profile, user_question)
+    with _stats_lock:
+        _stats["generated"] += 1
+    return insights
+
+
+def _run_job(df, user_question):
+    try:
+        key = (data_fingerprint(df), normalize_question(user_question or ""))
+        return _insights_cache.get_or_load(key, lambda: _generate(df, user_question))
+    except Exception:
+        with _stats_lock:
+            _stats["errors"] += 1
+        raise
+
+
+def _jobs():
+    return st.session_state.setdefault("insight_jobs", {})
+
+
+def start_insights(data, user_question):
+    """
+    Dispara a geração dos insights de um resultado (referência do
+    `result_store` ou DataFrame) e retorna o id da tarefa, guardado na
+    mensagem em `insights_job`; `None` se não houver o que gerar.
+    """
+    if not INSIGHTS_ENABLED or not pooling_enabled():
+        return None
+    df = resolve_result(data)
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return None
+    job_id = uuid.uuid4().hex
+    _jobs()[job_id] = submit_background(_run_job, df, user_question)
+    with _stats_lock:
+        _stats["jobs"] += 1
+    return job_id
+
+
+def prepare_insights(msg, user_question):
+    """Guarda na mensagem a pergunta dos insights e, com `INSIGHTS_AUTO`, já dispara a tarefa"""
+    msg["insights_question"] = user_question
+    if INSIGHTS_AUTO:
+        msg["insights_job"] = start_insights(msg["data"], user_question)
+
+
+def get_insights_stats():
+    stats = dict(_stats)
+    stats["cache"] = _insights_cache.get_stats()
+    return stats
+
+
+# ----------------------------------------------------------------------
+# Interface
+# ----------------------------------------------------------------------
+
+def _show_text(insights):
+    st.markdown("---")
+    st.markdown("### 💡 Insights Identificados")
+    st.markdown(insights)
+
+
+@st.fragment(run_every=INSIGHTS_POLL_SECONDS)
+def _poll_job(job_id):
+    """Reexecutado a cada intervalo; ao terminar a tarefa, atualiza a página inteira"""
+    future = _jobs().get(job_id)
+    if future is not None and future.done():
+        st.rerun()
+    st.caption(f"⏳ {MESSAGES['generating_insights']}")
+
+
+def show_insights(msg, key):
+    """Exibe os insights da mensagem, o botão que os gera ou acompanha a tarefa em andamento"""
+    if msg.get("insights"):
+        _show_text(msg["insights"])
+        return
+    if msg.get("insights_error"):
+        st.warning(msg["insights_error"])
+        return
+
+    job_id = msg.get("insights_job")
+    future = _jobs().get(job_id) if job_id else None
+    if future is None:
+        if not INSIGHTS_ENABLED or not pooling_enabled():
+            return
+        if not st.button("💡 Gerar Insights", key=f"insight_btn_{key}"):
+            return
+        job_id = msg["insights_job"] = start_insights(msg.get("data"), msg.get("insights_question", ""))
+        future = _jobs().get(job_id) if job_id else None
+        if future is None:
+            return
+    if not future.done():
+        _poll_job(job_id)
+        return
+
+    _jobs().pop(job_id, None)
+    msg["insights_job"] = None
+    try:
+        msg["insights"] = future.result()
+    except Exception:
+        logger.exception("Erro ao gerar insights")
+        msg["insights_error"] = "⚠️ Não foi possível gerar os insights desta resposta."
+        st.warning(msg["insights_error"])
+        return
+    if msg["insights"]:
+        _show_text(msg["insights"])
@@ -0,0 +1,189 @@
+"""
+Pré-classificador local e determinístico das perguntas.
+
+`classify_user_intent` e `extract_cpf_or_name_from_text` fazem chamadas
+remotas mesmo quando a decisão é trivial: uma mensagem com CPF/CNPJ válido
+(dígitos verificadores conferidos) é claramente uma consulta de
+`customer_details`. Este módulo resolve esses casos localmente com
+expressões regulares compiladas na importação, validação dos dígitos
+verificadores e regras de palavras-chave, e devolve `None` quando não tem
+confiança suficiente, para que a chamada remota seja feita.
+
+Palavras-chave analíticas sozinhas não bastam ("faturamento da Padaria X" é
+sobre um cliente): a pergunta só é classificada localmente como analítica
+quando todas as suas palavras pertencem a um vocabulário fechado (termos
+analíticos, palavras de ligação, períodos e dimensões conhecidas) — ou seja,
+quando não sobra nada que possa ser nome de cliente.
+
+Contrato com o `backend_service` (que não faz parte deste repositório):
+
+- a intenção local usa os mesmos valores de `classify_user_intent`
+  (`"customer_details"` e `"general"`);
+- o identificador local de um CPF/CNPJ é a string só com os dígitos, que
+  `process_customer_vision` recebe no lugar do retorno de
+  `extract_cpf_or_name_from_text`. Se o backend implantado esperar outra
+  forma (o `main()` original testava `"nome" in id_customer`, indício de um
+  retorno rotulado para nomes), use `ANALY_LOCAL_EXTRACT=0`: a intenção
+  continua local e o identificador volta a vir sempre do backend;
+- numa pergunta analítica local o identificador é `""`: o app só usa o
+  identificador em `customer_details`, então a extração remota é dispensada.
+"""
+
+import os
+import re
+import threading
+import unicodedata
+
+
+CUSTOMER_INTENT = "customer_details"
+ANALYTICS_INTENT = "general"
+
+# Usa o CPF/CNPJ encontrado localmente como identificador do cliente (ver contrato acima)
+LOCAL_EXTRACT_ENABLED = os.getenv("ANALY_LOCAL_EXTRACT", "1") == "1"
+
+# CPF: 000.000.000-00 ou 11 dígitos; CNPJ: 00.000.000/0000-00 ou 14 dígitos
+_CPF_RE = re.compile(r"(?<!\d)(\d{3}\.?\d{3}\.?\d{3}-?\d{2})(?!\d)")
+_CNPJ_RE = re.compile(r"(?<!\d)(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})(?!\d)")
+_NON_DIGIT_RE = re.compile(r"\D")
+
+# Perguntas que mencionam clientes/documentos sem número válido ficam para o modelo
+_CUSTOMER_TERMS_RE = re.compile(r"\b(cliente|clientes|cpf|cnpj|consultor|visao|detalhe|detalhes)\b")
+
+# Perguntas agregadas típicas, resolvidas pelo agent sem consulta de cliente
+ANALYTICS_TERMS = frozenset((
+    "faturamento", "receita", "total", "ranking", "top", "media", "evolucao", "comparativo", "mensal",
+    "anual", "quantidade", "volume", "churn", "vendas", "percentual",
+))
+
+# Demais palavras aceitas numa pergunta analítica resolvida localmente (sem acentos)
+GENERIC_TERMS = frozenset((
+    # ligação e pedidos
+    "a", "o", "as", "os", "um", "uma", "de", "do", "da", "dos", "das", "em", "no", "na", "nos", "nas",
+    "por", "pelo", "pela", "para", "com", "e", "ou", "qual", "quais", "quanto", "quantos", "quantas",
+    "como", "foi", "foram", "esta", "estao", "me", "mostre", "mostra", "mostrar", "liste", "listar",
+    "traga", "ver", "quero", "gostaria", "cada", "geral", "todos", "todas", "entre", "contra", "vs",
+    "versus", "ate", "mais", "menos", "maior", "maiores", "menor", "menores", "melhores", "piores",
+    # períodos
+    "dia", "dias", "semana", "semanas", "mes", "meses", "trimestre", "trimestres", "semestre",
+    "semestres", "ano", "anos", "hoje", "ontem", "atual", "passado", "passada", "anterior", "ultimo",
+    "ultimos", "ultima", "ultimas", "este", "esse", "essa", "deste", "desta", "desse", "dessa",
+    "periodo", "janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho", "agosto",
+    "setembro", "outubro", "novembro", "dezembro",
+    # dimensões
+    "produto", "produtos", "regiao", "regioes", "estado", "estados", "uf", "cidade", "cidades",
+    "segmento", "segmentos", "canal", "canais", "categoria", "categorias", "filial", "filiais",
+    "plano", "planos",
+))
+
+_WORD_RE = re.compile(r"\w+")
+
+# Números curtos (anos, "top 10") são aceitos; números longos podem identificar clientes
+_SHORT_NUMBER_RE = re.compile(r"\d{1,4}")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "local_intent": 0,
+    "remote_intent": 0,
+    "local_extract": 0,
+    "remote_extract": 0,
+}
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _check_digit(digits, weights):
+    total = sum(int(d) * w for d, w in zip(digits, weights))
+    rest = total % 11
+    return "0" if rest < 2 else str(11 - rest)
+
+
+def is_valid_cpf(value):
+    """Valida um CPF pelos dígitos verificadores"""
+    digits = _NON_DIGIT_RE.sub("", value)
+    if len(digits) != 11 or digits == digits[0] * 11:
+        return False
+    first = _check_digit(digits[:9], range(10, 1, -1))
+    second = _check_digit(digits[:10], range(11, 1, -1))
+    return digits[9:] == first + second
+
+
+def is_valid_cnpj(value):
+    """Valida um CNPJ pelos dígitos verificadores"""
+    digits = _NON_DIGIT_RE.sub("", value)
+    if len(digits) != 14 or digits == digits[0] * 14:
+        return False
+    weights = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    first = _check_digit(digits[:12], weights)
+    second = _check_digit(digits[:13], [6] + weights)
+    return digits[12:] == first + second
+
+
+def find_documents(text):
+    """Retorna os CPFs/CNPJs válidos do texto, apenas dígitos, na ordem em que aparecem"""
+    found = []
+    for match in _CNPJ_RE.finditer(text):
+        if is_valid_cnpj(match.group(1)):
+            found.append((match.start(), _NON_DIGIT_RE.sub("", match.group(1))))
+    for match in _CPF_RE.finditer(text):
+        if is_valid_cpf(match.group(1)):
+            found.append((match.start(), _NON_DIGIT_RE.sub("", match.group(1))))
+    return [doc for _, doc in sorted(found)]
+
+
+def is_closed_analytics_question(text):
+    """
+    Indica se a pergunta é analítica e não tem nenhuma palavra fora do
+    vocabulário conhecido (que poderia ser nome de cliente).
+    """
+    words = _WORD_RE.findall(_fold(text))
+    if not words or not ANALYTICS_TERMS.intersection(words):
+        return False
+    return all(
+        word in ANALYTICS_TERMS or word in GENERIC_TERMS or _SHORT_NUMBER_RE.fullmatch(word)
+        for word in words
+    )
+
+
+def has_customer_hint(text):
+    """Indica se a pergunta menciona cliente/documento (válido ou não)"""
+    folded = _fold(text)
+    return bool(_CUSTOMER_TERMS_RE.search(folded) or _CPF_RE.search(text) or _CNPJ_RE.search(text))
+
+
+def classify_locally(text):
+    """
+    Tenta decidir intenção e identificador do cliente sem chamadas remotas.
+
+    Retorna `(intent, id_customer)`; cada item é `None` quando a regra local
+    não tem confiança e a chamada remota deve ser feita.
+    """
+    documents = find_documents(text)
+    if len(documents) == 1:
+        return CUSTOMER_INTENT, documents[0] if LOCAL_EXTRACT_ENABLED else None
+
+    if has_customer_hint(text):
+        return None, None
+
+    if is_closed_analytics_question(text):
+        # Pergunta agregada sem nada que possa ser cliente: não há identificador a extrair
+        return ANALYTICS_INTENT, ""
+
+    return None, None
+
+
+def count_call(stage, local):
+    """Contabiliza uma decisão local ou remota de uma etapa ("intent" ou "extract")"""
+    name = f"{'local' if local else 'remote'}_{stage}"
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_router_stats():
+    """Contadores de decisões locais vs. remotas (chamadas remotas evitadas)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["remote_calls_avoided"] = stats["local_intent"] + stats["local_extract"]
+    return stats
@@ -0,0 +1,499 @@
+"""
+Fila assíncrona de gravação do log de conversas.
+
+O `main()` registrava cada turno chamando `save_conversation_log` de forma
+síncrona (usuário e assistente), pagando um round-trip ao Snowflake antes do
+`st.rerun()`. Aqui os registros entram numa fila limitada em memória e uma
+thread de fundo os grava em lotes, por tamanho ou por tempo, e no encerramento
+do processo. Se o warehouse estiver indisponível, o lote é gravado num arquivo
+local append-only e reenviado na próxima gravação bem-sucedida.
+
+Tudo o que o log precisa (usuário, `session_id` e demais chaves de
+`ANALY_LOG_STATE_KEYS`, horário do turno) é resolvido no enfileiramento, na
+thread do rerun: uma conversa nova recebe ali o seu `session_id`, gravado no
+`st.session_state`, para que todos os turnos dela compartilhem o mesmo id. A
+thread de gravação só recebe valores simples e nunca lê o `st.session_state`,
+que pode já ter mudado (nova conversa, histórico aberto) quando o lote é
+gravado.
+
+Cada lote vira um único INSERT de várias linhas em `ANALY_LOG_TABLE`, criada
+na primeira gravação se ainda não existir (`python startup.py --ddl` mostra o
+DDL). Com `ANALY_LOG_TABLE` vazia, os turnos voltam a ser gravados por
+`save_conversation_log`, de forma síncrona no rerun, já que o backend lê o
+`st.session_state` da sessão.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+from backend_service import save_conversation_log
+from connection_pool import get_pool_manager, pooling_enabled
+
+logger = logging.getLogger(__name__)
+
+
+# Configurações (podem ser sobrescritas por variáveis de ambiente)
+LOG_QUEUE_MAX_SIZE = int(os.getenv("ANALY_LOG_QUEUE_MAX_SIZE", "1000"))
+LOG_BATCH_SIZE = int(os.getenv("ANALY_LOG_BATCH_SIZE", "20"))
+LOG_FLUSH_INTERVAL = float(os.getenv("ANALY_LOG_FLUSH_INTERVAL", "2.0"))
+LOG_SPILL_FILE = os.getenv("ANALY_LOG_SPILL_FILE", "conversation_log_spill.jsonl")
+
+# Chaves do `st.session_state` copiadas no enfileiramento, separadas por vírgula
+LOG_STATE_KEYS = [key.strip() for key in os.getenv("ANALY_LOG_STATE_KEYS", "session_id").split(",") if key.strip()]
+
+# Tabela de logs para a gravação em lote; vazia, usa `save_conversation_log` no rerun
+LOG_TABLE = os.getenv("ANALY_LOG_TABLE", "ANALY_CONVERSATION_LOG")
+
+# Cria as tabelas do app (logs, índice de sessões) na primeira gravação, se não existirem
+CREATE_TABLES = os.getenv("ANALY_CREATE_TABLES", "1") == "1"
+
+# Colunas da tabela de logs; colunas com nome vazio não são gravadas
+LOG_COLUMNS = {
+    "username": os.getenv("ANALY_LOG_COL_USERNAME", "USERNAME"),
+    "session_id": os.getenv("ANALY_LOG_COL_SESSION_ID", "SESSION_ID"),
+    "role": os.getenv("ANALY_LOG_COL_ROLE", "ROLE"),
+    "message": os.getenv("ANALY_LOG_COL_MESSAGE", "MESSAGE"),
+    "sql_query": os.getenv("ANALY_LOG_COL_SQL_QUERY", "SQL_QUERY"),
+    "has_data": os.getenv("ANALY_LOG_COL_HAS_DATA", "HAS_DATA"),
+    "error_message": os.getenv("ANALY_LOG_COL_ERROR_MESSAGE", "ERROR_MESSAGE"),
+    "thinking_log": os.getenv("ANALY_LOG_COL_THINKING_LOG", "THINKING_LOG"),
+    "created_at": os.getenv("ANALY_LOG_COL_CREATED_AT", "CREATED_AT"),
+    # Mensagem completa do assistente (JSON); vazia, não é gravada
+    "payload": os.getenv("ANALY_LOG_COL_PAYLOAD", "PAYLOAD"),
+}
+
+# Tipos das colunas no DDL da tabela de logs
+_LOG_COLUMN_TYPES = {
+    "username": "VARCHAR",
+    "session_id": "VARCHAR",
+    "role": "VARCHAR",
+    "message": "VARCHAR",
+    "sql_query": "VARCHAR",
+    "has_data": "BOOLEAN",
+    "error_message": "VARCHAR",
+    "thinking_log": "VARCHAR",
+    "created_at": "TIMESTAMP_NTZ",
+    "payload": "VARCHAR",
+}
+
+
+def _json_default(value):
+    """Serializa tipos não nativos (datas, DataFrames) para o arquivo de contingência"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "to_dict"):
+        try:
+            return value.to_dict(orient="records")
+        except TypeError:
+            return value.to_dict()
+    return str(value)
+
+
+class ConversationLogQueue:
+    """Fila limitada drenada por uma thread que grava os logs em lotes"""
+
+    def __init__(self, writer=None, max_size=LOG_QUEUE_MAX_SIZE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, spill_file=LOG_SPILL_FILE):
+        self.writer = writer or write_log_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "quarantined": 0,
+        }
+
+        self._worker = threading.Thread(target=self._run, name="analy-log-writer", daemon=True)
+        self._worker.start()
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def enqueue(self, session, username, role, message, **kwargs):
+        """
+        Enfileira um registro com a mesma assinatura de `save_conversation_log`.
+
+        Chamado na thread do rerun: o estado da sessão usado pelo log é
+        resolvido e copiado agora, no rerun que gerou o turno.
+        """
+        record = {
+            "session": session,
+            "username": username,
+            "role": role,
+            "message": message,
+            "kwargs": kwargs,
+            "state": capture_state(),
+            "created_at": datetime.now(),
+            "enqueued_at": time.time(),
+        }
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Fila cheia: não bloqueia o rerun, o registro vai direto para o disco
+            self._spill([record])
+            return
+
+        self._inc("enqueued")
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_requested.set()
+
+    def flush(self, timeout=10.0):
+        """Força a gravação dos registros pendentes e aguarda a fila esvaziar"""
+        self._flush_requested.set()
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    def shutdown(self, timeout=10.0):
+        """Encerra a thread gravando o que ainda estiver na fila"""
+        self._stop.set()
+        self._flush_requested.set()
+        self._worker.join(timeout)
+
+    def get_metrics(self):
+        """Retorna métricas da fila para dimensionamento (profundidade, lotes, latência)"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["avg_flush_ms"] = (
+            metrics["total_flush_ms"] / metrics["batches"] if metrics["batches"] else 0.0
+        )
+        return metrics
+
+    # ------------------------------------------------------------------
+    # Thread de gravação
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+
+            try:
+                self._drain()
+            except Exception:
+                # A thread não pode morrer: os registros seguintes continuam sendo gravados
+                logger.exception("Erro inesperado na gravação de logs")
+
+            if self._stop.is_set() and self._queue.empty():
+                break
+
+    def _drain(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if not batch:
+                return
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if len(batch) < self.batch_size:
+                return
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            self.writer(batch)
+        except Exception:
+            logger.exception("Erro ao gravar lote de logs (%d registros)", len(batch))
+            self._spill(batch)
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._metrics_lock:
+            self._metrics["written"] += len(batch)
+            self._metrics["batches"] += 1
+            self._metrics["last_batch_size"] = len(batch)
+            self._metrics["max_batch_size"] = max(self._metrics["max_batch_size"], len(batch))
+            self._metrics["last_flush_ms"] = elapsed_ms
+            self._metrics["max_flush_ms"] = max(self._metrics["max_flush_ms"], elapsed_ms)
+            self._metrics["total_flush_ms"] += elapsed_ms
+
+        # Warehouse respondeu: reenvia o que ficou pendente em disco
+        self._replay_spill(batch[0]["session"])
+
+    # ------------------------------------------------------------------
+    # Arquivo de contingência
+    # ------------------------------------------------------------------
+
+    def _spill(self, batch):
+        with self._spill_lock:
+            try:
+                with open(self.spill_file, "a", encoding="utf-8") as f:
+                    for record in batch:
+                        if record.get("written"):
+                            continue
+                        line = {k: v for k, v in record.items() if k not in ("session", "written")}
+                        f.write(json.dumps(line, default=_json_default, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.exception("Erro ao gravar arquivo de contingência de logs")
+                return
+        self._inc("spilled", sum(1 for record in batch if not record.get("written")))
+
+    def _replay_spill(self, session):
+        pending_path = self.spill_file + ".replay"
+        with self._spill_lock:
+            # Um `.replay` que sobrou de um reenvio interrompido é reenviado antes
+            if not os.path.exists(pending_path):
+                if not os.path.exists(self.spill_file):
+                    return
+                try:
+                    os.replace(self.spill_file, pending_path)
+                except OSError:
+                    return
+
+        try:
+            records = self._read_spill(pending_path)
+        except OSError:
+            logger.exception("Erro ao ler o arquivo de contingência de logs")
+            return
+
+        for record in records:
+            record["session"] = session
+            record.setdefault("state", {})
+            record.setdefault("kwargs", {})
+
+        try:
+            for start in range(0, len(records), self.batch_size):
+                self.writer(records[start:start + self.batch_size])
+        except Exception:
+            logger.exception("Erro ao reenviar logs pendentes")
+            self._spill(records)
+        finally:
+            os.remove(pending_path)
+        self._inc("replayed", sum(1 for record in records if record.get("written")))
+
+    def _read_spill(self, path):
+        """
+        Registros do arquivo de contingência, linha a linha. Linhas truncadas ou
+        inválidas vão para `<arquivo>.bad` e não impedem o reenvio das demais.
+        """
+        records, bad = [], []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    if {"username", "role", "message"} - record.keys():
+                        raise KeyError("registro incompleto")
+                    record["created_at"] = datetime.fromisoformat(record["created_at"])
+                except (ValueError, TypeError, KeyError):
+                    bad.append(line if line.endswith("\n") else line + "\n")
+                    continue
+                records.append(record)
+
+        if bad:
+            logger.error("%d linha(s) inválida(s) no arquivo de contingência de logs; movidas para %s.bad",
+                         len(bad), self.spill_file)
+            try:
+                with self._spill_lock, open(self.spill_file + ".bad", "a", encoding="utf-8") as f:
+                    f.writelines(bad)
+            except OSError:
+                logger.exception("Erro ao gravar as linhas inválidas do arquivo de contingência")
+            self._inc("quarantined", len(bad))
+        return records
+
+    def _inc(self, name, value=1):
+        with self._metrics_lock:
+            self._metrics[name] += value
+
+
+def ensure_session_id():
+    """
+    `session_id` da conversa atual, criado no `st.session_state` se ainda não
+    existir (conversa nova, após "Nova Conversa"); chamado na thread do rerun.
+    """
+    session_id = st.session_state.get("session_id")
+    if not session_id:
+        session_id = st.session_state["session_id"] = str(uuid.uuid4())
+    return session_id
+
+
+def capture_state():
+    """Valores das chaves de `LOG_STATE_KEYS` do `st.session_state` do rerun atual"""
+    ensure_session_id()
+    return {key: st.session_state[key] for key in LOG_STATE_KEYS if key in st.session_state}
+
+
+def write_log_batch(batch):
+    """
+    Grava um lote de registros.
+
+    Registros gravados são marcados com `written`, para que uma falha no meio do
+    lote mande para o arquivo de contingência apenas o que faltou. Com o pool
+    de conexões habilitado, o lote usa uma sessão do pool de logs, separado das
+    consultas analíticas.
+    """
+    if pooling_enabled():
+        with get_pool_manager().lease("logging") as session:
+            _write_records(batch, session)
+    else:
+        _write_records(batch, None)
+
+
+def _write_records(batch, session):
+    session = session or batch[0]["session"]
+    ensure_log_table(session)
+    _insert_records(batch, session)
+    _notify_write_listeners(batch)
+    _notify_batch_listeners(batch, session)
+
+
+def log_table_ddl():
+    """DDL da tabela de logs, com as colunas de `LOG_COLUMNS`"""
+    columns = ",\n    ".join(
+        f"{column} {_LOG_COLUMN_TYPES[name]}" for name, column in LOG_COLUMNS.items() if column
+    )
+    return f"CREATE TABLE IF NOT EXISTS {LOG_TABLE} (\n    {columns}\n)"
+
+
+_log_table_ready = False
+
+
+def ensure_log_table(session):
+    """Cria a tabela de logs uma vez por processo (com `ANALY_CREATE_TABLES`)"""
+    global _log_table_ready
+    if _log_table_ready or not CREATE_TABLES:
+        return
+    try:
+        session.sql(log_table_ddl()).collect()
+    except Exception:
+        # Sem permissão de DDL: a gravação segue e, se a tabela faltar, o lote vai para o disco
+        logger.exception("Erro ao criar a tabela de logs %s", LOG_TABLE)
+        return
+    _log_table_ready = True
+
+
+def _record_values(record):
+    kwargs = record["kwargs"]
+    payload = kwargs.get("assistant_msg_dict")
+    values = {
+        "username": record["username"],
+        "session_id": record.get("state", {}).get("session_id"),
+        "role": record["role"],
+        "message": record["message"],
+        "sql_query": kwargs.get("sql_query"),
+        "has_data": bool(kwargs.get("has_data", False)),
+        "error_message": kwargs.get("error_message"),
+        "thinking_log": kwargs.get("thinking_log"),
+        "created_at": record["created_at"],
+        "payload": json.dumps(payload, default=_json_default, ensure_ascii=False) if payload else None,
+    }
+    return [values[name] for name, column in LOG_COLUMNS.items() if column]
+
+
+def _insert_records(batch, session):
+    """Lote inteiro num único INSERT de várias linhas em `LOG_TABLE`"""
+    columns = [column for column in LOG_COLUMNS.values() if column]
+    row = "(" + ", ".join("?" for _ in columns) + ")"
+    params = []
+    for record in batch:
+        params.extend(_record_values(record))
+    session.sql(
+        f"INSERT INTO {LOG_TABLE} ({', '.join(columns)}) VALUES {', '.join(row for _ in batch)}",
+        params=params
+    ).collect()
+    for record in batch:
+        record["written"] = True
+
+
+_write_listeners = []
+
+
+def add_write_listener(listener):
+    """Registra uma função chamada com `(username, role)` após cada log gravado"""
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+
+
+def _notify_write_listeners(batch):
+    for record in batch:
+        if not record.get("written"):
+            continue
+        for listener in _write_listeners:
+            try:
+                listener(record["username"], record["role"])
+            except Exception:
+                logger.exception("Erro ao notificar gravação de log")
+
+
+_batch_listeners = []
+
+
+def add_batch_listener(listener):
+    """
+    Registra uma função chamada com `(registros, sessão)` após cada lote
+    gravado, com a mesma sessão da gravação (apenas os registros gravados)
+    """
+    if listener not in _batch_listeners:
+        _batch_listeners.append(listener)
+
+
+def _notify_batch_listeners(batch, session):
+    written = [record for record in batch if record.get("written")]
+    if not written:
+        return
+    for listener in _batch_listeners:
+        try:
+            listener(written, session)
+        except Exception:
+            logger.exception("Erro ao notificar gravação de lote de logs")
+
+
+_log_queue = None
+_log_queue_lock = threading.Lock()
+
+
+def get_log_queue():
+    """Retorna a fila de logs do processo, criando-a na primeira chamada"""
+    global _log_queue
+    if _log_queue is None:
+        with _log_queue_lock:
+            if _log_queue is None:
+                _log_queue = ConversationLogQueue()
+                atexit.register(_log_queue.shutdown)
+    return _log_queue
+
+
+def enqueue_conversation_log(session, username, role, message, **kwargs):
+    """Substituto não bloqueante de `save_conversation_log` (síncrono sem `ANALY_LOG_TABLE`)"""
+    if not LOG_TABLE:
+        save_conversation_log(session, username, role, message, **kwargs)
+        return
+    get_log_queue().enqueue(session, username, role, message, **kwargs)
@@ -0,0 +1,140 @@
+"""
+Cache compartilhado das consultas dos cards de métricas da tela inicial.
+
+Com a conversa vazia, o `main()` chama `exibir_cards_metricas(session)`, que
+consultava o warehouse para cada usuário a cada carregamento e a cada "Nova
+Conversa" — no pico de login da manhã, uma enxurrada de consultas agregadas
+idênticas. Aqui a sessão entregue aos cards é um proxy que responde as
+leituras (`session.sql(...).collect()` / `.to_pandas()`) a partir de um
+`RefreshingCache` do processo: uma única consulta em andamento por SQL,
+recarga em segundo plano antes de vencer e valor anterior servido enquanto o
+warehouse revalida.
+
+As cargas (inclusive as recargas em segundo plano) emprestam uma sessão do
+pool durante a consulta, nunca usam a sessão do rerun que originou a leitura.
+Valores vencidos só são servidos por um período curto e a tela informa o
+horário dos dados quando isso acontece.
+
+Sem pool não há sessão que uma thread de segundo plano possa usar: o cache
+não recarrega antecipadamente nem serve valores vencidos, e cada carga roda
+no próprio rerun que a pediu, com a sessão desse rerun.
+"""
+
+import os
+import time
+from datetime import datetime
+
+import streamlit as st
+
+from concurrency import submit_background
+from connection_pool import lease_session, pooling_enabled
+from shared_cache import RefreshingCache
+
+
+# Intervalo de atualização dos cards (em segundos)
+METRICS_CACHE_TTL = int(os.getenv("ANALY_METRICS_CACHE_TTL", "900"))
+
+# Por quanto tempo, após vencer, um valor ainda pode ser servido enquanto revalida
+METRICS_CACHE_STALE_TTL = int(os.getenv("ANALY_METRICS_CACHE_STALE_TTL", "1800"))
+
+# Recargas em segundo plano só com sessões do pool
+_BACKGROUND_LOADS = pooling_enabled()
+
+_metrics_cache = RefreshingCache(
+    default_ttl=METRICS_CACHE_TTL,
+    refresh_ahead=0.2 if _BACKGROUND_LOADS else 0,
+    stale_ttl=METRICS_CACHE_STALE_TTL if _BACKGROUND_LOADS else 0,
+    submit_fn=submit_background
+)
+
+
+class CachedQuery:
+    """Consulta SQL cujas leituras passam pelo cache; demais operações vão ao Snowpark"""
+
+    def __init__(self, owner, query, params):
+        self._owner = owner
+        self._query = query
+        self._params = params
+
+    def _dataframe(self):
+        session = self._owner.session
+        if self._params is None:
+            return session.sql(self._query)
+        return session.sql(self._query, params=self._params)
+
+    def _load(self, method):
+        if not _BACKGROUND_LOADS:
+            # Sem pool, a carga sempre roda no rerun que pediu a leitura
+            return getattr(self._dataframe(), method)()
+        # Executada pelo cache, possivelmente numa thread de segundo plano
+        with lease_session(self._owner.tag, background=True) as (session, connected):
+            if not connected:
+                raise RuntimeError(f"sem sessão no pool '{self._owner.tag}'")
+            if self._params is None:
+                query = session.sql(self._query)
+            else:
+                query = session.sql(self._query, params=self._params)
+            return getattr(query, method)()
+
+    def _cached(self, method):
+        key = (self._owner.namespace, method, self._query, tuple(self._params or ()))
+        value = self._owner.cache.get_or_load(key, lambda: self._load(method), ttl=self._owner.ttl)
+        self._owner.note_loaded_at(self._owner.cache.loaded_at(key))
+        return value
+
+    def collect(self):
+        return list(self._cached("collect"))
+
+    def to_pandas(self):
+        # Cópia para que a renderização de uma sessão não altere o valor compartilhado
+        return self._cached("to_pandas").copy()
+
+    def first(self):
+        rows = self.collect()
+        return rows[0] if rows else None
+
+    def __getattr__(self, name):
+        return getattr(self._dataframe(), name)
+
+
+class CachedQuerySession:
+    """Proxy da sessão Snowpark que serve as leituras de `sql()` a partir do cache"""
+
+    def __init__(self, session, namespace, cache=_metrics_cache, ttl=METRICS_CACHE_TTL, tag="analytical"):
+        self.session = session
+        self.namespace = namespace
+        self.cache = cache
+        self.ttl = ttl
+        self.tag = tag
+        # Carga mais antiga entre as leituras servidas por este proxy
+        self.oldest_loaded_at = None
+
+    def sql(self, query, params=None):
+        return CachedQuery(self, query, params)
+
+    def note_loaded_at(self, loaded_at):
+        if loaded_at is not None and (self.oldest_loaded_at is None or loaded_at < self.oldest_loaded_at):
+            self.oldest_loaded_at = loaded_at
+
+    def is_stale(self):
+        """Indica se alguma leitura foi servida com valor vencido"""
+        return self.oldest_loaded_at is not None and time.time() - self.oldest_loaded_at >= self.ttl
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+def cached_metrics_session(session):
+    """Sessão a ser entregue a `exibir_cards_metricas`"""
+    return CachedQuerySession(session, namespace="metricas")
+
+
+def show_stale_notice(metrics_session):
+    """Informa o horário dos cards quando eles foram servidos com valor vencido"""
+    if metrics_session.is_stale():
+        loaded = datetime.fromtimestamp(metrics_session.oldest_loaded_at).strftime("%d/%m %H:%M")
+        st.caption(f"Métricas atualizadas em {loaded}; nova atualização em andamento.")
+
+
+def get_metrics_cache():
+    return _metrics_cache
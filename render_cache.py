@@ -0,0 +1,296 @@
+"""
+Cache de renderização das mensagens do chat.
+
+A cada rerun o loop de mensagens do `main()` reconstruía o DataFrame de cada
+mensagem histórica, reformatava as prévias com `format_dataframe_display` e
+recodificava o CSV inteiro para cada botão de download. Este módulo guarda,
+por sessão, as prévias formatadas de cada resultado, com limite de memória
+LRU; o DataFrame continua no `result_store` (a entrada guarda só a referência,
+para que o orçamento e o despejo em disco do store valham) e é lido sob
+demanda. Os arquivos para download ficam a cargo de `exports`. A
+formatação usa os formatadores vetorizados de `formatters`, compilados a
+partir do esquema guardado com o resultado e conferidos contra
+`format_dataframe_display` nas primeiras linhas de cada resultado (colunas
+divergentes continuam com a função do backend). Para os gráficos, guarda os
+datasets de cada spec compilada (`chart_specs`) já reduzidos e serializados
+em Arrow, e as figuras do renderizador alternativo por tema. Prévias, specs e
+figuras dividem o mesmo LRU e o mesmo teto de memória.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from backend_service import format_dataframe_display
+from chart_specs import CompiledChart, build_figure, compile_chart, spec_fingerprint
+from formatters import VECTOR_FORMATTER_ENABLED, VerifiedFormatter, infer_schema
+from result_store import get_result_store, is_result_ref, resolve_result
+from result_viewer import downsample_chart
+
+try:
+    from streamlit.dataframe_util import convert_anything_to_arrow_bytes
+except ImportError:  # versões do Streamlit sem o utilitário: envia o DataFrame
+    convert_anything_to_arrow_bytes = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Limite de memória do cache por sessão (em MB)
+RENDER_CACHE_MAX_MB = float(os.getenv("ANALY_RENDER_CACHE_MAX_MB", "200"))
+
+# Páginas formatadas mantidas por resultado
+MAX_CACHED_PAGES = 5
+
+
+def fingerprint_data(data):
+    """
+    Gera uma impressão digital barata do conteúdo de uma mensagem.
+
+    Usa a identidade do objeto (estável entre reruns, já que as mensagens
+    ficam no `st.session_state`) combinada com tamanho, colunas e amostras
+    das pontas, evitando percorrer o resultado inteiro a cada rerun.
+    """
+    if data is None:
+        return None
+    if is_result_ref(data):
+        return data["result_id"]
+    if isinstance(data, pd.DataFrame):
+        sample = (tuple(data.columns), len(data))
+        if len(data):
+            sample += (tuple(data.iloc[0].astype(str)), tuple(data.iloc[-1].astype(str)))
+    elif isinstance(data, list):
+        sample = (len(data),)
+        if data:
+            sample += (repr(data[0]), repr(data[-1]))
+    else:
+        sample = (repr(data)[:200],)
+    return hash((id(data),) + sample)
+
+
+class RenderEntry:
+    """
+    Artefatos de renderização de um resultado: prévias formatadas e, para
+    resultados do `result_store`, apenas a referência ao DataFrame.
+    """
+
+    def __init__(self, data):
+        self._formatter = None
+        if is_result_ref(data):
+            info = get_result_store().info(data)
+            self._ref = data
+            self._df = None
+            self.rows = info.rows
+            self.columns = info.columns
+            schema = info.schema
+        else:
+            # Dados fora do store (por exemplo, mensagens montadas à mão) ficam na entrada
+            self._ref = None
+            self._df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+            self.rows = len(self._df)
+            self.columns = list(self._df.columns)
+            schema = self._df
+        if VECTOR_FORMATTER_ENABLED:
+            if isinstance(schema, pd.DataFrame):
+                schema = infer_schema(schema)
+            self._formatter = VerifiedFormatter(schema, format_dataframe_display)
+        self._previews = {}
+        self._pages = OrderedDict()
+        self.nbytes = int(self._df.memory_usage(deep=True).sum()) if self._df is not None and self.rows else 0
+
+    @property
+    def df(self):
+        """DataFrame completo, lido do `result_store` a cada acesso (pode estar em disco)"""
+        if self._df is not None:
+            return self._df
+        return resolve_result(self._ref)
+
+    def frame_loader(self):
+        """Função sem argumentos que carrega o DataFrame completo fora do rerun (sem `st.session_state`)"""
+        if self._df is not None:
+            df = self._df
+            return lambda: df
+        store, ref = get_result_store(), self._ref
+        return lambda: store.get(ref)
+
+    @property
+    def empty(self):
+        return self.rows == 0
+
+    def preview(self, num_rows=10):
+        """Retorna as primeiras `num_rows` linhas já formatadas (memoizado por tamanho)"""
+        if num_rows not in self._previews:
+            self._previews[num_rows] = self._format(self.df.head(num_rows))
+        return self._previews[num_rows]
+
+    def _format(self, frame):
+        # Colunas compactadas como `category` voltam a texto antes da formatação
+        categorical = frame.select_dtypes("category").columns
+        if len(categorical):
+            frame = frame.astype({col: object for col in categorical})
+        if self._formatter is not None:
+            verified = self._formatter.reference_columns is not None
+            try:
+                formatted = self._formatter(frame)
+            except Exception:
+                logger.exception("Erro na formatação vetorizada, usando format_dataframe_display")
+                self._formatter = None
+            else:
+                if not verified and self._formatter.reference_columns:
+                    logger.info(
+                        "Formatação vetorizada diverge de format_dataframe_display nas colunas %s; "
+                        "elas usam a função do backend", self._formatter.reference_columns
+                    )
+                return formatted
+        return format_dataframe_display(frame)
+
+    def page(self, start, page_size):
+        """Formata apenas a página pedida do resultado (últimas páginas memoizadas)"""
+        key = (start, page_size)
+        if key not in self._pages:
+            # Só a página formatada fica em cache, não o resultado inteiro
+            self._pages[key] = self._format(self.df.iloc[start:start + page_size])
+            while len(self._pages) > MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        return self._pages[key]
+
+    def size(self):
+        """Tamanho aproximado em bytes do que está em cache"""
+        previews = sum(
+            int(p.memory_usage(deep=True).sum())
+            for p in list(self._previews.values()) + list(self._pages.values())
+        )
+        return self.nbytes + previews
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum()) if isinstance(df, pd.DataFrame) else 0
+
+
+def _spec_bytes(spec):
+    """Tamanho dos datasets guardados numa spec (bytes Arrow ou DataFrames)"""
+    return sum(
+        len(value) if isinstance(value, bytes) else _frame_bytes(value)
+        for value in (spec.get("datasets") or {}).values()
+    )
+
+
+class MessageRenderCache:
+    """
+    Cache LRU com teto de memória para os artefatos de renderização de uma
+    sessão: entradas de resultados, specs compiladas, specs prontas para o
+    Vega-Lite e figuras, todas no mesmo LRU.
+    """
+
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # {(tipo, ...): valor}
+        self._sizes = {}                # tamanho fixo dos artefatos que não são RenderEntry
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def _store(self, key, value, size=0):
+        self._entries[key] = value
+        self._sizes[key] = size
+        self._evict()
+        return value
+
+    def _entry_size(self, key, value):
+        return value.size() if isinstance(value, RenderEntry) else self._sizes.get(key, 0)
+
+    def get(self, message_index, elem_key, data):
+        """Retorna a entrada da mensagem, construída apenas em caso de miss"""
+        key = ("data", message_index, elem_key, fingerprint_data(data))
+        if self._lookup(key):
+            return self._entries[key]
+        return self._store(key, RenderEntry(data))
+
+    def compiled_chart(self, message_index, elem_key, raw_spec):
+        """
+        Spec compilada do gráfico. Mensagens que não passaram por
+        `compact_message` (por exemplo, carregadas do histórico) são compiladas
+        aqui uma única vez, com os datasets em memória.
+        """
+        if isinstance(raw_spec, CompiledChart):
+            return raw_spec
+        key = ("compiled", message_index, elem_key, spec_fingerprint(raw_spec))
+        if self._lookup(key):
+            return self._entries[key]
+        compiled = compile_chart(raw_spec, lambda name, values: pd.DataFrame(values))
+        size = sum(_frame_bytes(value) for value in compiled.datasets.values())
+        return self._store(key, compiled, size)
+
+    def chart(self, message_index, elem_key, raw_spec):
+        """Spec para o `st.vega_lite_chart` com os datasets reduzidos e serializados uma única vez"""
+        key = ("chart", message_index, elem_key, spec_fingerprint(raw_spec))
+        if not self._lookup(key):
+            compiled = self.compiled_chart(message_index, elem_key, raw_spec)
+            spec = compiled.spec
+            datasets = {}
+            for name, value in compiled.datasets.items():
+                df = _chart_frame(value)
+                if df is None:
+                    datasets[name] = value
+                    continue
+                if name == compiled.main_dataset:
+                    spec, df = downsample_chart(spec, df)
+                datasets[name] = convert_anything_to_arrow_bytes(df) if convert_anything_to_arrow_bytes else df
+            spec = dict(spec, datasets=datasets)
+            self._store(key, spec, _spec_bytes(spec))
+        return self._entries[key]
+
+    def figure(self, message_index, elem_key, raw_spec, theme):
+        """Figura do renderizador alternativo, memoizada por mensagem e tema"""
+        key = ("figure", message_index, elem_key, spec_fingerprint(raw_spec), theme)
+        if not self._lookup(key):
+            compiled = self.compiled_chart(message_index, elem_key, raw_spec)
+            value = compiled.datasets.get(compiled.main_dataset)
+            df = _chart_frame(value) if value is not None else None
+            figure = build_figure(compiled, df, theme) if df is not None else None
+            # A figura carrega os dados do gráfico; o tamanho deles é a estimativa
+            self._store(key, figure, _frame_bytes(df))
+        return self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+
+    def total_bytes(self):
+        return sum(self._entry_size(key, value) for key, value in self._entries.items())
+
+    def _evict(self):
+        # Mantém sempre a entrada mais recente, mesmo que sozinha passe do limite
+        total = self.total_bytes()
+        while len(self._entries) > 1 and total > self.max_bytes:
+            key, value = self._entries.popitem(last=False)
+            total -= self._entry_size(key, value)
+            self._sizes.pop(key, None)
+
+
+def _chart_frame(value):
+    """DataFrame de um dataset de gráfico (referência ou DataFrame), sem colunas `category`"""
+    value = resolve_result(value)
+    if not isinstance(value, pd.DataFrame):
+        return None
+    categorical = value.select_dtypes("category").columns
+    if len(categorical):
+        value = value.astype({col: object for col in categorical})
+    return value
+
+
+def get_render_cache():
+    """Retorna o cache de renderização da sessão Streamlit atual"""
+    if "render_cache" not in st.session_state:
+        st.session_state.render_cache = MessageRenderCache()
+    return st.session_state.render_cache
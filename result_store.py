@@ -0,0 +1,252 @@
+"""
+Armazenamento compacto dos resultados de consulta da sessão.
+
+As mensagens do assistente guardavam `data` como listas de dicionários e, no
+modo ordenado, os `table_*` também ficavam dentro do `processed_response`
+copiado na mensagem — o mesmo resultado existia várias vezes como objetos
+Python por sessão. Aqui cada resultado é guardado uma única vez em formato
+colunar compacto (strings repetidas como `category`, inteiros reduzidos) e as
+mensagens passam a referenciá-lo por id. Resultados grandes, ou que estourem o
+orçamento de memória da sessão, são gravados em disco.
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from chart_specs import CompiledChart, compile_chart
+from formatters import infer_schema
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+
+# Resultados acima deste tamanho vão direto para o disco (em MB)
+RESULT_SPILL_THRESHOLD_MB = float(os.getenv("ANALY_RESULT_SPILL_THRESHOLD_MB", "20"))
+
+# Orçamento de memória dos resultados por sessão (em MB)
+RESULT_SESSION_BUDGET_MB = float(os.getenv("ANALY_RESULT_SESSION_BUDGET_MB", "100"))
+
+# Proporção máxima de valores distintos para converter texto em `category`
+CATEGORY_MAX_RATIO = 0.5
+
+RESULT_SPILL_DIR = os.getenv(
+    "ANALY_RESULT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "analy_results")
+)
+
+
+def is_result_ref(value):
+    """Indica se o valor é uma referência a um resultado armazenado"""
+    return isinstance(value, dict) and "result_id" in value and len(value) <= 2
+
+
+def compact_dataframe(df):
+    """
+    Reduz o uso de memória de um DataFrame sem perder informação.
+
+    Textos com poucos valores distintos viram `category` (codificação por
+    dicionário) e inteiros são reduzidos ao menor tipo que os comporta.
+    Floats são mantidos em 64 bits para não arredondar valores monetários.
+    """
+    df = df.copy()
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif isinstance(series.dtype, pd.StringDtype) and len(series) > 0:
+            if series.nunique(dropna=True) / len(series) <= CATEGORY_MAX_RATIO:
+                df[col] = series.astype("category")
+        elif series.dtype == object and len(series) > 0:
+            try:
+                n_unique = series.nunique(dropna=True)
+            except TypeError:
+                # Valores não hasheáveis (listas, dicionários) ficam como estão
+                continue
+            if n_unique / len(series) <= CATEGORY_MAX_RATIO and series.map(
+                lambda v: v is None or isinstance(v, str)
+            ).all():
+                df[col] = series.astype("category")
+    return df
+
+
+class StoredResult:
+    """Resultado compacto, em memória ou gravado em disco"""
+
+    def __init__(self, result_id, df, path=None):
+        self.result_id = result_id
+        self.rows = len(df)
+        self.columns = list(df.columns)
+        # Papéis das colunas para exibição, inferidos uma única vez por resultado
+        self.schema = infer_schema(df)
+        self.nbytes = int(df.memory_usage(deep=True).sum())
+        self.path = path
+        self._df = None if path else df
+
+    @property
+    def in_memory(self):
+        return self._df is not None
+
+    def load(self):
+        if self._df is not None:
+            return self._df
+        if self.path.endswith(".parquet"):
+            return pd.read_parquet(self.path)
+        return pd.read_pickle(self.path)
+
+    def spill(self, directory):
+        """Grava o resultado em disco e libera a memória"""
+        if self._df is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        if PARQUET_AVAILABLE:
+            path = os.path.join(directory, f"{self.result_id}.parquet")
+            self._df.to_parquet(path, index=False)
+        else:
+            path = os.path.join(directory, f"{self.result_id}.pkl")
+            self._df.to_pickle(path)
+        self.path = path
+        self._df = None
+
+
+class ResultStore:
+    """Resultados de uma sessão, com orçamento de memória e despejo em disco"""
+
+    def __init__(self, budget_bytes=RESULT_SESSION_BUDGET_MB * 1024 * 1024,
+                 spill_threshold_bytes=RESULT_SPILL_THRESHOLD_MB * 1024 * 1024,
+                 spill_dir=None):
+        self.budget_bytes = budget_bytes
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.spill_dir = spill_dir or os.path.join(RESULT_SPILL_DIR, uuid.uuid4().hex)
+        self._results = OrderedDict()
+        # Remove os arquivos da sessão quando o store for descartado
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+    def put(self, data):
+        """Guarda um resultado (lista de dicionários ou DataFrame) e retorna sua referência"""
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        result_id = uuid.uuid4().hex
+        stored = StoredResult(result_id, compact_dataframe(df))
+        self._results[result_id] = stored
+
+        if stored.nbytes > self.spill_threshold_bytes:
+            stored.spill(self.spill_dir)
+        self._enforce_budget()
+        return {"result_id": result_id}
+
+    def get(self, ref):
+        """Retorna o DataFrame de uma referência"""
+        result_id = ref["result_id"] if isinstance(ref, dict) else ref
+        return self._results[result_id].load()
+
+    def info(self, ref):
+        result_id = ref["result_id"] if isinstance(ref, dict) else ref
+        return self._results[result_id]
+
+    def memory_bytes(self):
+        return sum(r.nbytes for r in self._results.values() if r.in_memory)
+
+    def clear(self):
+        self._results.clear()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _enforce_budget(self):
+        # Uma passada pelos resultados em memória, dos maiores para os menores,
+        # despejando até o total caber no orçamento
+        total = self.memory_bytes()
+        if total <= self.budget_bytes:
+            return
+        in_memory = [stored for stored in self._results.values() if stored.in_memory]
+        for stored in sorted(in_memory, key=lambda stored: stored.nbytes, reverse=True):
+            stored.spill(self.spill_dir)
+            total -= stored.nbytes
+            if total <= self.budget_bytes:
+                break
+
+
+def get_result_store():
+    """Retorna o store de resultados da sessão Streamlit atual"""
+    if "result_store" not in st.session_state:
+        st.session_state.result_store = ResultStore()
+    return st.session_state.result_store
+
+
+def _is_result_payload(key, value):
+    if not (key == "data" or key.startswith("table_")):
+        return False
+    if isinstance(value, pd.DataFrame):
+        return not value.empty
+    return isinstance(value, list) and len(value) > 0 and isinstance(value[0], dict)
+
+
+def _is_chart_payload(key, value):
+    if not (key == "chart" or key.startswith("chart_")):
+        return False
+    if isinstance(value, list):
+        return len(value) > 0 and all(_is_chart_payload(key, item) for item in value)
+    if isinstance(value, str):
+        return value.lstrip().startswith("{")
+    return isinstance(value, (dict, CompiledChart))
+
+
+def compact_message(msg):
+    """
+    Retorna uma cópia da mensagem do assistente com os resultados no store.
+
+    `data` e os `table_*` do `processed_response` são trocados por referências;
+    quando apontam para o mesmo objeto, compartilham a mesma referência. As
+    specs de gráfico (`chart`, `chart_*`) são compiladas uma única vez e seus
+    dados inline vão para o store como datasets, um por conteúdo distinto.
+    """
+    store = get_result_store()
+    refs = {}
+    datasets = {}
+    charts = {}
+
+    def to_ref(value):
+        if id(value) not in refs:
+            refs[id(value)] = store.put(value)
+        return refs[id(value)]
+
+    def put_dataset(name, values):
+        if name not in datasets:
+            datasets[name] = store.put(values)
+        return datasets[name]
+
+    def to_chart(value):
+        if id(value) not in charts:
+            if isinstance(value, list):
+                charts[id(value)] = [compile_chart(item, put_dataset) for item in value]
+            else:
+                charts[id(value)] = compile_chart(value, put_dataset)
+        return charts[id(value)]
+
+    compact = dict(msg)
+    if _is_result_payload("data", msg.get("data")):
+        compact["data"] = to_ref(msg["data"])
+    if _is_chart_payload("chart", msg.get("chart")):
+        compact["chart"] = to_chart(msg["chart"])
+
+    processed_resp = msg.get("processed_response")
+    if isinstance(processed_resp, dict):
+        compact["processed_response"] = {
+            key: to_ref(value) if _is_result_payload(key, value)
+            else to_chart(value) if _is_chart_payload(key, value) else value
+            for key, value in processed_resp.items()
+        }
+    return compact
+
+
+def resolve_result(value):
+    """Resolve uma referência para DataFrame; outros valores são devolvidos intactos"""
+    if is_result_ref(value):
+        return get_result_store().get(value)
+    return value
@@ -0,0 +1,265 @@
+"""
+Visualização de resultados grandes com paginação e redução de pontos.
+
+As tabelas do `main()` entregavam ao navegador o resultado inteiro: o slider
+"Ver mais linhas" reformatava até 1000 linhas a cada mudança, e as specs
+Vega-Lite dos gráficos embutiam todos os pontos. Aqui a tabela é servida em
+páginas sob demanda a partir do resultado armazenado (formatando apenas a
+página visível) e os dados dos gráficos acima de um limite de pontos são
+reduzidos — LTTB para séries numéricas/temporais e top-N + "Outros" para
+categorias — limitando o payload e o tempo de renderização.
+
+No eixo categórico os dados são pré-agregados com a mesma agregação do
+gráfico (soma, média, contagem...), inclusive a linha "Outros"; contagens
+pré-agregadas passam a ser somadas pela spec.
+"""
+
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+# Opções de linhas por página
+PAGE_SIZES = (10, 50, 100, 500)
+
+# Quantidade máxima de pontos enviados a um gráfico
+CHART_MAX_POINTS = int(os.getenv("ANALY_CHART_MAX_POINTS", "2000"))
+
+# Quantidade de categorias mantidas antes de agrupar o restante em "Outros"
+CHART_TOP_CATEGORIES = int(os.getenv("ANALY_CHART_TOP_CATEGORIES", "25"))
+
+OTHERS_LABEL = "Outros"
+
+# Agregações do Vega-Lite -> pandas. As de contagem, depois de pré-agregadas,
+# passam a ser somadas pelo gráfico; as demais valem o próprio valor numa única linha
+_IDENTITY_AGGREGATES = {"sum": "sum", "mean": "mean", "average": "mean", "median": "median", "min": "min", "max": "max"}
+_COUNT_AGGREGATES = {"count": "count", "valid": "count", "distinct": "nunique"}
+
+
+# ----------------------------------------------------------------------
+# Tabelas
+# ----------------------------------------------------------------------
+
+def show_result_pages(render_entry, key):
+    """Exibe o resultado paginado; só a página visível é formatada"""
+    total = render_entry.rows
+    col_size, col_page = st.columns([1, 1])
+    with col_size:
+        page_size = st.selectbox("Linhas por página:", PAGE_SIZES, index=1, key=f"page_size_{key}")
+    num_pages = max(1, math.ceil(total / page_size))
+    with col_page:
+        page_number = st.number_input(
+            f"Página (de {num_pages}):", min_value=1, max_value=num_pages, value=1, step=1,
+            key=f"page_{key}"
+        )
+
+    start = (int(page_number) - 1) * page_size
+    end = min(start + page_size, total)
+    st.dataframe(render_entry.page(start, page_size), use_container_width=True)
+    st.caption(f"Linhas {start + 1}–{end} de {total}.")
+
+
+# ----------------------------------------------------------------------
+# Gráficos
+# ----------------------------------------------------------------------
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: índices dos pontos que preservam a forma
+    da série com no máximo `threshold` pontos. `x` deve estar ordenado.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    bucket_size = (n - 2) / (threshold - 2)
+
+    a = 0
+    for i in range(threshold - 2):
+        start = int(math.floor(i * bucket_size)) + 1
+        end = int(math.floor((i + 1) * bucket_size)) + 1
+        next_start = end
+        next_end = min(int(math.floor((i + 2) * bucket_size)) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        areas = np.abs((x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def chart_encoding(spec):
+    """Encoding da spec Vega-Lite (ou da primeira camada que tiver um)"""
+    encoding = spec.get("encoding")
+    if encoding:
+        return encoding
+    for layer in spec.get("layer", []):
+        if layer.get("encoding"):
+            return layer["encoding"]
+    return {}
+
+
+def _field(channel):
+    return channel.get("field") if isinstance(channel, dict) else None
+
+
+def _as_numeric(series, field_type):
+    if field_type == "temporal":
+        dates = pd.to_datetime(series, errors="coerce")
+        if isinstance(dates.dtype, pd.DatetimeTZDtype):
+            dates = dates.dt.tz_convert(None)
+        # Nanossegundos desde a época; datas inválidas (NaT) viram NaN
+        values = dates.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+        values[dates.isna().to_numpy()] = np.nan
+        return pd.Series(values, index=series.index)
+    return pd.to_numeric(series, errors="coerce").astype(float)
+
+
+def _categorical_axes(encoding):
+    """`(canal da categoria, canal do valor)` de um gráfico de eixo categórico, ou None"""
+    x, y = encoding.get("x", {}), encoding.get("y", {})
+    if not isinstance(x, dict) or not isinstance(y, dict):
+        return None
+    if x.get("type") in ("nominal", "ordinal") and y.get("type") == "quantitative":
+        return "x", "y"
+    if y.get("type") in ("nominal", "ordinal") and x.get("type") == "quantitative":
+        return "y", "x"
+    return None
+
+
+def _aggregate_of(channel):
+    """Agregação do canal (sem agregação, as marcas repetidas se acumulam: soma)"""
+    aggregate = channel.get("aggregate") or "sum"
+    return aggregate if isinstance(aggregate, str) else None
+
+
+def downsample_frame(df, encoding, max_points=CHART_MAX_POINTS, top_categories=CHART_TOP_CATEGORIES):
+    """Reduz os dados de um gráfico de acordo com os tipos dos eixos"""
+    if len(df) <= max_points:
+        return df
+
+    x, y = encoding.get("x", {}), encoding.get("y", {})
+    x_field, y_field = _field(x), _field(y)
+    series_field = _field(encoding.get("color")) or _field(encoding.get("detail"))
+    if not x_field or not y_field or x_field not in df or y_field not in df:
+        return df
+
+    x_type, y_type = x.get("type"), y.get("type")
+
+    # Eixo categórico: mantém as maiores categorias e agrupa o resto
+    axes = _categorical_axes(encoding)
+    if axes is not None:
+        category, value = encoding[axes[0]], encoding[axes[1]]
+        return _top_n_others(
+            df, _field(category), _field(value), _aggregate_of(value), top_categories, max_points, series_field
+        )
+
+    # Série numérica/temporal: LTTB por série
+    if x_type in ("temporal", "quantitative") and y_type == "quantitative":
+        groups = [df] if not series_field or series_field not in df else [g for _, g in df.groupby(series_field, sort=False)]
+        budget = max(1, max_points // len(groups))
+        parts = []
+        for group in groups:
+            xs = _as_numeric(group[x_field], x_type)
+            order = np.argsort(xs.to_numpy(), kind="stable")
+            group = group.iloc[order]
+            xs = xs.to_numpy()[order]
+            ys = _as_numeric(group[y_field], "quantitative").fillna(0).to_numpy()
+            if budget >= 3:
+                indices = lttb_indices(np.nan_to_num(xs), ys, budget)
+            else:
+                # Séries demais para o LTTB: pontos igualmente espaçados de cada uma
+                indices = np.unique(np.linspace(0, len(group) - 1, min(budget, len(group))).astype(np.int64))
+            parts.append(group.iloc[indices])
+        # Com mais séries do que pontos, nem um ponto por série cabe no limite
+        return pd.concat(parts, ignore_index=True).iloc[:max_points]
+
+    return df
+
+
+def _top_n_others(df, category_field, value_field, aggregate, top_n, max_points, series_field=None):
+    """
+    Pré-agrega por categoria (e série) com a agregação do gráfico, mantém as
+    `top_n` maiores categorias e junta as demais numa linha "Outros" por série,
+    sem passar de `max_points` linhas.
+    """
+    func = _IDENTITY_AGGREGATES.get(aggregate) or _COUNT_AGGREGATES.get(aggregate)
+    if func is None:
+        # Agregação sem equivalente pré-agregável (quartis, desvio...): mantém os dados
+        return df
+
+    keys = [category_field]
+    if series_field and series_field in df and series_field != category_field:
+        keys.append(series_field)
+    n_series = df[keys[1]].nunique(dropna=False) if len(keys) > 1 else 1
+    top_n = min(top_n, max_points // n_series - 1)
+    if top_n < 1:
+        return df
+
+    frame = df.copy()
+    if func not in ("count", "nunique"):
+        frame[value_field] = pd.to_numeric(frame[value_field], errors="coerce")
+    ranking = frame.groupby(category_field, sort=False)[value_field].agg(func).sort_values(ascending=False)
+    keep = set(ranking.index[:top_n])
+    frame[category_field] = frame[category_field].where(frame[category_field].isin(keep), OTHERS_LABEL)
+    return _aggregate_frame(frame, keys, value_field, func)
+
+
+def _aggregate_frame(frame, keys, value_field, func):
+    """Uma linha por grupo; o campo do valor usa `func` e as demais colunas são preenchidas"""
+    other_func = func if func in _IDENTITY_AGGREGATES.values() else "sum"
+    aggregations = {}
+    for col in frame.columns:
+        if col in keys:
+            continue
+        if col == value_field:
+            aggregations[col] = func
+        elif pd.api.types.is_numeric_dtype(frame[col]) and not pd.api.types.is_bool_dtype(frame[col]):
+            aggregations[col] = other_func
+        else:
+            aggregations[col] = _common_value
+    grouped = frame.groupby(keys, sort=False, dropna=False).agg(aggregations).reset_index()
+    # "Outros" sempre depois das categorias mantidas
+    is_others = (grouped[keys[0]] == OTHERS_LABEL).to_numpy()
+    grouped = pd.concat([grouped[~is_others], grouped[is_others]], ignore_index=True)
+    return grouped[list(frame.columns)]
+
+
+def _common_value(values):
+    """Valor de uma coluna de texto/data num grupo: o próprio, se único; senão "Outros" (texto) ou o menor"""
+    if values.nunique(dropna=False) <= 1:
+        return values.iloc[0] if len(values) else None
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        return OTHERS_LABEL
+    return values.min()
+
+
+def downsample_chart(spec, df, max_points=CHART_MAX_POINTS, top_categories=CHART_TOP_CATEGORIES):
+    """
+    Spec e dados reduzidos de um gráfico. Quando o eixo categórico foi
+    pré-agregado com uma contagem, a spec passa a somar as contagens.
+    """
+    encoding = chart_encoding(spec)
+    reduced = downsample_frame(df, encoding, max_points, top_categories)
+    axes = _categorical_axes(encoding)
+    if reduced is df or axes is None or _aggregate_of(encoding[axes[1]]) not in _COUNT_AGGREGATES:
+        return spec, reduced
+
+    value = dict(encoding[axes[1]], aggregate="sum")
+    if spec.get("encoding"):
+        return dict(spec, encoding=dict(spec["encoding"], **{axes[1]: value})), reduced
+    layers = [dict(layer) for layer in spec.get("layer", [])]
+    for layer in layers:
+        if layer.get("encoding"):
+            layer["encoding"] = dict(layer["encoding"], **{axes[1]: value})
+            break
+    return dict(spec, layer=layers), reduced
@@ -0,0 +1,112 @@
+"""
+Roteamento da pergunta do usuário.
+
+Antes de decidir entre `process_customer_vision` e o Cortex Agent, o `main()`
+classificava a intenção e extraía CPF/CNPJ/nome em sequência, somando as duas
+latências. Aqui o pré-classificador local (`local_router`) resolve os casos
+triviais sem chamadas remotas e o que sobra roda em paralelo. Os tempos de
+cada etapa são registrados na sessão e no span de roteamento.
+
+A chamada ao agent não é iniciada especulativamente durante o roteamento:
+`call_cortex_agent` lê e altera o `st.session_state.agent_messages` da
+sessão, e uma chamada descartada (rota de clientes) ainda poderia alterar o
+histórico da conversa.
+
+As etapas só rodam em paralelo quando cada uma pode pegar a própria sessão do
+pool; com uma sessão única, que não pode ser usada por várias threads ao
+mesmo tempo, elas rodam em sequência.
+"""
+
+import time
+
+import streamlit as st
+
+from backend_service import classify_user_intent, extract_cpf_or_name_from_text
+from concurrency import submit
+from connection_pool import call_with_session, is_pooled
+from local_router import classify_locally, count_call
+from tracing import set_span_attributes, span
+
+
+# Quantidade de medições de roteamento mantidas por sessão
+ROUTING_TIMINGS_KEEP = 50
+
+
+class RoutingResult:
+    """Resultado do roteamento: intenção, identificador do cliente e tempos"""
+
+    def __init__(self, user_intent, id_customer, timings=None):
+        self.user_intent = user_intent
+        self.id_customer = id_customer
+        self.timings = timings or {}
+
+
+def _timed_backend(fn, session, *args):
+    """Como `_timed`, com a sessão emprestada do pool apenas durante a chamada"""
+    start = time.perf_counter()
+    with span(f"backend.{fn.__name__}"):
+        result = call_with_session(session, fn, *args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+class _Resolved:
+    """Futuro já resolvido, para etapas decididas localmente ou executadas em sequência"""
+
+    def __init__(self, value, elapsed_ms=0.0):
+        self._value = (value, elapsed_ms)
+
+    def result(self):
+        return self._value
+
+
+def _run_backend(parallel, fn, session, user_input):
+    if parallel:
+        return submit(_timed_backend, fn, session, user_input)
+    return _Resolved(*_timed_backend(fn, session, user_input))
+
+
+def route_user_input(session, user_input):
+    """
+    Classifica a intenção e extrai o cliente, localmente quando possível e
+    em paralelo quando é preciso chamar o backend.
+    """
+    start = time.perf_counter()
+
+    local_intent, local_customer = classify_locally(user_input)
+    count_call("intent", local_intent is not None)
+    count_call("extract", local_customer is not None)
+
+    parallel = is_pooled(session)
+    if local_intent is not None:
+        intent_future = _Resolved(local_intent)
+    else:
+        intent_future = _run_backend(parallel, classify_user_intent, session, user_input)
+
+    if local_customer is not None:
+        customer_future = _Resolved(local_customer)
+    else:
+        customer_future = _run_backend(parallel, extract_cpf_or_name_from_text, session, user_input)
+
+    user_intent, classify_ms = intent_future.result()
+    id_customer, extract_ms = customer_future.result()
+
+    timings = {
+        "classify_ms": classify_ms,
+        "extract_ms": extract_ms,
+        "routing_ms": (time.perf_counter() - start) * 1000,
+        "sequential_ms": classify_ms + extract_ms,
+        "local_intent": local_intent is not None,
+        "local_extract": local_customer is not None,
+        "parallel": parallel,
+    }
+    record_routing_timings(timings)
+    return RoutingResult(user_intent, id_customer, timings)
+
+
+def record_routing_timings(timings):
+    """Registra os tempos do roteamento (paralelo vs. soma sequencial) na sessão e no span atual"""
+    set_span_attributes(**timings)
+    history = st.session_state.setdefault("routing_timings", [])
+    history.append(dict(timings, timestamp=time.time()))
+    del history[:-ROUTING_TIMINGS_KEEP]
+
@@ -0,0 +1,264 @@
+"""
+Cache em memória compartilhado entre as sessões do processo.
+
+Usado pelos caches da aplicação que precisam de expiração por tempo, limite
+de entradas (LRU), opcionalmente limite de memória, e estatísticas de acerto,
+com acesso seguro entre threads do servidor Streamlit.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def approx_nbytes(value):
+    """Tamanho aproximado em memória de um valor (DataFrames, listas, dicionários, textos)"""
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_nbytes(k) + approx_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(approx_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    """
+    Cache LRU thread-safe com expiração por entrada.
+
+    Com `max_bytes`, o tamanho de cada valor é estimado por `sizeof` e as
+    entradas mais antigas saem até o total caber no limite; valores maiores
+    que `max_entry_bytes` não são guardados.
+    """
+
+    def __init__(self, max_entries=1000, default_ttl=300, max_bytes=None, max_entry_bytes=None,
+                 sizeof=approx_nbytes):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()   # {chave: (valor, expira_em, bytes)}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = item
+            if expires_at <= time.time():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key):
+        """Indica se há entrada válida para a chave, sem afetar LRU nem estatísticas"""
+        with self._lock:
+            item = self._entries.get(key)
+            return item is not None and item[1] > time.time()
+
+    def set(self, key, value, ttl=None):
+        """Guarda o valor; retorna False se ele passar do limite por entrada"""
+        ttl = self.default_ttl if ttl is None else ttl
+        size = self.sizeof(value) if self.max_bytes or self.max_entry_bytes else 0
+        with self._lock:
+            if self.max_entry_bytes and size > self.max_entry_bytes:
+                self.rejected += 1
+                self._pop(key)
+                return False
+            self._pop(key)
+            self._entries[key] = (value, time.time() + ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes and self._bytes > self.max_bytes and len(self._entries) > 1
+            ):
+                self._pop(next(iter(self._entries)))
+            return True
+
+    def _pop(self, key):
+        # Chamado com o lock adquirido
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def items(self):
+        """Retorna uma cópia das entradas válidas como pares (chave, valor)"""
+        now = time.time()
+        with self._lock:
+            return [(k, v) for k, (v, expires_at, _) in self._entries.items() if expires_at > now]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def total_bytes(self):
+        return self._bytes
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "rejected": self.rejected,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class RefreshingCache:
+    """
+    Cache com carga única por chave (single-flight), atualização antecipada e
+    resposta com valor vencido enquanto revalida (stale-while-revalidate).
+
+    - Entrada válida: devolvida na hora; perto de vencer, é recarregada em
+      segundo plano.
+    - Entrada vencida, mas dentro de `stale_ttl`: o valor antigo é devolvido e
+      a recarga acontece em segundo plano.
+    - Sem entrada: apenas uma thread consulta o backend; as demais aguardam o
+      mesmo resultado.
+    """
+
+    def __init__(self, default_ttl=300, refresh_ahead=0.2, stale_ttl=86400, submit_fn=None):
+        self.default_ttl = default_ttl
+        self.refresh_ahead = refresh_ahead
+        self.stale_ttl = stale_ttl
+        self._submit = submit_fn or self._start_thread
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "loads": 0, "waits": 0, "refreshes": 0, "errors": 0}
+
+    @staticmethod
+    def _start_thread(fn, *args):
+        threading.Thread(target=fn, args=args, daemon=True).start()
+
+    def get_or_load(self, key, loader, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                age = now - loaded_at
+                if age < ttl:
+                    self._stats["hits"] += 1
+                    if age >= ttl * (1 - self.refresh_ahead):
+                        self._refresh_in_background(key, loader)
+                    return value
+                if age < ttl + self.stale_ttl:
+                    self._stats["stale_hits"] += 1
+                    self._refresh_in_background(key, loader)
+                    return value
+
+            waiter = self._in_flight.get(key)
+            if waiter is None:
+                waiter = self._in_flight[key] = _Flight()
+                owner = True
+            else:
+                self._stats["waits"] += 1
+                owner = False
+
+        if not owner:
+            return waiter.wait()
+
+        self._load(key, loader, waiter)
+        return waiter.wait()
+
+    def _refresh_in_background(self, key, loader):
+        # Chamado com o lock adquirido
+        if key in self._in_flight:
+            return
+        flight = self._in_flight[key] = _Flight()
+        self._stats["refreshes"] += 1
+        self._submit(self._load, key, loader, flight)
+
+    def _load(self, key, loader, flight):
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._in_flight.pop(key, None)
+                entry = self._entries.get(key)
+            # Falha na recarga: mantém o valor anterior, se houver
+            if entry is not None:
+                flight.set_result(entry[0])
+            else:
+                flight.set_error(e)
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._in_flight.pop(key, None)
+            self._stats["loads"] += 1
+        flight.set_result(value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def loaded_at(self, key):
+        """Momento (epoch) da última carga da chave, ou None se não estiver em cache"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+class _Flight:
+    """Resultado de uma carga em andamento, compartilhado entre as threads que aguardam"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+    def set_result(self, value):
+        self._value = value
+        self._done.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
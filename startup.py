@@ -0,0 +1,233 @@
+"""
+Inicialização do processo: pré-aquecimento antes do primeiro usuário.
+
+Cada processo novo do servidor (e cada pod a mais no scale-out) pagava todo o
+custo de partida no primeiro acesso: importação de pandas, `backend_service`
+e `frontend_ui`, login no Snowflake com o warehouse ainda suspenso e as
+consultas dos cards de métricas — segundos antes de a página aparecer. Aqui
+esse trabalho é feito uma vez por processo:
+
+- `python startup.py [argumentos do streamlit run]` importa os módulos
+  pesados, abre os pools de sessões (retomando os warehouses), preenche os
+  caches compartilhados (cards de métricas, CSS, assets) e só então sobe o
+  servidor Streamlit no mesmo processo, já aquecido;
+- `python startup.py --check` apenas executa o pré-aquecimento e mostra o
+  tempo de cada etapa;
+- `python startup.py --ddl` mostra o DDL das tabelas do app (para criá-las
+  fora do app, sem `ANALY_CREATE_TABLES`);
+- com `streamlit run streamlit_app.py`, o `main()` dispara a parte que não
+  depende da interface em segundo plano no primeiro rerun.
+"""
+
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+
+from concurrency import submit_background
+
+
+logger = logging.getLogger(__name__)
+
+PREWARM_ENABLED = os.getenv("ANALY_PREWARM", "1") == "1"
+
+# Módulos importados no pré-aquecimento (dependências adiadas pelo app)
+PREWARM_MODULES = [
+    name.strip() for name in os.getenv(
+        "ANALY_PREWARM_MODULES",
+        "pandas,numpy,backend_service,frontend_ui,formatters,render_cache,result_viewer,"
+        "exports,answer_cache,routing,customer_lookup,agent_stream"
+    ).split(",") if name.strip()
+]
+
+# Pools de sessões abertos (e warehouses retomados) antes do primeiro usuário
+PREWARM_POOLS = [tag.strip() for tag in os.getenv("ANALY_PREWARM_POOLS", "analytical,logging").split(",") if tag.strip()]
+
+# Arquivos estáticos servidos pelo app, carregados uma vez por processo
+STATIC_ASSETS = [name.strip() for name in os.getenv("ANALY_STATIC_ASSETS", "analy_temp.png").split(",") if name.strip()]
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "streamlit_app.py")
+
+_assets = {}
+_assets_lock = threading.Lock()
+
+_report = {}
+_report_lock = threading.Lock()
+_prewarm_started = False
+_prewarm_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+# Assets estáticos
+# ----------------------------------------------------------------------
+
+def get_static_asset(name):
+    """
+    Conteúdo de um asset do app, lido do disco uma única vez por processo.
+
+    Se o arquivo não puder ser lido, devolve o próprio nome para que o
+    Streamlit trate o caminho como antes.
+    """
+    data = _assets.get(name)
+    if data is not None:
+        return data
+    with _assets_lock:
+        if name not in _assets:
+            try:
+                with open(name, "rb") as f:
+                    _assets[name] = f.read()
+            except OSError:
+                return name
+    return _assets[name]
+
+
+# ----------------------------------------------------------------------
+# Etapas
+# ----------------------------------------------------------------------
+
+def _step(name, fn):
+    """Executa uma etapa registrando duração e erro; falhas não interrompem a partida"""
+    start = time.perf_counter()
+    error = None
+    try:
+        fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.exception("Erro no pré-aquecimento (%s)", name)
+    with _report_lock:
+        _report[name] = {"ms": (time.perf_counter() - start) * 1000, "error": error}
+
+
+def _import_modules():
+    for name in PREWARM_MODULES:
+        _step(f"import.{name}", lambda name=name: importlib.import_module(name))
+
+
+def _warm_pools(background):
+    from connection_pool import health_check, lease_session, pooling_enabled
+
+    # Sem pool, a sessão de `init_session()` é a do rerun: não é aquecida em segundo plano
+    if background and not pooling_enabled():
+        return
+    for tag in PREWARM_POOLS:
+        def warm(tag=tag):
+            with lease_session(tag, background=background) as (session, connected):
+                if not connected:
+                    raise RuntimeError(f"sem sessão no pool '{tag}'")
+                # A primeira consulta retoma o warehouse suspenso
+                health_check(session)
+        _step(f"pool.{tag}", warm)
+
+
+def _warm_assets():
+    for name in STATIC_ASSETS:
+        _step(f"asset.{name}", lambda name=name: get_static_asset(name))
+
+
+def _warm_ui_caches():
+    """
+    Executa uma vez, sem sessão de usuário, as funções da tela inicial que
+    consultam o warehouse ou leem arquivos, para preencher os caches do
+    processo (cache dos cards de métricas, `st.cache_*` do `frontend_ui`).
+    Fora de um rerun os comandos do Streamlit não desenham nada.
+    """
+    from connection_pool import open_session
+    from frontend_ui import apply_custom_css, exibir_cards_metricas
+    from metrics_cache import cached_metrics_session
+
+    _step("ui.css", apply_custom_css)
+
+    def warm_metrics():
+        # As cargas do cache de métricas emprestam a própria sessão do pool;
+        # esta só atende chamadas dos cards que não passam pelo cache
+        session, connected = open_session("analytical")
+        if not connected:
+            raise RuntimeError("sem sessão no pool 'analytical'")
+        exibir_cards_metricas(cached_metrics_session(session))
+    _step("ui.metrics_cards", warm_metrics)
+
+
+def prewarm(ui=True):
+    """
+    Pré-aquece o processo e retorna o relatório `{etapa: {ms, error}}`.
+
+    `ui=False` pula as funções de interface (usado quando a página já está
+    sendo servida e o pré-aquecimento roda em segundo plano).
+    """
+    start = time.perf_counter()
+    _import_modules()
+    # Sem `ui`, o pré-aquecimento roda numa thread em paralelo aos reruns
+    _warm_pools(background=not ui)
+    _warm_assets()
+    if ui:
+        _warm_ui_caches()
+    with _report_lock:
+        _report["total"] = {"ms": (time.perf_counter() - start) * 1000, "error": None}
+    return get_startup_report()
+
+
+def start_prewarm():
+    """Dispara o pré-aquecimento em segundo plano uma única vez por processo"""
+    global _prewarm_started
+    if not PREWARM_ENABLED or _prewarm_started:
+        return
+    with _prewarm_lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    submit_background(prewarm, ui=False)
+
+
+def get_startup_report():
+    with _report_lock:
+        return {name: dict(values) for name, values in _report.items()}
+
+
+def print_startup_report(report):
+    for name, values in sorted(report.items(), key=lambda item: -item[1]["ms"]):
+        status = f"  ERRO {values['error']}" if values["error"] else ""
+        print(f"{name:<32} {values['ms']:9.1f} ms{status}")
+
+
+def print_ddl():
+    """DDL das tabelas gravadas pelo app, com os nomes configurados no ambiente"""
+    from history_browser import session_index_backfill_sql, session_index_ddl
+    from log_queue import log_table_ddl
+
+    print(log_table_ddl() + ";\n")
+    print(session_index_ddl() + ";\n")
+    print("-- Preenche o índice de sessões a partir dos logs já gravados (uma vez, na implantação)")
+    print(session_index_backfill_sql() + ";")
+
+
+def main(argv=None):
+    """`python startup.py [--check | --ddl] [argumentos do streamlit run]`"""
+    global _prewarm_started
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if "--ddl" in argv:
+        print_ddl()
+        return
+    check_only = "--check" in argv
+    if check_only:
+        argv.remove("--check")
+
+    if PREWARM_ENABLED or check_only:
+        print_startup_report(prewarm(ui=True))
+        _prewarm_started = True
+    if check_only:
+        return
+
+    # Sobe o servidor no mesmo processo, com módulos e caches já carregados
+    from streamlit.web import cli as streamlit_cli
+
+    sys.argv = ["streamlit", "run", APP_PATH, *argv]
+    streamlit_cli.main()
+
+
+if __name__ == "__main__":
+    # O app importa `startup`: usa este mesmo módulo (e seus caches)
+    sys.modules.setdefault("startup", sys.modules[__name__])
+    main()
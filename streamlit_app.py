@@ -1,26 +1,231 @@
 import streamlit as st
-import pandas as pd
+import time
 from datetime import datetime
 
+import pandas as pd
+
 # Importações dos módulos separados
 from backend_service import (
-    init_session, call_cortex_agent, 
-    generate_insights, format_dataframe_display,
     extract_message_text, MESSAGES,
-    save_feedback_to_snowflake,
-    process_pending_feedback, process_agent_response, get_name_user,
-    process_customer_vision, classify_user_intent,
-    WELCOME_BOT_MESSAGE,
-    extract_cpf_or_name_from_text, get_consultor_suggestions, save_conversation_log
+    WELCOME_BOT_MESSAGE
 )
 
 from frontend_ui import (
     apply_custom_css, show_welcome_header, show_quick_links,
-    show_sidebar_links, show_loaded_session_info, display_history_modal,
-    exibir_cards_metricas, get_available_chart_types, create_advanced_visualization, show_feedback_input, 
+    show_sidebar_links, show_loaded_session_info,
+    exibir_cards_metricas, show_feedback_input,
     show_logo_insight_center, exibir_botao_dicas
 )
 
+from log_queue import enqueue_conversation_log
+from render_cache import get_render_cache
+from history_window import split_history, build_history_summary, record_render_time
+from result_store import compact_message, get_result_store, is_result_ref
+from answer_cache import answer_with_agent
+from routing import route_user_input
+from customer_lookup import get_customer_lookup
+from metrics_cache import cached_metrics_session, show_stale_notice
+from user_context import get_display_name, flush_pending_feedback
+from connection_pool import open_session
+from history_browser import show_history_browser
+from result_viewer import show_result_pages
+from exports import show_export_controls
+from tracing import TRACE_RENDER_SAMPLE, trace_request, span, current_trace_id, show_trace_panel
+from agent_stream import AGENT_STREAMING_ENABLED
+from agent_context import compact_agent_context
+from chart_specs import show_chart
+from insights import prepare_insights, show_insights
+from startup import get_static_asset, start_prewarm
+
+def render_chat_message(i, msg, render_cache):
+    """Renderiza por completo uma mensagem do histórico (texto, gráficos, tabelas e feedback)"""
+    with st.chat_message(msg["role"], avatar="🧑‍💻" if msg["role"] == "user" else get_static_asset("analy_temp.png")):
+        if msg["role"] == "user":
+            user_text = extract_message_text(msg["content"])
+            st.write(user_text)
+            return
+
+        if msg.get("ordered", False):
+            # Modo ordenado - renderizar elementos na sequência
+            processed_resp = msg.get("processed_response", {})
+            order_sequence = msg.get("order_sequence", [])
+
+            for elem_key in order_sequence:
+                elem_content = processed_resp.get(elem_key)
+
+                if elem_key.startswith("text_"):
+                    # Renderizar texto
+                    st.write(elem_content)
+
+                elif elem_key.startswith("chart_"):
+                    # Renderizar gráfico (spec compilada quando a resposta foi processada)
+                    if elem_content:
+                        show_chart(i, elem_key, elem_content, render_cache)
+
+                elif elem_key.startswith("table_"):
+                    # Renderizar tabela
+                    if elem_content and len(elem_content) > 0:
+                        render_entry = render_cache.get(i, elem_key, elem_content)
+                        with st.expander(f"📄 Dados ({render_entry.rows} linhas)", expanded=True):
+                            display_df = render_entry.preview(10)
+                            st.dataframe(display_df, use_container_width=True, height=300)
+
+                            if render_entry.rows > 10:
+                                st.caption(f"Mostrando as primeiras 10 de {render_entry.rows} linhas.")
+
+                                if st.checkbox(f"Ver mais linhas", key=f"more_rows_{i}_{elem_key}"):
+                                    show_result_pages(render_entry, key=f"{i}_{elem_key}")
+
+                            # Exportação (gerada apenas quando solicitada)
+                            show_export_controls(
+                                render_entry,
+                                key=f"{i}_{elem_key}",
+                                sql=processed_resp.get(elem_key.replace("table_", "sql_", 1)),
+                                file_name=f"dados_{i}_{elem_key}"
+                            )
+
+            # Mostrar erro se houver
+            if msg.get("error"):
+                st.error(msg["error"])
+
+            # Mostrar interpretação se houver
+            if msg.get("interpretation"):
+                st.write(msg["interpretation"])
+
+        else:
+            if msg.get("content"):
+                st.write(msg["content"])
+
+            # Mostrar erro se houver
+            if msg.get("error"):
+                st.write(msg["error"])
+
+            # Mostrar interpretação se houver (para empty_data, single_row, ou multiple_rows sem gráfico)
+            if msg.get("interpretation") and not msg.get("error"):
+                st.write(msg['interpretation'])
+
+            if msg.get("data") is not None:
+                data = msg.get("data")
+
+                if (isinstance(data, list) and len(data) > 0) or isinstance(data, pd.DataFrame) or is_result_ref(data):
+                    render_entry = render_cache.get(i, "data", data)
+
+                else:
+                    render_entry = None
+                    st.error("Não foi possível criar DataFrame dos dados")
+
+                if render_entry is not None and not render_entry.empty:
+                    # Verificar se deve mostrar gráfico
+                    if msg.get("should_show_chart", False) and msg.get("chart"):
+                        # Se chart for uma lista (múltiplos gráficos)
+                        if isinstance(msg["chart"], list):
+                            for idx, chart_spec in enumerate(msg["chart"]):
+                                st.write(f"Gráfico {idx + 1}:")
+                                show_chart(i, f"chart_{idx}", chart_spec, render_cache)
+                        else:
+                            # Um único gráfico
+                            show_chart(i, "chart", msg["chart"], render_cache)
+
+                        # Container com botão e expander inline
+                        action_container = st.container()
+                        # with action_container:
+                        #     # Criar duas colunas com proporções ajustadas
+                        #     col1, col2 = st.columns([1, 1.2])
+
+                        #     with col1:
+                        #         insights_generated = msg.get("insights") is not None and msg.get("insights") != ""
+                        #         button_label = "✅ Insights Gerados" if insights_generated else "💡 Gerar Insights"
+
+                        #         if st.button(button_label, 
+                        #                     key=f"insight_btn_{i}", 
+                        #                     use_container_width=True,
+                        #                     disabled=insights_generated):
+                        #             with st.spinner(MESSAGES["generating_insights"]):
+                        #                 user_question = extract_message_text(
+                        #                     st.session_state.messages[i-1]["content"]
+                        #                 ) if i > 0 else ""
+
+                        #                 insights = generate_insights(session, df, user_question)
+                        #                 st.session_state.messages[i]["insights"] = insights
+                        #                 st.rerun()
+
+                        #     with col2:
+                        # Expander estilizado para ficar alinhado
+                        with st.expander(f"📄 Ver Dados ({render_entry.rows} linhas)", expanded=False):
+                            # Exportação (gerada apenas quando solicitada)
+                            show_export_controls(
+                                render_entry,
+                                key=str(i),
+                                sql=msg.get("sql"),
+                                file_name=f"dados_{i}"
+                            )
+
+                            # Mostrar dados
+                            st.markdown("**📄 Dados:**")
+                            display_df = render_entry.preview(10)
+                            st.dataframe(display_df, use_container_width=True, height=300)
+
+                            if render_entry.rows > 10:
+                                st.caption(f"Mostrando as primeiras 10 de {render_entry.rows} linhas.")
+
+                                # Paginação para ver mais dados
+                                if st.checkbox("Ver mais linhas", key=f"more_rows_{i}"):
+                                    show_result_pages(render_entry, key=str(i))
+
+                        # Insights gerados em segundo plano (acompanha a tarefa sem bloquear o rerun)
+                        show_insights(msg, key=str(i))
+
+                    else:
+                        # Quando não há gráfico, o expander pode ficar em largura total
+                        with st.expander(f"📄 Dados Detalhados ({render_entry.rows} linhas)", expanded=True):
+                            display_df = render_entry.preview(10)
+                            st.dataframe(display_df, use_container_width=True)
+
+                            if render_entry.rows > 10:
+                                st.caption(f"Mostrando as primeiras 10 de {render_entry.rows} linhas.")
+
+                                # Opção para ver mais dados
+                                if st.checkbox("Ver mais linhas", key=f"more_rows_no_chart_{i}"):
+                                    show_result_pages(render_entry, key=f"no_chart_{i}")
+                else:
+                    pass
+            else:
+                pass
+
+        # ===== FEEDBACK PARA TODAS AS MENSAGENS DO ASSISTENTE =====
+        # Adicionar uma pequena separação visual
+        st.markdown("---")
+
+        # Obter informações para o feedback
+        user_question = ""
+        if i > 0 and st.session_state.messages[i-1]["role"] == "user":
+            user_question = extract_message_text(st.session_state.messages[i-1]["content"])
+
+        # Determinar o tipo de resposta para o feedback
+        response_type = "text"
+        if msg.get("ordered", False):
+            # Para modo ordenado, verificar se tem gráfico ou tabela
+            if any(k.startswith("chart_") for k in msg.get("order_sequence", [])):
+                response_type = "chart"
+            elif any(k.startswith("table_") for k in msg.get("order_sequence", [])):
+                response_type = "data_table"
+        else:
+            if msg.get("data") is not None:
+                if msg.get("should_show_chart", False):
+                    response_type = "chart"
+                else:
+                    response_type = "data_table"
+            elif msg.get("error"):
+                response_type = "error"
+
+        # Exibir botões de feedback
+        show_feedback_input(
+            message_index=i,
+            graph_type=response_type,
+            sql_query=msg.get("sql", ""),
+            user_question=user_question
+        )
+
 def main():
     """Função principal da aplicação"""
     # 1) Configuração da página
@@ -32,12 +237,20 @@ def main():
     # 2) Aplica CSS customizado
     apply_custom_css()
 
-    # 3) Conexão
-    session, connected = init_session()
+    # Pré-aquecimento do processo em segundo plano (sem efeito se já feito pelo startup.py)
+    start_prewarm()
+
+    # 3) Conexão: com o pool, cada consulta empresta uma sessão só enquanto executa
+    session, connected = open_session("analytical")
     if not connected:
         st.error(MESSAGES["connection_error"])
         st.stop()
 
+    run_chat(session)
+
+
+def run_chat(session):
+    """Executa a página do chat com a sessão do rerun atual"""
     # 4) Inicializa estados de sessão
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -53,16 +266,21 @@ def main():
     # 5) Recupera nome do usuário autenticado
     username = st.user.email.upper()
 
-    username_first = get_name_user(session, username)
+    username_first = get_display_name(session, username)
 
     #username_first = st.user.email.split("@")[0].upper()
     
-    # 5.1) Processa feedbacks pendentes
-    process_pending_feedback(session, username)
+    # 5.1) Pré-carrega em segundo plano a carteira de clientes do consultor
+    get_customer_lookup().prefetch_consultor_portfolio(session, username)
+
+    # 5.2) Processa feedbacks pendentes (apenas quando houver feedback novo)
+    flush_pending_feedback(session, username)
     
     if len(st.session_state.messages) == 0:
         show_welcome_header(username_first)
-        exibir_cards_metricas(session)
+        metrics_session = cached_metrics_session(session)
+        exibir_cards_metricas(metrics_session)
+        show_stale_notice(metrics_session)
         show_quick_links()
 
     # 8) Sidebar: Links rápidos + histórico + controles
@@ -75,6 +293,11 @@ def main():
         if st.button("🔄 Nova Conversa", use_container_width=True, type="primary"):
             # Limpa todas as mensagens e estados relacionados
             st.session_state.messages = []
+            get_render_cache().clear()
+            get_result_store().clear()
+            if "expanded_history" in st.session_state:
+                del st.session_state["expanded_history"]
+            st.session_state.pop("insight_jobs", None)
             if "agent_messages" in st.session_state:
                 st.session_state.agent_messages = []
             if "session_loaded" in st.session_state:
@@ -92,7 +315,10 @@ def main():
     
         
         st.markdown("### 📂 Histórico de Conversas")
-        display_history_modal(session, username)
+        show_history_browser(session, username)
+
+        # Latência por etapa (apenas administradores)
+        show_trace_panel(username)
         
     # 9) Mostra informações de sessão carregada se houver
     show_loaded_session_info()
@@ -141,157 +367,174 @@ def main():
         #                 st.success("✅ PDF gerado com sucesso!")
 
         if user_input:
-            st.session_state.messages.append({
-                "role": "user",
-                "content": [{"type": "text", "text": user_input}]
-            })
-            
-            save_conversation_log(session, username, "user", user_input, thinking_log="")
+            with trace_request("chat_turn", username=username):
+                # Resume os turnos antigos do contexto do agent antes da nova pergunta
+                compact_agent_context()
 
-            user_intent = classify_user_intent(session, user_input)
-            
-            # Extrai CPF/CNPJ/Nome do texto
-            id_customer = extract_cpf_or_name_from_text(session, user_input)
-
-            # Caso o usuário pesquise detalhamento de cliente por nome, vamos deixar o Agent processar
-            if user_intent == "customer_details" and ('consultor' not in user_input):# and ("nome" not in id_customer):
-                # Adicionar mensagem do usuário ao contexto do agent ANTES do processamento
-                user_message = {
+                st.session_state.messages.append({
                     "role": "user",
                     "content": [{"type": "text", "text": user_input}]
-                }
-                st.session_state.agent_messages.append(user_message)
+                })
+            
+                with span("log.enqueue"):
+                    enqueue_conversation_log(session, username, "user", user_input, thinking_log="")
+
+                # Classifica a intenção e extrai CPF/CNPJ/Nome do texto em paralelo
+                with span("routing"):
+                    routing = route_user_input(session, user_input)
+                user_intent = routing.user_intent
+                id_customer = routing.id_customer
+
+                # Caso o usuário pesquise detalhamento de cliente por nome, vamos deixar o Agent processar
+                if user_intent == "customer_details" and ('consultor' not in user_input):# and ("nome" not in id_customer):
+                    # Adicionar mensagem do usuário ao contexto do agent ANTES do processamento
+                    user_message = {
+                        "role": "user",
+                        "content": [{"type": "text", "text": user_input}]
+                    }
+                    st.session_state.agent_messages.append(user_message)
+
+                    with st.spinner(MESSAGES["search_visao"]), span("customer_lookup"):
+                        processed_response = get_customer_lookup().get(session, user_input, id_customer, username)
+
+                    if processed_response:
+                        assistant_msg = {
+                            "role": "assistant",
+                            "content": processed_response["text"],
+                            "timestamp": datetime.now(),
+                            "data": processed_response.get("data", False)
+                        }
+                        st.session_state.messages.append(compact_message(assistant_msg))
+
+                        # Adicionar resposta do assistente ao contexto do agent
+                        agent_assistant_msg = {
+                            "role": "assistant",
+                            "content": [{"type": "text", "text": processed_response["text"]}]
+                        }
+                        st.session_state.agent_messages.append(agent_assistant_msg)
+
+                        has_data = processed_response.get("data", False) is not False
+                        enqueue_conversation_log(
+                            session,
+                            username,
+                            "assistant",
+                            processed_response["text"],
+                            has_data=has_data,
+                            assistant_msg_dict=assistant_msg,
+                            thinking_log=""
+                            )
+
+                        st.session_state["_pending_trace_id"] = current_trace_id()
+                        st.rerun()
 
-                with st.spinner(MESSAGES["search_visao"]):
-                    processed_response = process_customer_vision(session, user_input, id_customer)
+                    else:
+                        # Se não encontrou na visão, tenta via Cortex Agent
+                        with st.spinner(MESSAGES["search_alternative"]):  # Nova mensagem para busca alternativa
+                            processed_response = answer_with_agent(session, username, user_input)
+                    
+                elif AGENT_STREAMING_ENABLED:
+                    # Modo streaming: exibe a pergunta e a resposta à medida que chega
+                    with st.chat_message("user", avatar="🧑‍💻"):
+                        st.write(user_input)
+                    processed_response = answer_with_agent(session, username, user_input, stream=True)
+
+                else:
+                    with st.spinner(MESSAGES["thinking"]):
+                        processed_response = answer_with_agent(session, username, user_input)
 
-                if processed_response:
+                # 4. Processar resposta (comum para ambos os caminhos)
+                if processed_response["response_type"] == "invalid_response":
                     assistant_msg = {
                         "role": "assistant",
-                        "content": processed_response["text"],
+                        "content": "",
+                        "interpretation": processed_response["interpretation"],
                         "timestamp": datetime.now(),
-                        "data": processed_response.get("data", False)
+                        "error": processed_response["error"]
                     }
-                    st.session_state.messages.append(assistant_msg)
-
-                    # Adicionar resposta do assistente ao contexto do agent
-                    agent_assistant_msg = {
+                elif processed_response["response_type"] == "error":
+                    assistant_msg = {
+                        "role": "assistant",
+                        "content": processed_response["text"] or MESSAGES["error"],
+                        "timestamp": datetime.now(),
+                        "error": processed_response["error"]
+                    }
+                elif processed_response["response_type"] == "text_only":
+                    assistant_msg = {
                         "role": "assistant",
-                        "content": [{"type": "text", "text": processed_response["text"]}]
+                        "content": processed_response["text"],
+                        "timestamp": datetime.now()
+                    }
+                elif processed_response["response_type"] in ["empty_data", "single_row", "multiple_rows", "sql_success", "data_only"]:
+                    assistant_msg = {
+                        "role": "assistant",
+                        "content": processed_response.get("text", ""),
+                        "sql": processed_response.get("sql", ""),
+                        "data": processed_response.get("data"),
+                        "interpretation": processed_response.get("interpretation", ""),
+                        "should_show_chart": processed_response.get("should_show_chart", False),
+                        "chart": processed_response.get("chart"),
+                        "insights": "",
+                        "timestamp": datetime.now(),
+                        "ordered": processed_response.get("ordered", False),
+                        "order_sequence": processed_response.get("order_sequence", []),
+                        "processed_response": processed_response
                     }
-                    st.session_state.agent_messages.append(agent_assistant_msg)
-
-                    has_data = processed_response.get("data", False) is not False
-                    save_conversation_log(
-                        session,
-                        username,
-                        "assistant",
-                        processed_response["text"],
-                        has_data=has_data,
-                        assistant_msg_dict=assistant_msg,
-                        thinking_log=""
-                        )
-
-                    st.rerun()
 
+                compact_msg = compact_message(assistant_msg)
+                if compact_msg.get("should_show_chart") and compact_msg.get("data") is not None:
+                    # Insights gerados em segundo plano a partir do perfil dos dados (sob demanda)
+                    prepare_insights(compact_msg, user_input)
+                st.session_state.messages.append(compact_msg)
+
+                if assistant_msg.get("ordered", False):
+                    text_parts = []
+                    order_sequence = assistant_msg.get("order_sequence", [])
+                    processed_resp = assistant_msg.get("processed_response", {})
+
+                    for key in order_sequence:
+                        if key.startswith("text_"):
+                            text_content = processed_resp.get(key, "")
+                            if text_content:
+                                text_parts.append(text_content)
+
+                    assistant_text = "\n\n".join(text_parts) if text_parts else ""
+                    sql_query = ""  # SQL pode estar em sql_1, sql_2, etc - pegar o primeiro
+                    for key in order_sequence:
+                        if key.startswith("sql_"):
+                            sql_query = processed_resp.get(key, "")
+                            break
                 else:
-                    # Se não encontrou na visão, tenta via Cortex Agent
-                    with st.spinner(MESSAGES["search_alternative"]):  # Nova mensagem para busca alternativa
-                        response = call_cortex_agent(user_input)
-                        processed_response = process_agent_response(session, user_input, response)
-                    
-            else:
-                with st.spinner(MESSAGES["thinking"]):
-                    response = call_cortex_agent(user_input)
-                    processed_response = process_agent_response(session, user_input, response)
-
-            # 4. Processar resposta (comum para ambos os caminhos)
-            if processed_response["response_type"] == "invalid_response":
-                assistant_msg = {
-                    "role": "assistant",
-                    "content": "",
-                    "interpretation": processed_response["interpretation"],
-                    "timestamp": datetime.now(),
-                    "error": processed_response["error"]
-                }
-            elif processed_response["response_type"] == "error":
-                assistant_msg = {
-                    "role": "assistant",
-                    "content": processed_response["text"] or MESSAGES["error"],
-                    "timestamp": datetime.now(),
-                    "error": processed_response["error"]
-                }
-            elif processed_response["response_type"] == "text_only":
-                assistant_msg = {
-                    "role": "assistant",
-                    "content": processed_response["text"],
-                    "timestamp": datetime.now()
-                }
-            elif processed_response["response_type"] in ["empty_data", "single_row", "multiple_rows", "sql_success", "data_only"]:
-                assistant_msg = {
-                    "role": "assistant",
-                    "content": processed_response.get("text", ""),
-                    "sql": processed_response.get("sql", ""),
-                    "data": processed_response.get("data"),
-                    "interpretation": processed_response.get("interpretation", ""),
-                    "should_show_chart": processed_response.get("should_show_chart", False),
-                    "chart": processed_response.get("chart"),
-                    "insights": "",
-                    "timestamp": datetime.now(),
-                    "ordered": processed_response.get("ordered", False),
-                    "order_sequence": processed_response.get("order_sequence", []),
-                    "processed_response": processed_response
-                }
-
-            st.session_state.messages.append(assistant_msg)
-
-            if assistant_msg.get("ordered", False):
-                text_parts = []
-                order_sequence = assistant_msg.get("order_sequence", [])
-                processed_resp = assistant_msg.get("processed_response", {})
-
-                for key in order_sequence:
-                    if key.startswith("text_"):
-                        text_content = processed_resp.get(key, "")
-                        if text_content:
-                            text_parts.append(text_content)
-
-                assistant_text = "\n\n".join(text_parts) if text_parts else ""
-                sql_query = ""  # SQL pode estar em sql_1, sql_2, etc - pegar o primeiro
-                for key in order_sequence:
-                    if key.startswith("sql_"):
-                        sql_query = processed_resp.get(key, "")
-                        break
-            else:
-                assistant_text = assistant_msg.get("content", "")
-                sql_query = assistant_msg.get("sql", "")
-
-            error_msg = assistant_msg.get("error", "")
-            has_data = assistant_msg.get("data") is not None or assistant_msg.get("should_show_chart", False)
-
-            # Determinar error_message baseado no response_type
-            error_message_to_log = None
-            if processed_response["response_type"] in ["error", "invalid_response"]:
-                # Priorizar mensagem de 'error', depois 'content'
-                error_message_to_log = (
-                    assistant_msg.get("error") or 
-                    assistant_msg.get("content") or 
-                    "Erro não especificado"
-                )
+                    assistant_text = assistant_msg.get("content", "")
+                    sql_query = assistant_msg.get("sql", "")
+
+                error_msg = assistant_msg.get("error", "")
+                has_data = assistant_msg.get("data") is not None or assistant_msg.get("should_show_chart", False)
+
+                # Determinar error_message baseado no response_type
+                error_message_to_log = None
+                if processed_response["response_type"] in ["error", "invalid_response"]:
+                    # Priorizar mensagem de 'error', depois 'content'
+                    error_message_to_log = (
+                        assistant_msg.get("error") or 
+                        assistant_msg.get("content") or 
+                        "Erro não especificado"
+                    )
 
-            save_conversation_log(
-                session,
-                username,
-                "assistant",
-                assistant_text,
-                sql_query=sql_query if sql_query else None,
-                has_data=has_data,
-                error_message=error_message_to_log,
-                assistant_msg_dict=assistant_msg,
-                thinking_log=processed_response.get("thinking_log", "")
-            )
+                enqueue_conversation_log(
+                    session,
+                    username,
+                    "assistant",
+                    assistant_text,
+                    sql_query=sql_query if sql_query else None,
+                    has_data=has_data,
+                    error_message=error_message_to_log,
+                    assistant_msg_dict=assistant_msg,
+                    thinking_log=processed_response.get("thinking_log", "")
+                )
 
-            st.rerun()
+                # A renderização do próximo rerun entra no mesmo rastreamento
+                st.session_state["_pending_trace_id"] = current_trace_id()
+                st.rerun()
 
         # -------------------------------------------------------------
         # RENDERIZAÇÃO DAS MENSAGENS
@@ -307,248 +550,50 @@ def main():
                     st.markdown("#### 💬 Chat com a Analy")
                 
                 if WELCOME_BOT_MESSAGE:
-                    with st.chat_message("assistant", avatar="analy_temp.png"):
+                    with st.chat_message("assistant", avatar=get_static_asset("analy_temp.png")):
                         st.write(WELCOME_BOT_MESSAGE)
 
                 with chat_header_col2:
                     exibir_botao_dicas()
 
-            for i, msg in enumerate(st.session_state.messages):
-                with st.chat_message(msg["role"], avatar="🧑‍💻" if msg["role"] == "user" else "analy_temp.png"):
-                    if msg["role"] == "user":
-                        user_text = extract_message_text(msg["content"])
-                        st.write(user_text)
-                        continue
-
-                    if msg.get("ordered", False):
-                        # Modo ordenado - renderizar elementos na sequência
-                        processed_resp = msg.get("processed_response", {})
-                        order_sequence = msg.get("order_sequence", [])
-                        
-                        for elem_key in order_sequence:
-                            elem_content = processed_resp.get(elem_key)
-                            
-                            if elem_key.startswith("text_"):
-                                # Renderizar texto
-                                st.write(elem_content)
-                                
-                            elif elem_key.startswith("chart_"):
-                                # Renderizar gráfico Vega-Lite diretamente
-                                if elem_content:
-                                    try:
-                                        import json
-                                        chart_spec = json.loads(elem_content) if isinstance(elem_content, str) else elem_content
-                                        st.vega_lite_chart(chart_spec, use_container_width=True)
-                                    except Exception as e:
-                                        st.error(f"Erro ao renderizar gráfico: {str(e)}")
-                            
-                            elif elem_key.startswith("table_"):
-                                # Renderizar tabela
-                                if elem_content and len(elem_content) > 0:
-                                    df = pd.DataFrame(elem_content)
-                                    with st.expander(f"📄 Dados ({len(df)} linhas)", expanded=True):
-                                        display_df = format_dataframe_display(df.head(10))
-                                        st.dataframe(display_df, use_container_width=True, height=300)
-                                        
-                                        if len(df) > 10:
-                                            st.caption(f"Mostrando as primeiras 10 de {len(df)} linhas.")
-                                            
-                                            if st.checkbox(f"Ver mais linhas", key=f"more_rows_{i}_{elem_key}"):
-                                                num_rows = st.slider(
-                                                    "Número de linhas:",
-                                                    min_value=10,
-                                                    max_value=min(len(df), 1000),
-                                                    value=10,
-                                                    step=10,
-                                                    key=f"slider_{i}_{elem_key}"
-                                                )
-                                                display_df_extended = format_dataframe_display(df.head(num_rows))
-                                                st.dataframe(display_df_extended, use_container_width=True)
-                                        
-                                        # Botão de download CSV
-                                        csv = df.to_csv(index=False).encode('utf-8')
-                                        st.download_button(
-                                            label="📥 Baixar CSV",
-                                            data=csv,
-                                            file_name=f"dados_{i}_{elem_key}.csv",
-                                            mime="text/csv",
-                                            key=f"download_{i}_{elem_key}"
-                                        )
-                        
-                        # Mostrar erro se houver
-                        if msg.get("error"):
-                            st.error(msg["error"])
-                        
-                        # Mostrar interpretação se houver
-                        if msg.get("interpretation"):
-                            st.write(msg["interpretation"])
-                    
-                    else:
-                        if msg.get("content"):
-                            st.write(msg["content"])
+            pending_trace_id = st.session_state.pop("_pending_trace_id", None)
+            with trace_request(
+                "render", trace_id=pending_trace_id, sample_rate=TRACE_RENDER_SAMPLE,
+                messages=len(st.session_state.messages)
+            ):
+                render_cache = get_render_cache()
+                render_start = time.perf_counter()
+
+                messages = st.session_state.messages
+                window_start = split_history(messages)
+                rendered_count = len(messages) - window_start
+
+                # Turnos antigos: resumo leve, com expansão sob demanda
+                if window_start > 0:
+                    with st.expander(f"🕘 {window_start} mensagens anteriores", expanded=False):
+                        st.markdown(build_history_summary(messages, window_start))
+                        expanded = st.multiselect(
+                            "Expandir mensagens:",
+                            options=[idx for idx in range(window_start) if messages[idx]["role"] == "assistant"],
+                            format_func=lambda idx: f"Mensagem {idx + 1}",
+                            key="expanded_history"
+                        )
+
+                    for idx in sorted(expanded):
+                        if idx > 0 and messages[idx - 1]["role"] == "user":
+                            render_chat_message(idx - 1, messages[idx - 1], render_cache)
+                            rendered_count += 1
+                        render_chat_message(idx, messages[idx], render_cache)
+                        rendered_count += 1
+
+                for i in range(window_start, len(messages)):
+                    render_chat_message(i, messages[i], render_cache)
+
+                record_render_time(
+                    (time.perf_counter() - render_start) * 1000,
+                    len(messages),
+                    rendered_count
+                )
 
-                        # Mostrar erro se houver
-                        if msg.get("error"):
-                            st.write(msg["error"])
-                        
-                        # Mostrar interpretação se houver (para empty_data, single_row, ou multiple_rows sem gráfico)
-                        if msg.get("interpretation") and not msg.get("error"):
-                            st.write(msg['interpretation'])
-
-                        if msg.get("data") is not None:
-                            data = msg.get("data")
-                            
-                            if isinstance(data, list) and len(data) > 0:
-                                df = pd.DataFrame(data)
-                            
-                            elif isinstance(data, pd.DataFrame):
-                                df = data
-                           
-                            else:
-                                df = pd.DataFrame()
-                                st.error("Não foi possível criar DataFrame dos dados")
-                            
-                            if not df.empty:
-                                # Verificar se deve mostrar gráfico
-                                if msg.get("should_show_chart", False) and msg.get("chart"):
-                                    try:
-                                        import json
-                                        # Se chart for uma lista (múltiplos gráficos)
-                                        if isinstance(msg["chart"], list):
-                                            for idx, chart_spec_str in enumerate(msg["chart"]):
-                                                st.write(f"Gráfico {idx + 1}:")
-                                                chart_spec = json.loads(chart_spec_str) if isinstance(chart_spec_str, str) else chart_spec_str
-                                                st.vega_lite_chart(chart_spec, use_container_width=True)
-                                        else:
-                                            # Um único gráfico
-                                            chart_spec = json.loads(msg["chart"]) if isinstance(msg["chart"], str) else msg["chart"]
-                                            st.vega_lite_chart(chart_spec, use_container_width=True)
-                                    except Exception as e:
-                                        st.error(f"Erro ao renderizar gráfico: {str(e)}")
-                                        st.code(f"Chart content: {msg['chart'][:200]}...")  # DEBUG
-                                    
-                                    # Container com botão e expander inline
-                                    action_container = st.container()
-                                    # with action_container:
-                                    #     # Criar duas colunas com proporções ajustadas
-                                    #     col1, col2 = st.columns([1, 1.2])
-                                        
-                                    #     with col1:
-                                    #         insights_generated = msg.get("insights") is not None and msg.get("insights") != ""
-                                    #         button_label = "✅ Insights Gerados" if insights_generated else "💡 Gerar Insights"
-                                            
-                                    #         if st.button(button_label, 
-                                    #                     key=f"insight_btn_{i}", 
-                                    #                     use_container_width=True,
-                                    #                     disabled=insights_generated):
-                                    #             with st.spinner(MESSAGES["generating_insights"]):
-                                    #                 user_question = extract_message_text(
-                                    #                     st.session_state.messages[i-1]["content"]
-                                    #                 ) if i > 0 else ""
-                                                    
-                                    #                 insights = generate_insights(session, df, user_question)
-                                    #                 st.session_state.messages[i]["insights"] = insights
-                                    #                 st.rerun()
-                                        
-                                    #     with col2:
-                                    # Expander estilizado para ficar alinhado
-                                    with st.expander(f"📄 Ver Dados ({len(df)} linhas)", expanded=False):
-                                        # Botão de download CSV
-                                        csv = df.to_csv(index=False).encode('utf-8')
-                                        st.download_button(
-                                            label="📥 Baixar CSV",
-                                            data=csv,
-                                            file_name=f"dados_{i}.csv",
-                                            mime="text/csv",
-                                            key=f"download_{i}",
-                                            help="Baixar CSV"
-                                        )
-                                        
-                                        # Mostrar dados
-                                        st.markdown("**📄 Dados:**")
-                                        display_df = format_dataframe_display(df.head(10))
-                                        st.dataframe(display_df, use_container_width=True, height=300)
-                                        
-                                        if len(df) > 10:
-                                            st.caption(f"Mostrando as primeiras 10 de {len(df)} linhas.")
-                                            
-                                            # Slider para ver mais dados
-                                            if st.checkbox("Ver mais linhas", key=f"more_rows_{i}"):
-                                                num_rows = st.slider(
-                                                    "Número de linhas:",
-                                                    min_value=10,
-                                                    max_value=min(len(df), 1000),
-                                                    value=10,
-                                                    step=10,
-                                                    key=f"slider_{i}"
-                                                )
-                                                display_df_extended = format_dataframe_display(df.head(num_rows))
-                                                st.dataframe(display_df_extended, use_container_width=True)
-                                    
-                                    # Exibir insights abaixo se já foram gerados
-                                    if msg.get("insights"):
-                                        st.markdown("---")
-                                        st.markdown("### 💡 Insights Identificados")
-                                        st.markdown(msg["insights"])
-                                
-                                else:
-                                    # Quando não há gráfico, o expander pode ficar em largura total
-                                    with st.expander(f"📄 Dados Detalhados ({len(df)} linhas)", expanded=True):
-                                        display_df = format_dataframe_display(df.head(10))
-                                        st.dataframe(display_df, use_container_width=True)
-                                        
-                                        if len(df) > 10:
-                                            st.caption(f"Mostrando as primeiras 10 de {len(df)} linhas.")
-                                            
-                                            # Opção para ver mais dados
-                                            if st.checkbox("Ver mais linhas", key=f"more_rows_no_chart_{i}"):
-                                                num_rows = st.slider(
-                                                    "Número de linhas:",
-                                                    min_value=10,
-                                                    max_value=min(len(df), 1000),
-                                                    value=10,
-                                                    step=10,
-                                                    key=f"slider_no_chart_{i}"
-                                                )
-                                                display_df_extended = format_dataframe_display(df.head(num_rows))
-                                                st.dataframe(display_df_extended, use_container_width=True)
-                            else:
-                                pass
-                        else:
-                            pass
-                    
-                    # ===== FEEDBACK PARA TODAS AS MENSAGENS DO ASSISTENTE =====
-                    # Adicionar uma pequena separação visual
-                    st.markdown("---")
-                    
-                    # Obter informações para o feedback
-                    user_question = ""
-                    if i > 0 and st.session_state.messages[i-1]["role"] == "user":
-                        user_question = extract_message_text(st.session_state.messages[i-1]["content"])
-                    
-                    # Determinar o tipo de resposta para o feedback
-                    response_type = "text"
-                    if msg.get("ordered", False):
-                        # Para modo ordenado, verificar se tem gráfico ou tabela
-                        if any(k.startswith("chart_") for k in msg.get("order_sequence", [])):
-                            response_type = "chart"
-                        elif any(k.startswith("table_") for k in msg.get("order_sequence", [])):
-                            response_type = "data_table"
-                    else:
-                        if msg.get("data") is not None:
-                            if msg.get("should_show_chart", False):
-                                response_type = "chart"
-                            else:
-                                response_type = "data_table"
-                        elif msg.get("error"):
-                            response_type = "error"
-                    
-                    # Exibir botões de feedback
-                    show_feedback_input(
-                        message_index=i,
-                        graph_type=response_type,
-                        sql_query=msg.get("sql", ""),
-                        user_question=user_question
-                    )
 if __name__ == "__main__":
     main()
@@ -0,0 +1,374 @@
+"""
+Rastreamento de latência por requisição do chat.
+
+Uma pergunta passa por gravação do log, classificação de intenção, extração
+de cliente, visão do cliente ou Cortex Agent, processamento da resposta (com
+as consultas SQL), outra gravação de log e a renderização — sem nenhuma
+medida de onde o tempo de uma resposta lenta foi gasto. Aqui cada requisição
+recebe um id e spans aninhados por etapa; as consultas executadas pelo app
+com a sessão do pool viram spans "sql", abertos no ponto da execução. O
+backend recebe sempre a sessão Snowpark original, sem proxy, e o tempo das
+consultas dele fica no span da etapa que o chamou. Os spans são exportados em JSONL
+com os campos do OpenTelemetry (traceId, spanId, parentSpanId, tempos em
+nanossegundos) e resumidos por etapa (p50/p95/p99) num painel da sidebar
+visível apenas para administradores.
+
+A gravação do arquivo acontece numa thread exportadora, fora do rerun: a
+requisição só enfileira os spans, e o arquivo é rotacionado por tamanho. O
+texto das consultas vai para os spans sem literais (CPF/CNPJ, nomes e valores
+viram `?`), com um hash para agrupar as consultas iguais. As renderizações sem
+pergunta são amostradas. Spans de tarefas em segundo plano que terminam depois
+da requisição são exportados sozinhos quando terminam.
+"""
+
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from logging.handlers import QueueListener, RotatingFileHandler
+
+import streamlit as st
+
+
+TRACING_ENABLED = os.getenv("ANALY_TRACING", "1") == "1"
+
+# Arquivo JSONL com os spans exportados (vazio desativa a exportação)
+TRACE_FILE = os.getenv("ANALY_TRACE_FILE", "analy_traces.jsonl")
+
+# Rotação do arquivo de spans: tamanho máximo (em MB) e arquivos antigos mantidos
+TRACE_FILE_MAX_MB = float(os.getenv("ANALY_TRACE_FILE_MAX_MB", "50"))
+TRACE_FILE_BACKUPS = int(os.getenv("ANALY_TRACE_FILE_BACKUPS", "5"))
+
+# Lotes de spans aguardando a thread exportadora; acima disso são descartados
+TRACE_QUEUE_MAX_SIZE = int(os.getenv("ANALY_TRACE_QUEUE_MAX_SIZE", "10000"))
+
+# Fração das renderizações sem pergunta (reruns de widgets) que são rastreadas
+TRACE_RENDER_SAMPLE = float(os.getenv("ANALY_TRACE_RENDER_SAMPLE", "0.1"))
+
+# Quantidade de durações mantidas por etapa para os percentis
+TRACE_STATS_WINDOW = int(os.getenv("ANALY_TRACE_STATS_WINDOW", "1000"))
+
+# E-mails (separados por vírgula) que podem ver o painel de latência
+TRACE_ADMINS = {e.strip().upper() for e in os.getenv("ANALY_ADMINS", "").split(",") if e.strip()}
+
+# Tamanho máximo do texto da consulta guardado nos spans de SQL
+SQL_ATTRIBUTE_MAX_CHARS = 500
+
+_SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER_RE = re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?\b")
+
+# Exceções de controle de fluxo do Streamlit (st.rerun / st.stop) não são erros
+_CONTROL_FLOW_EXCEPTIONS = ("RerunException", "StopException")
+
+_current_span = contextvars.ContextVar("analy_current_span", default=None)
+
+
+class Span:
+    """Trecho cronometrado de uma requisição"""
+
+    def __init__(self, name, trace, parent=None, attributes=None):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_otel(self):
+        """Span no formato JSON do OpenTelemetry (um por linha no arquivo)"""
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error
+            else {"code": "STATUS_CODE_OK"},
+            "resource": {"service.name": "analy"},
+        }
+
+
+class Trace:
+    """Spans de uma requisição, exportados juntos quando a requisição termina"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def close(self):
+        """Marca a requisição como encerrada e devolve os spans já terminados"""
+        with self._lock:
+            self.finished = True
+            return [span for span in self.spans if span.end_ns is not None]
+
+    def end(self, span):
+        """Encerra um span; devolve True se a requisição já tinha sido exportada"""
+        with self._lock:
+            span.end_ns = time.time_ns()
+            return self.finished
+
+
+class _SpanFormatter(logging.Formatter):
+    """Serializa um lote de spans (um por linha), na thread exportadora"""
+
+    def format(self, record):
+        return "\n".join(json.dumps(item, ensure_ascii=False, default=str) for item in record.msg)
+
+
+class _SpanExporter:
+    """
+    Fila de lotes de spans drenada por uma thread (`QueueListener`) que grava
+    o arquivo JSONL com rotação por tamanho
+    """
+
+    def __init__(self, path, max_bytes, backups, max_size=TRACE_QUEUE_MAX_SIZE):
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        handler.setFormatter(_SpanFormatter())
+        self._listener = QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def export(self, spans):
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": [span.to_otel() for span in spans]}))
+        except queue.Full:
+            # Exportador atrasado: descarta em vez de segurar a requisição
+            self.dropped += len(spans)
+
+    def stop(self):
+        """Grava o que está na fila e encerra a thread (apenas uma vez)"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+
+class Tracer:
+    """Agrega as durações por etapa e exporta os spans para o arquivo JSONL"""
+
+    def __init__(self, path=TRACE_FILE, window=TRACE_STATS_WINDOW,
+                 max_bytes=int(TRACE_FILE_MAX_MB * 1024 * 1024), backups=TRACE_FILE_BACKUPS):
+        self.path = path
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._exporter = _SpanExporter(path, max_bytes, backups) if path and TRACING_ENABLED else None
+        if self._exporter is not None:
+            atexit.register(self._exporter.stop)
+
+    def finish(self, trace):
+        """Registra as durações dos spans terminados da requisição e os exporta"""
+        self._record(trace.close())
+
+    def finish_late(self, span):
+        """Span que terminou depois de a requisição ter sido exportada"""
+        self._record([span])
+
+    def _record(self, spans):
+        if not spans:
+            return
+        with self._lock:
+            for span in spans:
+                self._durations[span.name].append(span.duration_ms)
+        if self._exporter is not None:
+            self._exporter.export(spans)
+
+    @property
+    def dropped(self):
+        return self._exporter.dropped if self._exporter is not None else 0
+
+    def get_stage_stats(self):
+        """`{etapa: {count, p50_ms, p95_ms, p99_ms, max_ms}}` das durações recentes"""
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self._durations.items() if values}
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": _percentile(values, 50),
+                "p95_ms": _percentile(values, 95),
+                "p99_ms": _percentile(values, 99),
+                "max_ms": values[-1],
+            }
+            for name, values in durations.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+
+
+def _percentile(sorted_values, pct):
+    """Percentil por interpolação linear de uma lista já ordenada"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    """Retorna o rastreador do processo"""
+    return _tracer
+
+
+@contextmanager
+def _open_span(name, trace, parent, attributes):
+    span = Span(name, trace, parent, attributes)
+    trace.add(span)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        if type(e).__name__ not in _CONTROL_FLOW_EXCEPTIONS:
+            span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if trace.end(span):
+            # Tarefa em segundo plano que terminou depois da requisição
+            _tracer.finish_late(span)
+        _current_span.reset(token)
+
+
+@contextmanager
+def trace_request(name, trace_id=None, sample_rate=1.0, **attributes):
+    """
+    Abre a requisição (span raiz) e exporta todos os spans ao final.
+
+    `trace_id` permite continuar uma requisição iniciada num rerun anterior
+    (por exemplo, a renderização que segue o `st.rerun()` de uma resposta);
+    requisições novas são rastreadas com probabilidade `sample_rate`.
+    """
+    if not TRACING_ENABLED or (trace_id is None and sample_rate < 1 and random.random() >= sample_rate):
+        yield None
+        return
+    trace = Trace(trace_id)
+    try:
+        with _open_span(name, trace, None, attributes) as root:
+            yield root
+    finally:
+        _tracer.finish(trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Span filho do span atual; fora de uma requisição não registra nada"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _open_span(name, parent.trace, parent, attributes) as child:
+        yield child
+
+
+def set_span_attributes(**attributes):
+    """Adiciona atributos ao span atual (sem efeito fora de uma requisição)"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+# ----------------------------------------------------------------------
+# Tempo de SQL
+# ----------------------------------------------------------------------
+
+def redact_sql(query):
+    """Consulta sem literais de texto e números (viram `?`), para guardar nos spans"""
+    return _SQL_NUMBER_RE.sub("?", _SQL_STRING_RE.sub("?", str(query)))
+
+
+def sql_fingerprint(redacted):
+    """Hash curto da consulta sem literais, para agrupar execuções da mesma consulta"""
+    return hashlib.sha1(" ".join(redacted.split()).encode("utf-8")).hexdigest()[:16]
+
+
+@contextmanager
+def sql_span(query, method):
+    """
+    Span "sql" de uma execução de consulta, aberto no ponto em que o app a
+    executa (a sessão Snowpark não é envolvida em proxy nenhum).
+    """
+    redacted = redact_sql(query)
+    with span(
+        "sql", method=method, query=redacted[:SQL_ATTRIBUTE_MAX_CHARS], query_hash=sql_fingerprint(redacted)
+    ) as current:
+        yield current
+
+
+def record_rows(current, result):
+    """Quantidade de linhas do resultado no span "sql" (quando ele tem tamanho)"""
+    if current is not None and hasattr(result, "__len__"):
+        current.set_attribute("rows", len(result))
+    return result
+
+
+# ----------------------------------------------------------------------
+# Painel
+# ----------------------------------------------------------------------
+
+def is_admin(username):
+    return bool(username) and username.upper() in TRACE_ADMINS
+
+
+def show_trace_panel(username):
+    """Percentis de latência por etapa na sidebar (apenas administradores)"""
+    if not TRACING_ENABLED or not is_admin(username):
+        return
+
+    with st.expander("⏱️ Latência por etapa", expanded=False):
+        stats = _tracer.get_stage_stats()
+        if not stats:
+            st.caption("Nenhuma requisição rastreada ainda.")
+            return
+        rows = [
+            {
+                "Etapa": name,
+                "N": values["count"],
+                "p50 (ms)": round(values["p50_ms"], 1),
+                "p95 (ms)": round(values["p95_ms"], 1),
+                "p99 (ms)": round(values["p99_ms"], 1),
+            }
+            for name, values in sorted(stats.items(), key=lambda item: -item[1]["p95_ms"])
+        ]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        if _tracer.path:
+            dropped = f" ({_tracer.dropped} descartados)" if _tracer.dropped else ""
+            st.caption(f"Spans exportados em `{_tracer.path}`{dropped}.")
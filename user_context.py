@@ -0,0 +1,96 @@
+"""
+Contexto do usuário resolvido uma vez por sessão.
+
+No topo de cada rerun o `main()` chamava `get_name_user` e
+`process_pending_feedback`, então qualquer clique, slider ou checkbox gerava
+consultas ao warehouse cujo resultado quase nunca muda. Aqui o nome de
+exibição é resolvido uma vez por sessão (com cache compartilhado entre
+sessões) e o processamento de feedbacks só acontece na primeira execução da
+sessão e quando o conteúdo da lista de feedbacks pendentes escrita pelo
+`frontend_ui` (`st.session_state[FEEDBACK_PENDING_KEY]`) muda — em regime,
+nenhum rerun toca o backend.
+
+Contrato assumido com o `frontend_ui` (que não faz parte deste repositório):
+`show_feedback_input` acrescenta cada feedback enviado a
+`st.session_state[FEEDBACK_PENDING_KEY]` (lista ou dicionário) e
+`process_pending_feedback` grava e consome essas pendências. Se o
+`frontend_ui` implantado guardar os feedbacks em outra chave, ajuste
+`ANALY_FEEDBACK_PENDING_KEY`; se não os guardar no `st.session_state`, use
+`ANALY_FEEDBACK_FLUSH_ALWAYS=1` para processar a cada rerun, como antes.
+"""
+
+import hashlib
+import json
+import os
+
+import streamlit as st
+
+from backend_service import get_name_user, process_pending_feedback
+from connection_pool import call_with_session
+from shared_cache import TTLCache
+
+
+# TTL do nome de exibição no cache compartilhado (em segundos)
+USER_NAME_CACHE_TTL = int(os.getenv("ANALY_USER_NAME_CACHE_TTL", "86400"))
+
+_user_names = TTLCache(max_entries=10000, default_ttl=USER_NAME_CACHE_TTL)
+
+# Chave do `st.session_state` onde o `frontend_ui` acumula os feedbacks enviados
+# e ainda não processados (lista ou dicionário)
+FEEDBACK_PENDING_KEY = os.getenv("ANALY_FEEDBACK_PENDING_KEY", "pending_feedback")
+
+# Processa os feedbacks a cada rerun (comportamento anterior), para um
+# `frontend_ui` que não segue o contrato acima
+FEEDBACK_FLUSH_ALWAYS = os.getenv("ANALY_FEEDBACK_FLUSH_ALWAYS", "0") == "1"
+
+# Hash das pendências vistas no último processamento de feedback da sessão
+_FEEDBACK_FLUSHED_KEY = "_feedback_flushed_fingerprint"
+
+
+def get_display_name(session, username):
+    """Nome de exibição do usuário: sessão -> cache compartilhado -> backend"""
+    if st.session_state.get("username_first_for") == username:
+        return st.session_state.username_first
+
+    name = _user_names.get(username)
+    if name is None:
+        name = call_with_session(session, get_name_user, username)
+        if name:
+            _user_names.set(username, name)
+
+    st.session_state.username_first = name
+    st.session_state.username_first_for = username
+    return name
+
+
+def _pending_feedback_fingerprint():
+    """Hash do conteúdo das pendências (`""` sem pendências)"""
+    pending = st.session_state.get(FEEDBACK_PENDING_KEY)
+    if not pending:
+        return ""
+    payload = json.dumps(pending, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def flush_pending_feedback(session, username):
+    """
+    Processa os feedbacks pendentes apenas quando há algo novo.
+
+    Na primeira execução da sessão o processamento sempre acontece (pode haver
+    pendências de sessões anteriores); depois, só quando há pendências e o
+    conteúdo delas difere do visto no último processamento — comparar apenas
+    a quantidade ignoraria um feedback trocado por outro.
+    """
+    pending = _pending_feedback_fingerprint()
+    flushed = st.session_state.get(_FEEDBACK_FLUSHED_KEY)
+    if not FEEDBACK_FLUSH_ALWAYS and flushed is not None and (not pending or pending == flushed):
+        return False
+
+    call_with_session(session, process_pending_feedback, username)
+    # O processamento pode consumir a própria lista de pendências
+    st.session_state[_FEEDBACK_FLUSHED_KEY] = _pending_feedback_fingerprint()
+    return True
+
+
+def get_user_name_cache():
+    return _user_names